@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fun_ops_poc.settings")
 
 application = get_asgi_application()
+
+# Fail or requeue the jobs left behind by the previous run
+from poc_apis.jobs import recover_jobs_on_startup  # noqa: E402
+
+recover_jobs_on_startup()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,14 @@ INSTALLED_APPS = [
     'corsheaders',
 ]
 
+# Responses are rendered with orjson (see poc_apis/renderers.py)
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "poc_apis.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -52,6 +61,8 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # Picks the dataset (?dataset=...) the API request works on
+    "poc_apis.middleware.DatasetMiddleware",
 ]
 
 ROOT_URLCONF = "fun_ops_poc.urls"
@@ -126,3 +137,133 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# MongoDB connection
+# Each process creates its own client on first use. Pool sizes and timeouts
+# are passed straight to pymongo.MongoClient; MONGO_COMPRESSORS is a
+# comma-separated list in order of preference. zstd and snappy need the
+# zstandard and python-snappy packages (both in requirements.txt); zlib is
+# built in, so it is the fallback.
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "table_records")
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 20000))
+MONGO_SOCKET_TIMEOUT_MS = (
+    int(os.environ["MONGO_SOCKET_TIMEOUT_MS"])
+    if os.environ.get("MONGO_SOCKET_TIMEOUT_MS")
+    else None
+)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 30000)
+)
+MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+# Read preference for the GET and export endpoints, e.g. "secondaryPreferred"
+MONGO_READ_PREFERENCE = os.environ.get("MONGO_READ_PREFERENCE", "primary")
+# Create indexes when the app starts; otherwise run `manage.py ensure_indexes`
+MONGO_ENSURE_INDEXES_ON_STARTUP = os.environ.get(
+    "MONGO_ENSURE_INDEXES_ON_STARTUP", ""
+).lower() in ("1", "true")
+
+# MongoDB data pipeline
+# Rows read from an uploaded file per chunk before it is sanitized and inserted.
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 50000))
+# Previous tables kept after an upload for rollback (0 drops them on swap).
+# Each kept version is a server-side copy of the whole live table made during
+# the upload, so it costs a full read and write of `records`; off by default.
+UPLOAD_KEEP_VERSIONS = int(os.environ.get("UPLOAD_KEEP_VERSIONS", 0))
+# Default and maximum page size for /api/data/.
+DATA_PAGE_SIZE = int(os.environ.get("DATA_PAGE_SIZE", 500))
+DATA_MAX_PAGE_SIZE = int(os.environ.get("DATA_MAX_PAGE_SIZE", 5000))
+# Documents fetched per cursor batch when streaming /api/data/?stream=...
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", 2000))
+# Operations per bulk_write call, and values per $in list in bulk updates.
+BULK_WRITE_BATCH_SIZE = int(os.environ.get("BULK_WRITE_BATCH_SIZE", 1000))
+BULK_IN_CHUNK_SIZE = int(os.environ.get("BULK_IN_CHUNK_SIZE", 1000))
+# Largest batch of edits accepted by /api/records/bulk/.
+BULK_EDIT_MAX_ROWS = int(os.environ.get("BULK_EDIT_MAX_ROWS", 5000))
+# Seconds a process uses its cached column registry before checking the
+# schema version in MongoDB again.
+COLUMN_SCHEMA_TTL = float(os.environ.get("COLUMN_SCHEMA_TTL", 5))
+# Values accepted by one `in`/`nin` condition in /api/data/?filter=...
+FILTER_MAX_VALUES = int(os.environ.get("FILTER_MAX_VALUES", 1000))
+# A column gets an index once a process has seen FILTER_INDEX_THRESHOLD
+# filters on it (0 disables this); at most FILTER_INDEX_MAX such indexes
+# are kept per table.
+FILTER_INDEX_THRESHOLD = int(os.environ.get("FILTER_INDEX_THRESHOLD", 50))
+FILTER_INDEX_MAX = int(os.environ.get("FILTER_INDEX_MAX", 8))
+# Records rewritten per batch when compacting renamed/added columns.
+COMPACTION_BATCH_SIZE = int(os.environ.get("COMPACTION_BATCH_SIZE", 5000))
+
+# /api/data/ response cache
+# Rendered pages are cached per process (LocMemCache evicts the least
+# recently used entries past MAX_ENTRIES), keyed by the data version, which
+# each process re-reads from MongoDB at most every DATA_VERSION_TTL seconds.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "poc-apis",
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("DATA_CACHE_MAX_ENTRIES", 500))},
+    }
+}
+DATA_CACHE_TIMEOUT = int(os.environ.get("DATA_CACHE_TIMEOUT", 300))
+DATA_VERSION_TTL = float(os.environ.get("DATA_VERSION_TTL", 1))
+
+# Change feed (/api/data/changes/)
+# Changes are kept for CHANGES_RETENTION_SECONDS (a TTL index created by
+# `manage.py ensure_indexes`) and returned CHANGES_PAGE_SIZE at a time. A
+# change touching more than CHANGE_MAX_IDS records is logged as a reset. A
+# missing sequence number older than CHANGE_GAP_GRACE seconds is skipped.
+CHANGES_RETENTION_SECONDS = int(os.environ.get("CHANGES_RETENTION_SECONDS", 86400))
+CHANGES_PAGE_SIZE = int(os.environ.get("CHANGES_PAGE_SIZE", 500))
+CHANGE_MAX_IDS = int(os.environ.get("CHANGE_MAX_IDS", 10000))
+CHANGE_GAP_GRACE = float(os.environ.get("CHANGE_GAP_GRACE", 5))
+
+# Live updates (/api/data/events/, served over ASGI)
+# Each process polls the change feed every LIVE_POLL_INTERVAL seconds while
+# clients are connected and fans the changes out to them. A client more than
+# LIVE_QUEUE_SIZE batches behind gets a reset; streams send a heartbeat every
+# LIVE_HEARTBEAT_SECONDS and are closed after LIVE_MAX_CONNECTION_SECONDS
+# (the browser reconnects and resumes).
+LIVE_POLL_INTERVAL = float(os.environ.get("LIVE_POLL_INTERVAL", 0.25))
+LIVE_QUEUE_SIZE = int(os.environ.get("LIVE_QUEUE_SIZE", 100))
+LIVE_HEARTBEAT_SECONDS = float(os.environ.get("LIVE_HEARTBEAT_SECONDS", 15))
+LIVE_MAX_CONNECTION_SECONDS = float(os.environ.get("LIVE_MAX_CONNECTION_SECONDS", 300))
+
+# /api/aggregate/
+# Groups returned per summary, columns it can group by, and pivot values
+# kept. Summaries are cached per process under the data version, so the
+# timeout only bounds how long unused ones are kept.
+AGGREGATE_MAX_GROUPS = int(os.environ.get("AGGREGATE_MAX_GROUPS", 1000))
+AGGREGATE_MAX_GROUP_COLUMNS = int(os.environ.get("AGGREGATE_MAX_GROUP_COLUMNS", 3))
+AGGREGATE_MAX_PIVOT_VALUES = int(os.environ.get("AGGREGATE_MAX_PIVOT_VALUES", 50))
+AGGREGATE_CACHE_TIMEOUT = int(os.environ.get("AGGREGATE_CACHE_TIMEOUT", 3600))
+
+# Columnar snapshots
+# Exports read a memory-mapped Arrow snapshot of each dataset, kept under
+# SNAPSHOT_DIR and updated from the change feed when at most
+# SNAPSHOT_MAX_CHANGED_ROWS rows changed (rebuilt from MongoDB otherwise).
+SNAPSHOTS_ENABLED = os.environ.get("SNAPSHOTS_ENABLED", "true").lower() in (
+    "1",
+    "true",
+)
+SNAPSHOT_DIR = Path(os.environ.get("SNAPSHOT_DIR", BASE_DIR / "snapshots"))
+SNAPSHOT_MAX_CHANGED_ROWS = int(os.environ.get("SNAPSHOT_MAX_CHANGED_ROWS", 50000))
+
+# Background jobs
+# Worker processes for upload/export jobs, and where their input files and
+# export artifacts are kept (for JOB_RETENTION_HOURS after they finish).
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_STORAGE_DIR = Path(os.environ.get("JOB_STORAGE_DIR", BASE_DIR / "job_files"))
+JOB_RETENTION_HOURS = int(os.environ.get("JOB_RETENTION_HOURS", 24))
+# Running jobs refresh their updated_at every JOB_HEARTBEAT_SECONDS. When the
+# server starts, running jobs silent for JOB_STALE_SECONDS are marked as
+# failed and queued jobs are queued again (JOB_RECOVER_ON_STARTUP).
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", 30))
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", 300))
+JOB_RECOVER_ON_STARTUP = os.environ.get("JOB_RECOVER_ON_STARTUP", "true").lower() in (
+    "1",
+    "true",
+)
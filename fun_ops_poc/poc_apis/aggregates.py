@@ -0,0 +1,246 @@
+from datetime import datetime
+
+from django.conf import settings
+
+from .filters import record_filter
+from .models import table_data_reads
+from .schema import LAYOUT_FIELD, columns_by_name
+from .services import LIVE_RECORDS_FILTER, parse_sort
+
+# Summaries for charts and dashboards, computed by MongoDB: /api/aggregate/
+# groups the live records (soft-deleted ones left out, as in exports) by up
+# to AGGREGATE_MAX_GROUP_COLUMNS columns, optionally pivots a column's values
+# into columns, and computes metrics written as "<op>:<column>" (or just
+# "count", the number of records) for each group.
+METRIC_ACCUMULATORS = {
+    "count": "$sum",
+    "sum": "$sum",
+    "avg": "$avg",
+    "min": "$min",
+    "max": "$max",
+}
+
+
+def aggregate_column(name, columns):
+    """
+    The registry entry of a column to group or aggregate on, raising
+    ValueError for unknown and deleted columns.
+    """
+    column = columns.get(name)
+    if column is None or column["is_deleted"] or column["deleted_by_admin"]:
+        raise ValueError(f"Unknown column '{name}'")
+    if "." in column["field"] or column["field"].startswith("$"):
+        raise ValueError(
+            f"Column '{name}' can't be aggregated: its name contains '.' or '$'"
+        )
+    return column
+
+
+def _stored_value(field, default):
+    # A record without the field reads as the column's default
+    return {
+        "$cond": [{"$eq": [{"$type": f"${field}"}, "missing"]}, default, f"${field}"]
+    }
+
+
+def column_value(column):
+    """
+    Expression reading a column's value the way schema.read_record does, in
+    either record layout while a compaction moves it.
+    """
+    value = _stored_value(column["field"], column["default"])
+    layout = column.get("compacted_layout")
+    if not layout:
+        return value
+    moved = _stored_value(column["compacted_field"], column["default"])
+    return {"$cond": [{"$eq": [f"${LAYOUT_FIELD}", layout]}, moved, value]}
+
+
+def metric_accumulator(metric, columns):
+    """
+    The $group accumulator of a metric such as "sum:Amount" or "count".
+    """
+    operator, _, name = metric.partition(":")
+    if operator not in METRIC_ACCUMULATORS:
+        raise ValueError(
+            f"Unknown metric '{metric}'; use one of {', '.join(METRIC_ACCUMULATORS)}"
+        )
+    if not name:
+        if operator != "count":
+            raise ValueError(
+                f"Metric '{operator}' needs a column, e.g. '{operator}:Amount'"
+            )
+        return {"$sum": 1}
+    value = column_value(aggregate_column(name, columns))
+    if operator == "count":
+        # Records with a value in the column
+        return {"$sum": {"$cond": [{"$ne": [value, None]}, 1, 0]}}
+    return {METRIC_ACCUMULATORS[operator]: value}
+
+
+def aggregate_plan(
+    group_by,
+    metrics,
+    pivot=None,
+    sort=None,
+    limit=None,
+    filter_text=None,
+    search=None,
+):
+    """
+    The aggregation pipeline for a summary, and what is needed to shape its
+    result. Column names are checked against the registry and `filter_text`
+    and `search` compiled as for /api/data/; raises ValueError on unknown
+    columns or metrics, bad sort keys and bad filters.
+    """
+    columns = columns_by_name()
+    if len(group_by) > settings.AGGREGATE_MAX_GROUP_COLUMNS:
+        raise ValueError(
+            f"Group by at most {settings.AGGREGATE_MAX_GROUP_COLUMNS} columns"
+        )
+    if pivot is not None and pivot in group_by:
+        raise ValueError("'pivot' can't also be a 'group_by' column")
+    if len(set(metrics)) != len(metrics):
+        raise ValueError("Each metric can be asked for only once")
+    limit = limit or settings.AGGREGATE_MAX_GROUPS
+
+    group_keys = {
+        f"g{index}": column_value(aggregate_column(name, columns))
+        for index, name in enumerate(group_by)
+    }
+    accumulators = {
+        f"m{index}": metric_accumulator(metric, columns)
+        for index, metric in enumerate(metrics)
+    }
+
+    # Sort by group columns or metrics, then by the group columns
+    sort_spec = {}
+    for name, direction in parse_sort(sort):
+        if name in group_by:
+            sort_spec[f"_id.g{group_by.index(name)}"] = direction
+        elif name in metrics and pivot is None:
+            sort_spec[f"m{metrics.index(name)}"] = direction
+        elif name != "_id":
+            raise ValueError(
+                f"Can't sort by '{name}': sort by a 'group_by' column"
+                + ("" if pivot is not None else " or a metric")
+            )
+    for key in group_keys:
+        sort_spec.setdefault(f"_id.{key}", 1)
+
+    where = record_filter(filter_text, search)
+    match = {"$and": [LIVE_RECORDS_FILTER, where]} if where else LIVE_RECORDS_FILTER
+    pipeline = [{"$match": match}]
+    if pivot is None:
+        pipeline.append({"$group": {"_id": group_keys or None, **accumulators}})
+    else:
+        pivot_value = column_value(aggregate_column(pivot, columns))
+        pipeline += [
+            {"$group": {"_id": {**group_keys, "p": pivot_value}, **accumulators}},
+            {
+                "$group": {
+                    "_id": {key: f"$_id.{key}" for key in group_keys} or None,
+                    "cells": {
+                        "$push": {
+                            "p": "$_id.p",
+                            **{key: f"${key}" for key in accumulators},
+                        }
+                    },
+                }
+            },
+        ]
+    if group_keys:
+        # One row past the limit tells whether the result was truncated
+        pipeline += [{"$sort": sort_spec}, {"$limit": limit + 1}]
+
+    return {
+        "pipeline": pipeline,
+        "group_by": group_by,
+        "pivot": pivot,
+        "metrics": metrics,
+        "limit": limit,
+    }
+
+
+def _value_order(value):
+    """
+    Sort key putting values of different types in MongoDB's order.
+    """
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (8, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (9, value)
+    return (3, str(value))
+
+
+def build_aggregate(plan, documents):
+    """
+    Turn the documents of an aggregation into the /api/aggregate/ response:
+    one row per group, holding the group values then the metrics. With a
+    pivot, each row holds one list of metrics per pivot value (in
+    `pivot_values` order) instead, or null where the group has no records.
+    """
+    group_count = len(plan["group_by"])
+    metric_keys = [f"m{index}" for index in range(len(plan["metrics"]))]
+    truncated = len(documents) > plan["limit"]
+    documents = documents[: plan["limit"]]
+
+    def group_values(document):
+        group = document["_id"] or {}
+        return [group.get(f"g{index}") for index in range(group_count)]
+
+    response = {
+        "group_by": plan["group_by"],
+        "metrics": plan["metrics"],
+        "pivot": plan["pivot"],
+    }
+    if plan["pivot"] is None:
+        response["columns"] = plan["group_by"] + plan["metrics"]
+        response["rows"] = [
+            group_values(document) + [document.get(key) for key in metric_keys]
+            for document in documents
+        ]
+        response["truncated"] = truncated
+        return response
+
+    pivot_values = sorted(
+        {
+            _value_order(cell.get("p")): cell.get("p")
+            for document in documents
+            for cell in document["cells"]
+        }.items()
+    )
+    if len(pivot_values) > settings.AGGREGATE_MAX_PIVOT_VALUES:
+        pivot_values = pivot_values[: settings.AGGREGATE_MAX_PIVOT_VALUES]
+        truncated = True
+    positions = {order: index for index, (order, _) in enumerate(pivot_values)}
+    rows = []
+    for document in documents:
+        cells = [None] * len(pivot_values)
+        for cell in document["cells"]:
+            index = positions.get(_value_order(cell.get("p")))
+            if index is not None:
+                cells[index] = [cell.get(key) for key in metric_keys]
+        rows.append(group_values(document) + cells)
+    response["pivot_values"] = [value for _, value in pivot_values]
+    response["rows"] = rows
+    response["truncated"] = truncated
+    return response
+
+
+def run_aggregate(plan, collection=table_data_reads):
+    """
+    Run an aggregate_plan in MongoDB and build the response. $group and
+    $sort may spill to disk on large tables.
+    """
+    try:
+        documents = list(collection.aggregate(plan["pipeline"], allowDiskUse=True))
+    except Exception as e:
+        raise ValueError(f"Error aggregating records in MongoDB: {str(e)}")
+    return build_aggregate(plan, documents)
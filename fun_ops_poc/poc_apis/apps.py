@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PocApisConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "poc_apis"
+
+    def ready(self):
+        if settings.MONGO_ENSURE_INDEXES_ON_STARTUP:
+            from .indexes import ensure_indexes
+
+            try:
+                ensure_indexes()
+            except Exception as e:
+                print(f"Error creating MongoDB indexes on startup: {str(e)}")
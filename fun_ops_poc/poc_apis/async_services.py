@@ -0,0 +1,220 @@
+import asyncio
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from pymongo import UpdateMany
+from pymongo.errors import BulkWriteError
+
+from .aggregates import aggregate_plan, build_aggregate
+from .exports import EXPORT_PROJECTION, rows_from_documents
+from .models import async_deleted_columns_reads, async_table_data_reads
+from .schema import column_registry, read_record
+from .services import (
+    COLUMN_FLAGS_PIPELINE,
+    LIVE_RECORDS_FILTER,
+    RECORD_FLAGS_PROJECTION,
+    RECORD_FLAGS_QUERY,
+    add_write_counts,
+    build_page,
+    bulk_update_results,
+    chunked,
+    clean_record,
+    column_flags_from_facets,
+    new_write_totals,
+    page_plan,
+    record_flags_from,
+    update_projection,
+)
+from .snapshots import export_source
+
+# Async versions of the read and approval services for the /api/async/
+# views. Queries go through the AsyncMongoClient, so a request waiting on
+# MongoDB (or on a slow client) doesn't hold a thread. The column registry
+# and the other cached, synchronous helpers run in a worker thread.
+
+
+def in_thread(function):
+    """
+    Wrap a blocking function so it can be awaited without blocking the loop.
+    """
+    return sync_to_async(function, thread_sensitive=False)
+
+
+async def fetch_records_page(
+    limit,
+    after=None,
+    fields=None,
+    sort=None,
+    include_total=False,
+    where=None,
+    collection=async_table_data_reads,
+):
+    plan = await in_thread(page_plan)(limit, after, fields, sort, where)
+    try:
+        cursor = (
+            collection.find(plan["query"], plan["projection"])
+            .sort(plan["sort_keys"])
+            .limit(limit + 1)
+        )
+        records = await cursor.to_list()
+        estimated_total = None
+        if include_total:
+            estimated_total = await (
+                collection.count_documents(where)
+                if where
+                else collection.estimated_document_count()
+            )
+    except Exception as e:
+        raise ValueError(f"Error fetching records from MongoDB: {str(e)}")
+    return build_page(plan, records, limit, include_total, estimated_total)
+
+
+async def fetch_column_flags(collection=async_deleted_columns_reads):
+    try:
+        cursor = await collection.aggregate(COLUMN_FLAGS_PIPELINE)
+        facets = await anext(cursor, {})
+    except Exception as e:
+        raise ValueError(f"Error fetching deleted columns from MongoDB: {str(e)}")
+    return column_flags_from_facets(facets)
+
+
+async def fetch_record_flags(collection=async_table_data_reads):
+    try:
+        cursor = collection.find(RECORD_FLAGS_QUERY, RECORD_FLAGS_PROJECTION)
+        return record_flags_from(await cursor.to_list())
+    except Exception as e:
+        raise ValueError(f"Error fetching flagged records from MongoDB: {str(e)}")
+
+
+async def fetch_data_view(
+    page_params,
+    records=async_table_data_reads,
+    columns=async_deleted_columns_reads,
+):
+    """
+    Build the /api/data/ response, running the three queries concurrently
+    on the event loop.
+    """
+    registry, page, column_flags, record_flags = await asyncio.gather(
+        in_thread(column_registry)(),
+        fetch_records_page(collection=records, **page_params),
+        fetch_column_flags(columns),
+        fetch_record_flags(records),
+    )
+    return {"columns": registry, **page, **column_flags, **record_flags}
+
+
+async def iter_records(
+    fields=None, sort=None, where=None, collection=async_table_data_reads
+):
+    """
+    Yield every record as it comes off the async cursor (see services.iter_records).
+    """
+    plan = await in_thread(page_plan)(1, None, fields, sort, where)
+    cursor = (
+        collection.find(plan["query"], plan["projection"])
+        .sort(plan["sort_keys"])
+        .batch_size(settings.STREAM_BATCH_SIZE)
+    )
+    if len(plan["sort_keys"]) > 1:
+        cursor = cursor.allow_disk_use(True)
+    async for record in cursor:
+        yield clean_record(read_record(record, plan["selected"]))
+
+
+async def run_bulk_writes(collection, operations, batch_size=None):
+    """
+    Async version of services.run_bulk_writes.
+    """
+    batch_size = batch_size or settings.BULK_WRITE_BATCH_SIZE
+    totals = new_write_totals()
+    for batch_number, batch in enumerate(chunked(operations, batch_size)):
+        try:
+            result = await collection.bulk_write(batch, ordered=False)
+            counts = result.bulk_api_result
+        except BulkWriteError as e:
+            counts = e.details
+        except Exception as e:
+            raise ValueError(f"Error running bulk write in MongoDB: {str(e)}")
+        add_write_counts(totals, counts, batch_number * batch_size)
+    return totals
+
+
+async def bulk_update_by_key(collection, key, values, update, chunk_size=None):
+    """
+    Async version of services.bulk_update_by_key.
+    """
+    chunks = chunked(dict.fromkeys(values), chunk_size or settings.BULK_IN_CHUNK_SIZE)
+    projection = update_projection(key, update)
+
+    current = {}
+    try:
+        for chunk in chunks:
+            cursor = collection.find({key: {"$in": chunk}}, projection)
+            async for document in cursor:
+                current[document[key]] = document
+    except Exception as e:
+        raise ValueError(f"Error reading documents to update in MongoDB: {str(e)}")
+
+    operations = [UpdateMany({key: {"$in": chunk}}, update) for chunk in chunks]
+    totals = await run_bulk_writes(collection, operations)
+    return totals, bulk_update_results(chunks, current, update, totals)
+
+
+def export_row_reader(collection=async_table_data_reads):
+    """
+    A `read_rows` source for exports.write_*_export that reads the live
+    records through the async client. The export itself is CPU-bound and
+    runs in a worker thread (see write_export); each batch of documents is
+    fetched back on the event loop with async_to_sync.
+    """
+
+    async def open_cursor():
+        # The async client belongs to the event loop, so resolve it there
+        return collection.find(LIVE_RECORDS_FILTER, EXPORT_PROJECTION).batch_size(
+            settings.STREAM_BATCH_SIZE
+        )
+
+    def read_rows(columns):
+        cursor = async_to_sync(open_cursor)()
+        fetch_batch = async_to_sync(cursor.to_list)
+
+        def documents():
+            while True:
+                batch = fetch_batch(settings.STREAM_BATCH_SIZE)
+                if not batch:
+                    return
+                yield from batch
+
+        return rows_from_documents(documents(), columns)
+
+    return read_rows
+
+
+async def run_aggregate(plan, collection=async_table_data_reads):
+    """
+    Async version of aggregates.run_aggregate.
+    """
+    try:
+        cursor = await collection.aggregate(plan["pipeline"], allowDiskUse=True)
+        documents = await cursor.to_list()
+    except Exception as e:
+        raise ValueError(f"Error aggregating records in MongoDB: {str(e)}")
+    return build_aggregate(plan, documents)
+
+
+async def write_export(write, out, collection=async_table_data_reads, chart=None):
+    """
+    Run an export writer (exports.write_excel_export or write_pdf_export)
+    into `out` in a worker thread, reading its rows from the snapshot, or
+    through the async client when there is none. `chart` holds the
+    aggregate_plan arguments of the summary to chart (Excel only).
+    """
+    options = {}
+    if chart is not None:
+        plan = await in_thread(aggregate_plan)(**chart)
+        options["chart"] = await run_aggregate(plan, collection)
+    source = await in_thread(export_source)()
+    if not source:
+        source = {"read_rows": export_row_reader(collection)}
+    return await in_thread(write)(out, **options, **source)
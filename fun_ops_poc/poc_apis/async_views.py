@@ -0,0 +1,282 @@
+import json
+import tempfile
+
+from bson import ObjectId
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from .async_services import (
+    bulk_update_by_key,
+    fetch_data_view,
+    in_thread,
+    iter_records,
+    write_export,
+)
+from .caching import data_etag, data_version, etag_matches, query_fingerprint
+from .exports import XLSX_CONTENT_TYPE, write_excel_export, write_pdf_export
+from .models import async_deleted_columns, async_table_data, current_dataset
+from .renderers import dumps
+from .views import (
+    column_update_summary,
+    parse_chart_params,
+    parse_page_params,
+    parse_query_params,
+    record_update_summary,
+)
+
+# ASGI-native versions of the data, export and approval endpoints, mounted
+# under /api/async/. They answer exactly like their synchronous
+# counterparts, but wait on MongoDB without holding a thread, so one
+# process under an ASGI server serves many concurrent slow clients.
+
+FILE_BLOCK_SIZE = 64 * 1024
+
+
+async def astream_records(records, stream_format):
+    """
+    Async version of views.stream_records.
+    """
+    separator = b"\n" if stream_format == "ndjson" else b","
+    batch = []
+    first = True
+    if stream_format == "json":
+        yield b"["
+    try:
+        async for record in records:
+            batch.append(dumps(record))
+            if len(batch) >= settings.STREAM_BATCH_SIZE:
+                yield (b"" if first else separator) + separator.join(batch)
+                batch, first = [], False
+        if batch:
+            yield (b"" if first else separator) + separator.join(batch)
+    except Exception as e:
+        print(f"Error streaming records from MongoDB: {str(e)}")
+        raise
+    if stream_format == "ndjson":
+        yield b"\n"
+    else:
+        yield b"]"
+
+
+async def aiter_file(spool):
+    """
+    Yield a spooled file in blocks, closing (and so deleting) it at the end.
+    """
+    read = in_thread(spool.read)
+    try:
+        while block := await read(FILE_BLOCK_SIZE):
+            yield block
+    finally:
+        spool.close()
+
+
+class AsyncExcelDataView(View):
+    """
+    Async version of /api/data/ (same parameters, caching and ETags).
+    http://localhost:8000/api/async/data/?limit=100
+    """
+
+    async def get(self, request, *args, **kwargs):
+        stream_format = request.GET.get("stream")
+        if stream_format:
+            return await self.stream(request, stream_format)
+
+        # Read the version first: a new one makes the filter use a fresh registry
+        try:
+            version = await in_thread(data_version)()
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=500)
+        try:
+            # Compiling a filter reads the column registry
+            page_params = await in_thread(parse_page_params)(request.GET)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        fingerprint = query_fingerprint(request.GET)
+        etag = data_etag(version, fingerprint)
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return HttpResponse(status=304, headers={"ETag": etag})
+
+        cache_key = f"data:{current_dataset()}:{version}:{fingerprint}"
+        content = await cache.aget(cache_key)
+        if content is None:
+            try:
+                response_data = await fetch_data_view(page_params)
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=500)
+            content = dumps(response_data)
+            await cache.aset(cache_key, content, settings.DATA_CACHE_TIMEOUT)
+
+        return HttpResponse(
+            content, content_type="application/json", headers={"ETag": etag}
+        )
+
+    async def stream(self, request, stream_format):
+        if stream_format not in ("ndjson", "json"):
+            return JsonResponse(
+                {"error": "'stream' must be 'ndjson' or 'json'"}, status=400
+            )
+        try:
+            query_params = await in_thread(parse_query_params)(request.GET)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return StreamingHttpResponse(
+            astream_records(iter_records(**query_params), stream_format),
+            content_type=(
+                "application/x-ndjson"
+                if stream_format == "ndjson"
+                else "application/json"
+            ),
+        )
+
+
+class AsyncExportView(View):
+    """
+    Async version of the export endpoints: the records are read through the
+    async client and the file is written in a worker thread.
+    """
+
+    write = None
+    file_name = None
+    content_type = None
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            options = await in_thread(self.export_options)(request.GET)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        spool = tempfile.TemporaryFile()
+        try:
+            await write_export(self.write, spool, **options)
+            await in_thread(spool.seek)(0)
+        except ValueError as e:
+            spool.close()
+            return JsonResponse({"error": str(e)}, status=500)
+
+        response = StreamingHttpResponse(
+            aiter_file(spool), content_type=self.content_type
+        )
+        response["Content-Disposition"] = f'attachment; filename="{self.file_name}"'
+        return response
+
+    def export_options(self, query_params):
+        return {}
+
+
+class AsyncExcelExportView(AsyncExportView):
+    """
+    http://localhost:8000/api/async/export/excel/
+    """
+
+    write = staticmethod(write_excel_export)
+    file_name = "data.xlsx"
+    content_type = XLSX_CONTENT_TYPE
+
+    def export_options(self, query_params):
+        # ?chart=bar adds a chart sheet, as in the synchronous view
+        return {"chart": parse_chart_params(query_params)}
+
+
+class AsyncPdfExportView(AsyncExportView):
+    """
+    http://localhost:8000/api/async/export/pdf/
+    """
+
+    write = staticmethod(write_pdf_export)
+    file_name = "table_data.pdf"
+    content_type = "application/pdf"
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncApprovalView(View):
+    """
+    Async version of the approval endpoints: applies `update` to the columns
+    or records listed in the JSON body under `key`. Like the DRF views it
+    mirrors, it takes POSTs without a CSRF token.
+    """
+
+    key = None
+    update = None
+    empty_message = None
+    missing_message = None
+    success_message = None
+    error_message = None
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"error": "Request body must be JSON"}, status=400)
+        values = data.get(self.key, []) if isinstance(data, dict) else None
+        if not values or not isinstance(values, list):
+            return JsonResponse({"error": self.empty_message}, status=400)
+
+        try:
+            summary = await self.apply(values)
+        except Exception as e:
+            return JsonResponse(
+                {"error": f"{self.error_message} in MongoDB: {str(e)}"}, status=500
+            )
+
+        if summary["matched_count"] == 0:
+            return JsonResponse({"error": self.missing_message}, status=404)
+        return JsonResponse(
+            {
+                "message": self.success_message.format(summary["matched_count"]),
+                **summary,
+            }
+        )
+
+
+class AsyncColumnApprovalView(AsyncApprovalView):
+    key = "column_names"
+    empty_message = "No column names provided"
+    missing_message = "No matching columns found"
+
+    async def apply(self, column_names):
+        totals, results = await bulk_update_by_key(
+            async_deleted_columns, "column_name", column_names, self.update
+        )
+        return await in_thread(column_update_summary)(totals, results)
+
+
+class AsyncRecordApprovalView(AsyncApprovalView):
+    key = "record_ids"
+    empty_message = "No record IDs provided"
+    missing_message = "No matching records found"
+
+    async def apply(self, record_ids):
+        object_ids = [ObjectId(record_id) for record_id in record_ids]
+        totals, results = await bulk_update_by_key(
+            async_table_data, "_id", object_ids, self.update
+        )
+        return await in_thread(record_update_summary)(totals, results)
+
+
+class AsyncColDeletionApprovedView(AsyncColumnApprovalView):
+    update = {"$set": {"deleted_by_admin": True}}
+    success_message = "{} column(s) marked as deleted successfully"
+    error_message = "Error marking columns as deleted"
+
+
+class AsyncColDeletionRejectedView(AsyncColumnApprovalView):
+    update = {"$unset": {"is_deleted": ""}, "$set": {"deleted_by_admin": False}}
+    success_message = "{} column(s) updated successfully"
+    error_message = "Error updating columns"
+
+
+class AsyncRecordDeletionApproved(AsyncRecordApprovalView):
+    update = {"$set": {"deleted_by_admin": True}}
+    success_message = "{} record(s) marked as deleted by admin successfully"
+    error_message = "Error marking records as deleted by admin"
+
+
+class AsyncRecordDeletionDisapproved(AsyncRecordApprovalView):
+    update = {"$unset": {"is_deleted": ""}, "$set": {"deleted_by_admin": False}}
+    success_message = "{} record(s) updated successfully"
+    error_message = "Error updating records"
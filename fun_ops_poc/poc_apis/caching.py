@@ -0,0 +1,100 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from pymongo import ReturnDocument
+
+from .models import current_dataset, meta, scoped_name
+from .schema import invalidate_schema_cache
+
+# The data version lives in the `meta` collection and is advanced after every
+# change to the records or columns, to the sequence number of the change's
+# entry in the change feed (see changes.log_change). Cached /api/data/
+# responses and their ETags are keyed by it, so a bump makes them all stale
+# at once. Each dataset has its own version document (see
+# models.scoped_name).
+#
+# Every schema change moves the data version too, after the schema version.
+# A process seeing the data version move therefore re-checks its cached
+# column registry at once (instead of after COLUMN_SCHEMA_TTL), so it never
+# caches a response shaped by the old registry under the new version.
+DATA_VERSION_ID = "data"
+
+# dataset -> {"version": ..., "checked_at": ...}
+_version_cache = {}
+_version_lock = threading.Lock()
+
+
+def _remember_version(dataset_id, version):
+    with _version_lock:
+        previous = _version_cache.get(dataset_id)
+        _version_cache[dataset_id] = {
+            "version": version,
+            "checked_at": time.monotonic(),
+        }
+    if previous and previous["version"] != version:
+        invalidate_schema_cache()
+
+
+def data_version(fresh=False):
+    """
+    The current dataset's data version. This process re-reads it from
+    MongoDB at most every DATA_VERSION_TTL seconds, or every time with
+    `fresh`; its own bumps are seen at once.
+    """
+    dataset_id = current_dataset()
+    with _version_lock:
+        cached = _version_cache.get(dataset_id)
+    if cached and not fresh:
+        if time.monotonic() - cached["checked_at"] < settings.DATA_VERSION_TTL:
+            return cached["version"]
+    try:
+        document = meta.find_one({"_id": scoped_name(DATA_VERSION_ID)})
+    except Exception as e:
+        raise ValueError(f"Error reading data version from MongoDB: {str(e)}")
+    version = document["version"] if document else 0
+    _remember_version(dataset_id, version)
+    return version
+
+
+def advance_data_version(version):
+    """
+    Raise the data version to `version` (never lower it), invalidating every
+    cached data response.
+    """
+    try:
+        document = meta.find_one_and_update(
+            {"_id": scoped_name(DATA_VERSION_ID)},
+            {"$max": {"version": version}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except Exception as e:
+        raise ValueError(f"Error updating data version in MongoDB: {str(e)}")
+    _remember_version(current_dataset(), document["version"])
+    return document["version"]
+
+
+def query_fingerprint(query_params):
+    """
+    Stable hash of a request's query parameters, independent of their order.
+    """
+    items = sorted(
+        (key, value) for key in query_params for value in query_params.getlist(key)
+    )
+    return hashlib.sha1(repr(items).encode()).hexdigest()[:16]
+
+
+def data_etag(version, fingerprint):
+    return f'"{version}-{fingerprint}"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header value matches `etag` (weak comparison).
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo.errors import DuplicateKeyError
+
+from .caching import advance_data_version, data_version
+from .models import changes, table_data
+from .schema import column_registry, read_record, schema_columns
+from .services import chunked, clean_record
+
+# Change kinds: "records" (rows created, edited or flagged; carries their
+# IDs), "schema" (columns added, renamed or flagged; carries a description
+# of each change) and "reset" (the whole table was replaced).
+RESET = "reset"
+
+
+def _next_seq():
+    """
+    The sequence number after the last change logged.
+    """
+    last = changes.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return max(last["_id"] if last else 0, data_version(fresh=True)) + 1
+
+
+def log_change(kind, record_ids=None, columns=None):
+    """
+    Append a change to the feed under the next sequence number, then
+    advance the data version to it, which invalidates cached data
+    responses. The entry is written first, under a unique `_id`, so
+    sequence numbers are handed out once each and the feed never shows a
+    version without its change. A change touching more than CHANGE_MAX_IDS
+    records is logged as a reset to keep entries small.
+    """
+    record_ids = [ObjectId(record_id) for record_id in record_ids or []]
+    if kind != RESET and not record_ids and not columns:
+        return None
+    if len(record_ids) > settings.CHANGE_MAX_IDS:
+        kind, record_ids = RESET, []
+    entry = {"kind": kind, "at": datetime.now(timezone.utc)}
+    if record_ids:
+        entry["record_ids"] = record_ids
+    if columns:
+        entry["columns"] = columns
+    try:
+        while True:
+            seq = _next_seq()
+            try:
+                changes.insert_one({"_id": seq, **entry})
+                break
+            except DuplicateKeyError:
+                # Another process took this number first
+                continue
+    except Exception as e:
+        raise ValueError(f"Error logging change in MongoDB: {str(e)}")
+    advance_data_version(seq)
+    return seq
+
+
+def _contiguous(entries, since):
+    """
+    The leading entries whose sequence numbers follow `since` without gaps.
+    Entries are written before the data version reaches them, so there are
+    none normally; a gap left by an older version of log_change is skipped
+    once the entry after it is older than CHANGE_GAP_GRACE seconds.
+    """
+    grace = datetime.now(timezone.utc) - timedelta(seconds=settings.CHANGE_GAP_GRACE)
+    expected = since + 1
+    for index, entry in enumerate(entries):
+        at = entry["at"]
+        if at.tzinfo is None:
+            at = at.replace(tzinfo=timezone.utc)
+        if entry["_id"] != expected and at > grace:
+            return entries[:index]
+        expected = entry["_id"] + 1
+    return entries
+
+
+def _empty(since, seq, reset_required):
+    return {
+        "since": since,
+        "seq": seq,
+        "reset_required": reset_required,
+        "has_more": False,
+        "rows": [],
+    }
+
+
+def fetch_changes(since, collection=table_data):
+    """
+    Everything that changed after sequence number `since`: the current state
+    of the changed rows, the column changes with the current column list,
+    and the sequence number to pass as `since` next time. `reset_required`
+    means the client must reload the table, either because it was replaced
+    or because the changes since `since` are no longer kept. Rows are read
+    from the primary so they are never older than the changes listed.
+    """
+    current = data_version(fresh=True)
+    if since == current:
+        return _empty(since, since, reset_required=False)
+    try:
+        oldest = changes.find_one({}, {"_id": 1}, sort=[("_id", 1)])
+        entries = list(
+            changes.find({"_id": {"$gt": since, "$lte": current}})
+            .sort("_id", 1)
+            .limit(settings.CHANGES_PAGE_SIZE)
+        )
+    except Exception as e:
+        raise ValueError(f"Error reading changes from MongoDB: {str(e)}")
+
+    if since > current or not oldest or oldest["_id"] > since + 1:
+        return _empty(since, current, reset_required=True)
+    entries = _contiguous(entries, since)
+    seq = entries[-1]["_id"] if entries else since
+    if any(entry["kind"] == RESET for entry in entries):
+        return _empty(since, seq, reset_required=True)
+
+    record_ids = list(
+        dict.fromkeys(
+            record_id for entry in entries for record_id in entry.get("record_ids", [])
+        )
+    )
+    column_changes = [
+        {"seq": entry["_id"], **column}
+        for entry in entries
+        for column in entry.get("columns", [])
+    ]
+
+    columns = schema_columns()
+    rows = []
+    try:
+        for chunk in chunked(record_ids, settings.BULK_IN_CHUNK_SIZE):
+            for document in collection.find({"_id": {"$in": chunk}}):
+                rows.append(clean_record(read_record(document, columns)))
+    except Exception as e:
+        raise ValueError(f"Error reading changed records from MongoDB: {str(e)}")
+
+    result = {
+        "since": since,
+        "seq": seq,
+        "reset_required": False,
+        # Nothing new past `since` (e.g. a gap) means nothing more for now
+        "has_more": bool(entries) and seq < current,
+        "rows": rows,
+    }
+    if column_changes:
+        result["column_changes"] = column_changes
+        result["columns"] = column_registry()
+    return result
@@ -0,0 +1,125 @@
+import re
+from datetime import datetime, timezone
+
+from .caching import data_version
+from .indexes import ensure_dataset_indexes
+from .models import (
+    DEFAULT_DATASET,
+    current_dataset,
+    datasets,
+    table_data,
+    using_dataset,
+)
+
+# Dataset IDs become part of collection names (see models.scoped_name), so
+# they are limited to lowercase letters and digits joined by single - or _
+# ("__" separates the ID from the collection name).
+DATASET_ID_PATTERN = re.compile(r"^[a-z0-9]+(?:[-_][a-z0-9]+)*$")
+DATASET_ID_MAX_LENGTH = 48
+
+# Datasets this process has found in the catalog; datasets are never removed
+_known_datasets = {DEFAULT_DATASET}
+
+
+def validate_dataset_id(dataset_id):
+    if len(dataset_id) > DATASET_ID_MAX_LENGTH or not DATASET_ID_PATTERN.match(
+        dataset_id
+    ):
+        raise ValueError(
+            f"Invalid dataset '{dataset_id}': use up to {DATASET_ID_MAX_LENGTH} "
+            "lowercase letters and digits, separated by single '-' or '_'"
+        )
+    return dataset_id
+
+
+def dataset_exists(dataset_id):
+    if dataset_id in _known_datasets:
+        return True
+    try:
+        found = datasets.find_one({"_id": dataset_id}, {"_id": 1}) is not None
+    except Exception as e:
+        raise ValueError(f"Error reading dataset catalog from MongoDB: {str(e)}")
+    if found:
+        _known_datasets.add(dataset_id)
+    return found
+
+
+def register_dataset(file_name=None):
+    """
+    Record an upload to the current dataset in the catalog. The first upload
+    creates the dataset and its indexes.
+    """
+    dataset_id = current_dataset()
+    now = datetime.now(timezone.utc)
+    try:
+        result = datasets.update_one(
+            {"_id": dataset_id},
+            {
+                "$set": {"file_name": file_name, "uploaded_at": now},
+                "$setOnInsert": {"created_at": now},
+            },
+            upsert=True,
+        )
+    except Exception as e:
+        raise ValueError(f"Error updating dataset catalog in MongoDB: {str(e)}")
+    if result.upserted_id is not None:
+        ensure_dataset_indexes()
+    _known_datasets.add(dataset_id)
+
+
+def dataset_size():
+    """
+    Row count and sizes in bytes of the current dataset's records. The sizes
+    come from $collStats and are None where it isn't available.
+    """
+    try:
+        stats = next(table_data.aggregate([{"$collStats": {"storageStats": {}}}]), None)
+    except Exception:
+        # The collection doesn't exist yet, or the server can't report stats
+        stats = None
+    if stats:
+        storage = stats["storageStats"]
+        return {
+            "rows": storage.get("count", 0),
+            "size_bytes": storage.get("size", 0),
+            "storage_bytes": storage.get("storageSize", 0),
+            "index_bytes": storage.get("totalIndexSize", 0),
+        }
+    try:
+        rows = table_data.estimated_document_count()
+    except Exception as e:
+        raise ValueError(f"Error counting records in MongoDB: {str(e)}")
+    return {
+        "rows": rows,
+        "size_bytes": None,
+        "storage_bytes": None,
+        "index_bytes": None,
+    }
+
+
+def list_datasets():
+    """
+    The catalog: every dataset with its data version, row count and sizes.
+    The default dataset is always listed.
+    """
+    try:
+        entries = {entry["_id"]: entry for entry in datasets.find()}
+    except Exception as e:
+        raise ValueError(f"Error reading dataset catalog from MongoDB: {str(e)}")
+    entries.setdefault(DEFAULT_DATASET, {})
+
+    catalog = []
+    for dataset_id in sorted(entries, key=lambda name: (name != DEFAULT_DATASET, name)):
+        entry = entries[dataset_id]
+        with using_dataset(dataset_id):
+            catalog.append(
+                {
+                    "dataset": dataset_id,
+                    "version": data_version(),
+                    **dataset_size(),
+                    "file_name": entry.get("file_name"),
+                    "created_at": entry.get("created_at"),
+                    "uploaded_at": entry.get("uploaded_at"),
+                }
+            )
+    return catalog
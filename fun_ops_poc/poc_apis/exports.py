@@ -0,0 +1,503 @@
+import io
+import zlib
+from itertools import chain, islice
+
+from bson import ObjectId
+from django.conf import settings
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.chart import BarChart, Reference
+from openpyxl.utils import get_column_letter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import getFont, stringWidth
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import LongTable, TableStyle
+
+from .models import table_data_reads
+from .schema import columns_by_name, read_record
+from .services import LIVE_RECORDS_FILTER, fetch_export_columns
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# PDF page geometry (points). Rows are single-line with a fixed height, so the
+# number of rows that fit on a page is known before anything is laid out.
+PDF_PAGE_SIZE = landscape(A4)
+PDF_MARGIN = 0.5 * inch
+PDF_FONT = "Helvetica"
+PDF_HEADER_FONT = "Helvetica-Bold"
+PDF_FONT_SIZE = 7
+PDF_ROW_HEIGHT = 12
+PDF_CELL_PADDING = 3
+PDF_MIN_COLUMN_WIDTH = 0.5 * inch
+PDF_MAX_COLUMN_WIDTH = 2.5 * inch
+PDF_SAMPLE_ROWS = 200
+# Font encodings a PDF reader knows by name; fonts with any other encoding
+# (Symbol, ZapfDingbats) are written without one and use their built-in one.
+PDF_NAMED_ENCODINGS = ("WinAnsiEncoding", "MacRomanEncoding", "MacExpertEncoding")
+
+PDF_TABLE_STYLE = TableStyle(
+    [
+        ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("FONTNAME", (0, 0), (-1, 0), PDF_HEADER_FONT),
+        ("FONTNAME", (0, 1), (-1, -1), PDF_FONT),
+        ("FONTSIZE", (0, 0), (-1, -1), PDF_FONT_SIZE),
+        ("LEFTPADDING", (0, 0), (-1, -1), PDF_CELL_PADDING),
+        ("RIGHTPADDING", (0, 0), (-1, -1), PDF_CELL_PADDING),
+        ("TOPPADDING", (0, 0), (-1, -1), 1),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 1),
+        ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+    ]
+)
+
+
+EXPORT_PROJECTION = {"_id": 0}
+
+# Chart sheet of Excel exports: the summary table, with a native bar chart
+# (cm) next to it that grows with the number of groups up to a maximum.
+CHART_SHEET = "Chart"
+CHART_HEIGHT = 10
+CHART_MIN_WIDTH = 18
+CHART_MAX_WIDTH = 60
+CHART_WIDTH_PER_GROUP = 0.6
+
+
+def iter_export_rows(columns, collection=table_data_reads):
+    """
+    Yield the live (not soft-deleted) records as lists of values in `columns`
+    order, reading the cursor in STREAM_BATCH_SIZE batches. Values are read
+    through the column registry, so renamed and added columns are exported
+    under their current names.
+    """
+    # Column names may contain dots, which an inclusion projection would read as paths
+    cursor = collection.find(LIVE_RECORDS_FILTER, EXPORT_PROJECTION).batch_size(
+        settings.STREAM_BATCH_SIZE
+    )
+    return rows_from_documents(cursor, columns)
+
+
+def rows_from_documents(documents, columns):
+    """
+    Yield each record document as a list of values in `columns` order.
+    """
+    registry = columns_by_name()
+    selected = [registry[name] for name in columns]
+    for document in documents:
+        record = read_record(document, selected)
+        yield [record[column] for column in columns]
+
+
+def excel_value(value):
+    """
+    Convert a MongoDB value into something openpyxl can write to a cell.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub("", value)
+    if isinstance(value, (ObjectId, list, dict)):
+        return str(value)
+    return value
+
+
+def count_export_rows(collection=table_data_reads):
+    """
+    Number of live records, used as the progress total of export jobs.
+    """
+    return collection.count_documents(LIVE_RECORDS_FILTER)
+
+
+def export_total(collection, total_rows=None):
+    return count_export_rows(collection) if total_rows is None else total_rows
+
+
+def chart_table(summary):
+    """
+    The header and rows of the table a chart is drawn from: a category per
+    group (its values joined by " / "), then one column per series, i.e.
+    per metric, or per pivot value and metric with a pivot.
+    """
+    metrics = summary["metrics"]
+    group_count = len(summary["group_by"])
+    if summary["pivot"] is None:
+        series = metrics
+    else:
+        series = [
+            str(value) if len(metrics) == 1 else f"{metric} {value}"
+            for value in summary["pivot_values"]
+            for metric in metrics
+        ]
+
+    rows = []
+    for row in summary["rows"]:
+        groups, values = row[:group_count], row[group_count:]
+        category = " / ".join(str(value) for value in groups) if groups else "All"
+        if summary["pivot"] is not None:
+            values = [
+                cell[index] if cell is not None else None
+                for cell in values
+                for index in range(len(metrics))
+            ]
+        rows.append([category] + [excel_value(value) for value in values])
+    return [" / ".join(summary["group_by"]) or "Records"] + series, rows
+
+
+def write_chart_sheet(workbook, summary):
+    """
+    Add a sheet with an aggregates.run_aggregate summary and a native
+    clustered column chart of it. The chart only references the sheet's
+    cells; Excel draws it, so nothing is rendered here.
+    """
+    header, rows = chart_table(summary)
+    sheet = workbook.create_sheet(CHART_SHEET)
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    if not rows:
+        return
+
+    chart = BarChart()
+    chart.type = "col"
+    chart.grouping = "clustered"
+    title = ", ".join(summary["metrics"])
+    if summary["pivot"] is not None:
+        title += f" by {summary['pivot']}"
+    chart.title = title
+    chart.x_axis.title = header[0]
+    chart.height = CHART_HEIGHT
+    chart.width = min(
+        max(CHART_MIN_WIDTH, len(rows) * CHART_WIDTH_PER_GROUP), CHART_MAX_WIDTH
+    )
+    last_row = len(rows) + 1
+    chart.add_data(
+        Reference(sheet, min_col=2, max_col=len(header), min_row=1, max_row=last_row),
+        titles_from_data=True,
+    )
+    chart.set_categories(Reference(sheet, min_col=1, min_row=2, max_row=last_row))
+    sheet.add_chart(chart, f"{get_column_letter(len(header) + 2)}2")
+
+
+def write_excel_export(
+    out,
+    collection=table_data_reads,
+    progress=None,
+    read_rows=None,
+    total_rows=None,
+    chart=None,
+):
+    """
+    Write the live records to `out` as an .xlsx file with a write-only
+    workbook, which streams rows to disk instead of building the sheet in
+    memory. Soft-deleted columns and records are left out.
+    `progress`, if given, is called with (rows written, total rows) every
+    STREAM_BATCH_SIZE rows. `read_rows(columns)`, if given, replaces
+    iter_export_rows as the source of the rows, and `total_rows` the count
+    of live records in MongoDB as the progress total. `chart`, a summary
+    from aggregates.run_aggregate, adds a sheet with it and a bar chart.
+    Returns the number of rows written.
+    """
+    read_rows = read_rows or (lambda columns: iter_export_rows(columns, collection))
+    export_columns = fetch_export_columns()
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(export_columns)
+
+    rows = 0
+    try:
+        if chart is not None:
+            write_chart_sheet(workbook, chart)
+        total = export_total(collection, total_rows) if progress else None
+        for row in read_rows(export_columns):
+            sheet.append([excel_value(value) for value in row])
+            rows += 1
+            if progress and rows % settings.STREAM_BATCH_SIZE == 0:
+                progress(rows, total)
+        workbook.save(out)
+        if progress:
+            progress(rows, total)
+    except Exception as e:
+        raise ValueError(f"Error exporting records to Excel: {str(e)}")
+    return rows
+
+
+def pdf_text(value):
+    """
+    Render a MongoDB value as the text of a PDF cell.
+    """
+    return "" if value is None else str(value)
+
+
+def fit_text(text, width):
+    """
+    Truncate `text` with an ellipsis so it fits in a cell of `width` points.
+    """
+    available = width - 2 * PDF_CELL_PADDING
+    if stringWidth(text, PDF_FONT, PDF_FONT_SIZE) <= available:
+        return text
+    while text and stringWidth(text + "...", PDF_FONT, PDF_FONT_SIZE) > available:
+        # Cut proportionally first, then one character at a time
+        ratio = available / stringWidth(text + "...", PDF_FONT, PDF_FONT_SIZE)
+        text = text[: min(len(text) - 1, int(len(text) * ratio) + 1)]
+    return text + "..."
+
+
+def estimate_column_widths(columns, sample_rows):
+    """
+    Size each column from its header and a sample of rows rather than from
+    every cell, clamped between PDF_MIN_COLUMN_WIDTH and PDF_MAX_COLUMN_WIDTH.
+    """
+    usable_width = PDF_PAGE_SIZE[0] - 2 * PDF_MARGIN
+    widths = []
+    for index, column in enumerate(columns):
+        text_width = max(
+            [stringWidth(str(column), PDF_HEADER_FONT, PDF_FONT_SIZE)]
+            + [
+                stringWidth(pdf_text(row[index]), PDF_FONT, PDF_FONT_SIZE)
+                for row in sample_rows
+            ]
+        )
+        width = text_width + 2 * PDF_CELL_PADDING + 1
+        widths.append(
+            min(max(width, PDF_MIN_COLUMN_WIDTH), PDF_MAX_COLUMN_WIDTH, usable_width)
+        )
+    return widths
+
+
+def split_column_groups(widths):
+    """
+    Split column indexes into consecutive groups that each fit the page width.
+    """
+    usable_width = PDF_PAGE_SIZE[0] - 2 * PDF_MARGIN
+    groups, current, current_width = [], [], 0
+    for index, width in enumerate(widths):
+        if current and current_width + width > usable_width:
+            groups.append(current)
+            current, current_width = [], 0
+        current.append(index)
+        current_width += width
+    if current:
+        groups.append(current)
+    return groups
+
+
+class PdfPageCanvas(Canvas):
+    """
+    Canvas that hands each finished page's content stream to `on_page`
+    instead of keeping every page until the document is saved.
+
+    Canvas has no public hook for this, so it reads the page from Canvas
+    internals (_preamble, _code, _startPage and _doc.fontMapping). reportlab
+    is pinned in requirements.txt, and tests/test_exports.py checks them.
+    """
+
+    def __init__(self, page_size, on_page):
+        super().__init__(io.BytesIO(), pagesize=page_size)
+        self.on_page = on_page
+
+    def font_names(self):
+        # Resource names (F1, F2, ...) of the fonts used so far
+        return {name.lstrip("/"): font for font, name in self._doc.fontMapping.items()}
+
+    def showPage(self):
+        content = "\n".join([self._preamble, *self._code, " "]) + "\n"
+        self.on_page(content.encode("latin-1"))
+        self._startPage()
+
+
+def font_object(font):
+    """
+    The font dictionary of standard font `font`, with the encoding reportlab
+    encoded its text in.
+    """
+    face = getFont(font)
+    encoding = ""
+    if face.encName in PDF_NAMED_ENCODINGS:
+        encoding = f" /Encoding /{face.encName}"
+    return (
+        f"<< /Type /Font /Subtype /Type1 /BaseFont /{face.face.name}{encoding} >>"
+    ).encode()
+
+
+class StreamingPdf:
+    """
+    Writes a PDF to `out` one page at a time: each page's compressed content
+    stream and page object are written as soon as the page is finished, and
+    only their object numbers and offsets are kept for the cross-reference
+    table at the end. Draw on `canvas` and call its showPage() per page.
+    Only the standard fonts are used, so fonts are referenced, not embedded.
+    """
+
+    CATALOG = 1
+    PAGES = 2
+
+    def __init__(self, out, page_size):
+        self.out = out
+        self.page_size = page_size
+        self.position = 0
+        self.offsets = {}
+        self.next_number = 3
+        self.fonts = {}
+        self.page_numbers = []
+        self.canvas = PdfPageCanvas(page_size, self.add_page)
+        self._write(b"%PDF-1.4\n%\x93\x8c\x8b\x9e\n")
+        self._object(
+            self.CATALOG, f"<< /Type /Catalog /Pages {self.PAGES} 0 R >>".encode()
+        )
+
+    def _write(self, data):
+        self.out.write(data)
+        self.position += len(data)
+
+    def _object(self, number, body):
+        self.offsets[number] = self.position
+        self._write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    def _new_number(self):
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def _font_resources(self):
+        resources = []
+        for name, font in sorted(self.canvas.font_names().items()):
+            if font not in self.fonts:
+                self.fonts[font] = self._new_number()
+                self._object(self.fonts[font], font_object(font))
+            resources.append(f"/{name} {self.fonts[font]} 0 R")
+        return " ".join(resources)
+
+    def add_page(self, content):
+        fonts = self._font_resources()
+        stream = zlib.compress(content)
+        contents = self._new_number()
+        self._object(
+            contents,
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream)
+            + stream
+            + b"\nendstream",
+        )
+        page = self._new_number()
+        width, height = self.page_size
+        self._object(
+            page,
+            f"<< /Type /Page /Parent {self.PAGES} 0 R"
+            f" /MediaBox [0 0 {width:g} {height:g}]"
+            f" /Resources << /Font << {fonts} >> /ProcSet [/PDF /Text] >>"
+            f" /Contents {contents} 0 R >>".encode(),
+        )
+        self.page_numbers.append(page)
+
+    def close(self):
+        """
+        Write the page tree, cross-reference table and trailer.
+        """
+        kids = " ".join(f"{number} 0 R" for number in self.page_numbers)
+        self._object(
+            self.PAGES,
+            f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_numbers)} >>".encode(),
+        )
+        xref = self.position
+        size = self.next_number
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for number in range(1, size):
+            self._write(b"%010d 00000 n \n" % self.offsets[number])
+        self._write(
+            b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (size, self.CATALOG, xref)
+        )
+
+
+def write_pdf_export(
+    out, collection=table_data_reads, progress=None, read_rows=None, total_rows=None
+):
+    """
+    Write the live records to `out` as a PDF of fixed-size landscape pages.
+
+    Column widths are estimated from the first rows. Tables wider than a
+    page are split into column groups, and each page's worth of rows is
+    printed once per group before the next rows, so the rows are read once.
+    Every page is its own LongTable with a repeated header, drawn onto the
+    canvas and written to `out` as soon as it is finished (see
+    StreamingPdf), so memory use doesn't grow with the number of pages.
+    Every column group gets at least a header page, even with no rows.
+    `progress`, if given, is called with (rows rendered, total rows) after
+    each page; with several column groups every row is rendered once per group.
+    `read_rows(columns)`, if given, replaces iter_export_rows as the source
+    of the rows. `total_rows` replaces the count of live records in MongoDB.
+    Returns the number of rows written.
+    """
+    read_rows = read_rows or (lambda columns: iter_export_rows(columns, collection))
+    export_columns = fetch_export_columns()
+    records = iter(read_rows(export_columns))
+    sample = list(islice(records, PDF_SAMPLE_ROWS))
+    records = chain(sample, records)
+    widths = estimate_column_widths(export_columns, sample)
+    groups = split_column_groups(widths)
+
+    page_width, page_height = PDF_PAGE_SIZE
+    rows_per_page = int((page_height - 2 * PDF_MARGIN) // PDF_ROW_HEIGHT) - 1
+
+    pdf = StreamingPdf(out, PDF_PAGE_SIZE)
+    canvas = pdf.canvas
+    page_number = 0
+    rows = 0
+    rendered = 0
+    try:
+        total = export_total(collection, total_rows) * len(groups) if progress else None
+        if not groups:
+            canvas.setFont(PDF_FONT, PDF_FONT_SIZE)
+            canvas.drawString(
+                PDF_MARGIN, page_height - PDF_MARGIN, "No records to export"
+            )
+            canvas.showPage()
+        headers = [
+            [fit_text(str(export_columns[i]), widths[i]) for i in group]
+            for group in groups
+        ]
+        while groups:
+            block = list(islice(records, rows_per_page))
+            if not block and page_number:
+                break
+            for group_number, (group, header) in enumerate(
+                zip(groups, headers), start=1
+            ):
+                page_rows = [
+                    [fit_text(pdf_text(row[i]), widths[i]) for i in group]
+                    for row in block
+                ]
+                table = LongTable(
+                    [header] + page_rows,
+                    colWidths=[widths[i] for i in group],
+                    rowHeights=PDF_ROW_HEIGHT,
+                    repeatRows=1,
+                )
+                table.setStyle(PDF_TABLE_STYLE)
+                _, table_height = table.wrapOn(canvas, page_width, page_height)
+                table.drawOn(
+                    canvas, PDF_MARGIN, page_height - PDF_MARGIN - table_height
+                )
+
+                page_number += 1
+                canvas.setFont(PDF_FONT, PDF_FONT_SIZE)
+                canvas.drawRightString(
+                    page_width - PDF_MARGIN,
+                    PDF_MARGIN / 2,
+                    f"Page {page_number} - columns {group[0] + 1}-{group[-1] + 1}"
+                    f" of {len(export_columns)} (group {group_number}/{len(groups)})",
+                )
+                canvas.showPage()
+                rendered += len(page_rows)
+                if progress:
+                    progress(rendered, total)
+            rows += len(block)
+            if len(block) < rows_per_page:
+                break
+        pdf.close()
+    except Exception as e:
+        raise ValueError(f"Error exporting records to PDF: {str(e)}")
+    return rows
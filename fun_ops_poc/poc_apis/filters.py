@@ -0,0 +1,306 @@
+import contextvars
+import json
+import re
+import threading
+from datetime import datetime
+
+from bson import ObjectId
+from django.conf import settings
+
+from .indexes import ensure_filter_index
+from .models import RECORD_FLAG_FIELDS, current_dataset
+from .schema import LAYOUT_FIELD, columns_by_name
+from .services import parse_sort
+
+# The filter language of /api/data/: a JSON object mapping column names to
+# a value (equality) or to {operator: operand}, e.g.
+#   {"Amount": {"gte": 100, "lt": 500}, "City": {"in": ["Pune", "Delhi"]},
+#    "Name": {"contains": "ash"}, "or": [{"Status": "open"}, {"Urgent": true}]}
+# Conditions on several columns must all hold; "and"/"or" take lists of
+# such objects. Column names are checked against the registry and compiled
+# to the stored fields, so filters keep working across renames.
+COMPARISONS = {
+    "eq": "$eq",
+    "ne": "$ne",
+    "gt": "$gt",
+    "gte": "$gte",
+    "lt": "$lt",
+    "lte": "$lte",
+}
+LIST_OPERATORS = {"in": "$in", "nin": "$nin"}
+TEXT_OPERATORS = ("contains", "startswith")
+OPERATORS = (*COMPARISONS, *LIST_OPERATORS, *TEXT_OPERATORS, "exists")
+COMBINATORS = ("and", "or")
+
+# Matches no document, for a search with no text columns to look in
+MATCH_NOTHING = {"_id": {"$in": []}}
+
+
+def parse_filter(text):
+    """
+    Parse the `filter` query parameter (a JSON object).
+    """
+    try:
+        spec = json.loads(text)
+    except ValueError:
+        raise ValueError("'filter' must be a JSON object")
+    if not isinstance(spec, dict):
+        raise ValueError("'filter' must be a JSON object")
+    return spec
+
+
+def _pseudo_column(name):
+    # `_id` and the record flags can be filtered on like columns
+    return {"name": name, "field": name, "default": None, "dtype": None}
+
+
+def filter_column(name, columns):
+    """
+    The registry entry of a column named in a filter, raising ValueError for
+    unknown columns and names MongoDB would read as paths or operators.
+    """
+    if name == "_id" or name in RECORD_FLAG_FIELDS:
+        return _pseudo_column(name)
+    if name not in columns:
+        raise ValueError(f"Unknown column '{name}' in filter")
+    column = columns[name]
+    if "." in column["field"] or column["field"].startswith("$"):
+        raise ValueError(
+            f"Column '{name}' can't be filtered on: its name contains '.' or '$'"
+        )
+    return column
+
+
+def _operand(column, value):
+    """
+    Convert a JSON operand to the stored type: ObjectIds for `_id`, datetimes
+    (ISO 8601 strings) for datetime columns.
+    """
+    if column["name"] == "_id":
+        if not ObjectId.is_valid(value):
+            raise ValueError(f"Invalid record ID '{value}' in filter")
+        return ObjectId(value)
+    if column["dtype"] == "datetime" and isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(
+                f"Column '{column['name']}' holds dates; '{value}' is not an ISO 8601 date"
+            )
+    if isinstance(value, (dict, list)):
+        raise ValueError(f"Invalid value for column '{column['name']}' in filter")
+    return value
+
+
+def _matches(operator, operand, value):
+    """
+    Whether `value` satisfies one condition, evaluated in Python. Used to
+    decide whether records without the field, which read as the column's
+    default, match.
+    """
+    try:
+        if operator == "eq":
+            return value == operand
+        if operator == "ne":
+            return value != operand
+        if operator == "gt":
+            return value > operand
+        if operator == "gte":
+            return value >= operand
+        if operator == "lt":
+            return value < operand
+        if operator == "lte":
+            return value <= operand
+        if operator == "in":
+            return value in operand
+        if operator == "nin":
+            return value not in operand
+        if operator == "contains":
+            return isinstance(value, str) and operand.lower() in value.lower()
+        if operator == "startswith":
+            return isinstance(value, str) and value.startswith(operand)
+        if operator == "exists":
+            return (value is not None) == operand
+    except TypeError:
+        return False
+    return False
+
+
+def compile_condition(column, condition):
+    """
+    The MongoDB filter for one column's condition: a value, or an object of
+    operators.
+    """
+    if not isinstance(condition, dict):
+        condition = {"eq": condition}
+    if not condition:
+        raise ValueError(f"Empty condition for column '{column['name']}'")
+
+    mongo = {}
+    default_matches = column["default"] is not None
+    for operator, operand in condition.items():
+        if operator not in OPERATORS:
+            raise ValueError(
+                f"Unknown operator '{operator}' in filter; use one of {', '.join(OPERATORS)}"
+            )
+        if operator in COMPARISONS:
+            operand = _operand(column, operand)
+            mongo[COMPARISONS[operator]] = operand
+        elif operator in LIST_OPERATORS:
+            if not isinstance(operand, list):
+                raise ValueError(f"'{operator}' takes a list of values")
+            if len(operand) > settings.FILTER_MAX_VALUES:
+                raise ValueError(
+                    f"'{operator}' takes at most {settings.FILTER_MAX_VALUES} values"
+                )
+            operand = [_operand(column, value) for value in operand]
+            mongo[LIST_OPERATORS[operator]] = operand
+        elif operator in TEXT_OPERATORS:
+            if not isinstance(operand, str) or not operand:
+                raise ValueError(f"'{operator}' takes a non-empty string")
+            if "$regex" in mongo:
+                raise ValueError(
+                    "Use only one of 'contains' and 'startswith' per column"
+                )
+            if operator == "contains":
+                mongo.update({"$regex": re.escape(operand), "$options": "i"})
+            else:
+                # A case-sensitive prefix can use an index on the column
+                mongo["$regex"] = f"^{re.escape(operand)}"
+        else:
+            if not isinstance(operand, bool):
+                raise ValueError("'exists' takes true or false")
+            mongo["$ne" if operand else "$eq"] = None
+        default_matches = default_matches and _matches(
+            operator, operand, column["default"]
+        )
+
+    if column["default"] is None:
+        # Missing fields read as None, which is how MongoDB treats them too
+        return _column_query(column, mongo)
+    # Records without the field read as the default: they match if it does
+    query = _column_query(column, {"$exists": True, **mongo})
+    if default_matches:
+        query = {"$or": [query, _column_query(column, {"$exists": False})]}
+    return query
+
+
+def _column_query(column, mongo):
+    """
+    Apply a condition to a column's stored field. While a compaction moves
+    the column, records already moved are matched on the new field.
+    """
+    layout = column.get("compacted_layout")
+    if not layout:
+        return {column["field"]: mongo}
+    return {
+        "$or": [
+            {LAYOUT_FIELD: layout, column["compacted_field"]: mongo},
+            {LAYOUT_FIELD: {"$ne": layout}, column["field"]: mongo},
+        ]
+    }
+
+
+def compile_filter(spec, columns, filtered=None):
+    """
+    Compile a parsed filter to a MongoDB query. `filtered`, if given,
+    collects the registry entries of the columns it filters on.
+    """
+    clauses = []
+    for key, value in spec.items():
+        if key in COMBINATORS:
+            if not isinstance(value, list) or not all(
+                isinstance(part, dict) for part in value
+            ):
+                raise ValueError(f"'{key}' takes a list of filter objects")
+            parts = [compile_filter(part, columns, filtered) for part in value]
+            parts = [part for part in parts if part]
+            if parts:
+                clauses.append({f"${key}": parts})
+            continue
+        column = filter_column(key, columns)
+        if filtered is not None:
+            filtered.append(column)
+        clauses.append(compile_condition(column, value))
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def search_filter(text, columns):
+    """
+    Case-insensitive search for `text` in every text column that isn't
+    soft-deleted.
+    """
+    condition = {"$regex": re.escape(text), "$options": "i"}
+    clauses = [
+        _column_query(column, condition)
+        for column in columns.values()
+        if column["dtype"] in ("string", "mixed")
+        and not column["is_deleted"]
+        and not column["deleted_by_admin"]
+        and "." not in column["field"]
+    ]
+    if not clauses:
+        return MATCH_NOTHING
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def record_filter(filter_text=None, search=None):
+    """
+    The MongoDB query for the `filter` and `search` parameters of
+    /api/data/, or None when neither is given. Raises ValueError on an
+    invalid filter.
+    """
+    if not filter_text and not search:
+        return None
+    columns = columns_by_name()
+    filtered = []
+    clauses = []
+    if filter_text:
+        query = compile_filter(parse_filter(filter_text), columns, filtered)
+        if query:
+            clauses.append(query)
+    if search:
+        clauses.append(search_filter(search, columns))
+    note_filtered_columns(filtered)
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def check_sort(sort, columns=None):
+    """
+    Raise ValueError if the `sort` parameter names an unknown column.
+    """
+    columns = columns if columns is not None else columns_by_name()
+    for name, _ in parse_sort(sort):
+        if name != "_id" and name not in RECORD_FLAG_FIELDS and name not in columns:
+            raise ValueError(f"Unknown column '{name}' in sort")
+
+
+# Columns clients filter on often get an index: every FILTER_INDEX_THRESHOLD
+# filters on a column in this process, ensure_filter_index is run for it in
+# the background (a no-op once the index exists).
+_filter_counts = {}
+_filter_counts_lock = threading.Lock()
+
+
+def note_filtered_columns(columns):
+    if not settings.FILTER_INDEX_THRESHOLD:
+        return
+    due = []
+    with _filter_counts_lock:
+        for column in columns:
+            if column["name"] == "_id" or column.get("compacted_layout"):
+                continue
+            key = (current_dataset(), column["field"])
+            _filter_counts[key] = _filter_counts.get(key, 0) + 1
+            if _filter_counts[key] % settings.FILTER_INDEX_THRESHOLD == 0:
+                due.append(column["field"])
+    for field in due:
+        # The thread runs in a copy of this context, so in this dataset
+        context = contextvars.copy_context()
+        threading.Thread(
+            target=context.run, args=(ensure_filter_index, field), daemon=True
+        ).start()
@@ -0,0 +1,220 @@
+import pymongo
+from bson import ObjectId
+from django.conf import settings
+from pymongo import IndexModel
+
+from .models import (
+    DEFAULT_DATASET,
+    changes,
+    column_schema,
+    datasets,
+    deleted_columns,
+    jobs,
+    table_data,
+    using_dataset,
+)
+
+# Partial indexes only hold documents that carry the flag, which is a small
+# fraction of the table, so they stay cheap to build and keep in memory.
+RECORD_INDEXES = [
+    IndexModel(
+        [("deleted_by_admin", pymongo.ASCENDING)],
+        name="deleted_by_admin_partial",
+        partialFilterExpression={"deleted_by_admin": {"$exists": True}},
+    ),
+    IndexModel(
+        [("is_deleted", pymongo.ASCENDING)],
+        name="is_deleted_partial",
+        partialFilterExpression={"is_deleted": {"$exists": True}},
+    ),
+]
+
+COLUMN_INDEXES = [
+    IndexModel(
+        [("column_name", pymongo.ASCENDING)], name="column_name_unique", unique=True
+    ),
+    IndexModel(
+        [("is_deleted", pymongo.ASCENDING)],
+        name="is_deleted_partial",
+        partialFilterExpression={"is_deleted": {"$exists": True}},
+    ),
+    IndexModel(
+        [("deleted_by_admin", pymongo.ASCENDING)],
+        name="deleted_by_admin_partial",
+        partialFilterExpression={"deleted_by_admin": {"$exists": True}},
+    ),
+]
+
+# Leading $match of the column flags aggregation; $facet itself can't use indexes
+COLUMN_FLAGS_MATCH = {
+    "$or": [{"is_deleted": True}, {"deleted_by_admin": {"$in": [True, False]}}]
+}
+
+SCHEMA_INDEXES = [
+    IndexModel([("name", pymongo.ASCENDING)], name="name_unique", unique=True),
+]
+
+# Indexes created on demand for columns /api/data/ filters often
+FILTER_INDEX_PREFIX = "filter_"
+
+JOB_INDEXES = [
+    IndexModel([("finished_at", pymongo.ASCENDING)], name="finished_at"),
+]
+
+
+def ensure_record_indexes(collection=table_data):
+    """
+    Create the records indexes. Uploads call this on the staging collection
+    before it is swapped in, so the new table is indexed from the first read.
+    """
+    try:
+        collection.create_indexes(RECORD_INDEXES)
+    except Exception as e:
+        raise ValueError(f"Error creating record indexes in MongoDB: {str(e)}")
+
+
+def ensure_column_indexes(collection=deleted_columns):
+    try:
+        collection.create_indexes(COLUMN_INDEXES)
+    except Exception as e:
+        raise ValueError(f"Error creating deleted column indexes in MongoDB: {str(e)}")
+
+
+def ensure_dataset_indexes():
+    """
+    Create the indexes of the current dataset's collections.
+    """
+    ensure_record_indexes()
+    ensure_column_indexes()
+    column_schema.create_indexes(SCHEMA_INDEXES)
+    # The change feed is pruned by age; readers further behind get a reset
+    changes.create_indexes(
+        [
+            IndexModel(
+                [("at", pymongo.ASCENDING)],
+                name="at_ttl",
+                expireAfterSeconds=settings.CHANGES_RETENTION_SECONDS,
+            )
+        ]
+    )
+
+
+def ensure_filter_index(field, collection=table_data):
+    """
+    Index a column's field (with `_id`, for paging in filtered results) once
+    clients filter on it often. At most FILTER_INDEX_MAX such indexes are
+    kept per collection; returns whether an index was created.
+    """
+    name = f"{FILTER_INDEX_PREFIX}{field}"
+    try:
+        existing = collection.index_information()
+        if name in existing:
+            return False
+        if (
+            sum(1 for index in existing if index.startswith(FILTER_INDEX_PREFIX))
+            >= settings.FILTER_INDEX_MAX
+        ):
+            return False
+        collection.create_index(
+            [(field, pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], name=name
+        )
+    except Exception as e:
+        print(f"Error creating filter index in MongoDB: {str(e)}")
+        return False
+    print(f"Created filter index {name} on {collection.name}")
+    return True
+
+
+def ensure_indexes():
+    """
+    Create every index the API relies on, in every dataset. Safe to run
+    repeatedly.
+    """
+    for dataset_id in sorted({DEFAULT_DATASET, *datasets.distinct("_id")}):
+        with using_dataset(dataset_id):
+            ensure_dataset_indexes()
+    jobs.create_indexes(JOB_INDEXES)
+
+
+def endpoint_queries():
+    """
+    The filters the endpoints run, as (description, collection, kind, spec),
+    where kind is "find" (spec: filter, sort) or "aggregate" (spec: pipeline).
+    Export scans are deliberately left out: they read the whole table.
+    """
+    record_id = ObjectId()
+    return [
+        ("data page", table_data, "find", ({}, [("_id", 1)])),
+        (
+            "data page after cursor",
+            table_data,
+            "find",
+            ({"_id": {"$gt": record_id}}, [("_id", 1)]),
+        ),
+        (
+            "flagged records",
+            table_data,
+            "find",
+            ({"deleted_by_admin": {"$in": [True, False]}}, None),
+        ),
+        ("record by id", table_data, "find", ({"_id": record_id}, None)),
+        ("records by ids", table_data, "find", ({"_id": {"$in": [record_id]}}, None)),
+        ("pending record deletions", table_data, "find", ({"is_deleted": True}, None)),
+        ("column by name", deleted_columns, "find", ({"column_name": "column"}, None)),
+        (
+            "columns by names",
+            deleted_columns,
+            "find",
+            ({"column_name": {"$in": ["column"]}}, None),
+        ),
+        (
+            "column flags",
+            deleted_columns,
+            "aggregate",
+            [{"$match": COLUMN_FLAGS_MATCH}, {"$facet": {"all": []}}],
+        ),
+        (
+            "expired jobs",
+            jobs,
+            "find",
+            ({"finished_at": {"$lt": record_id.generation_time}}, None),
+        ),
+    ]
+
+
+def _winning_stages(plan):
+    """
+    Yield every stage name in the winning plan(s) of an explain document.
+    """
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            if key == "rejectedPlans":
+                continue
+            if key == "stage":
+                yield value
+            yield from _winning_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _winning_stages(item)
+
+
+def find_collection_scans():
+    """
+    Explain every endpoint query and return the descriptions of those whose
+    winning plan contains a COLLSCAN.
+    """
+    offenders = []
+    for description, collection, kind, spec in endpoint_queries():
+        if kind == "find":
+            query, sort = spec
+            cursor = collection.find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            explanation = cursor.explain()
+        else:
+            explanation = collection.database.command(
+                "aggregate", collection.name, pipeline=spec, explain=True
+            )
+        if "COLLSCAN" in set(_winning_stages(explanation)):
+            offenders.append(f"{collection.name}: {description}")
+    return offenders
@@ -0,0 +1,385 @@
+import multiprocessing
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import django
+from bson import ObjectId
+from django.conf import settings
+from pymongo import ReturnDocument
+
+from .aggregates import aggregate_plan, run_aggregate
+from .changes import RESET, log_change
+from .exports import XLSX_CONTENT_TYPE, write_excel_export, write_pdf_export
+from .datasets import register_dataset
+from .models import DEFAULT_DATASET, current_dataset, jobs, using_dataset
+from .schema import compact_columns
+from .services import iter_upload_chunks, replace_records
+from .snapshots import current_snapshot, export_source
+
+# Seconds between progress writes to the job document
+PROGRESS_INTERVAL = 1.0
+
+EXPORTS = {
+    "export_excel": (write_excel_export, "data.xlsx", XLSX_CONTENT_TYPE),
+    "export_pdf": (write_pdf_export, "table_data.pdf", "application/pdf"),
+}
+
+_executor = None
+
+
+def _init_worker():
+    django.setup()
+
+
+def get_executor():
+    """
+    The process pool running jobs, created on first use. Workers are spawned
+    rather than forked so they start with their own MongoDB client.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.JOB_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    return _executor
+
+
+def _replace_executor(broken):
+    """
+    Drop a pool that broke (a worker died), so get_executor() starts a new one.
+    """
+    global _executor
+    if _executor is broken:
+        _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def job_dir(job_id):
+    return settings.JOB_STORAGE_DIR / str(job_id)
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def update_job(job_id, **fields):
+    jobs.update_one(
+        {"_id": ObjectId(job_id)}, {"$set": {**fields, "updated_at": _now()}}
+    )
+
+
+def create_job(kind, **fields):
+    """
+    Record a queued job on the current dataset and return its ID.
+    """
+    prune_jobs()
+    now = _now()
+    job_id = ObjectId()
+    jobs.insert_one(
+        {
+            "_id": job_id,
+            "kind": kind,
+            "dataset": current_dataset(),
+            "status": "queued",
+            "created_at": now,
+            "updated_at": now,
+            "rows_processed": 0,
+            "rows_total": None,
+            "bytes_read": 0,
+            "bytes_total": None,
+            "bytes_written": 0,
+            **fields,
+        }
+    )
+    job_dir(job_id).mkdir(parents=True, exist_ok=True)
+    return str(job_id)
+
+
+def submit_job(job_id):
+    """
+    Hand a queued job to the worker pool. If the pool dies before the job
+    reports back, the job is marked as failed. A pool broken by an earlier
+    crash is replaced and the submission retried once; if the job still
+    can't be submitted it is marked as failed and the error re-raised.
+    """
+
+    def on_done(future):
+        if future.exception() is not None:
+            update_job(
+                job_id,
+                status="failed",
+                error=f"Job worker crashed: {future.exception()}",
+                finished_at=_now(),
+            )
+
+    try:
+        executor = get_executor()
+        try:
+            future = executor.submit(run_job, job_id)
+        except BrokenProcessPool:
+            _replace_executor(executor)
+            future = get_executor().submit(run_job, job_id)
+    except Exception as e:
+        update_job(
+            job_id,
+            status="failed",
+            error=f"Could not start job: {str(e)}",
+            finished_at=_now(),
+        )
+        raise
+    future.add_done_callback(on_done)
+    return job_id
+
+
+def submit_upload_job(uploaded_file):
+    """
+    Save an uploaded file where the workers can read it and queue its ingestion.
+    """
+    job_id = create_job(
+        "upload", file_name=uploaded_file.name, bytes_total=uploaded_file.size
+    )
+    path = job_dir(job_id) / "upload"
+    with open(path, "wb") as destination:
+        for block in uploaded_file.chunks():
+            destination.write(block)
+    update_job(job_id, input_path=str(path))
+    return submit_job(job_id)
+
+
+def submit_export_job(kind, chart=None):
+    """
+    Queue an export. `chart` (Excel only) holds the aggregates.aggregate_plan
+    arguments of the summary to chart; it is computed when the job runs.
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export '{kind}'")
+    if chart is not None and kind != "export_excel":
+        raise ValueError("Only Excel exports can have a chart")
+    fields = {"chart": chart} if chart is not None else {}
+    return submit_job(create_job(kind, **fields))
+
+
+def submit_compaction_job():
+    return submit_job(create_job("compact_columns"))
+
+
+class _Progress:
+    """
+    Progress callback that writes to the job document at most every
+    PROGRESS_INTERVAL seconds.
+    """
+
+    def __init__(self, job_id, handle=None):
+        self.job_id = job_id
+        self.handle = handle
+        self.last_write = 0.0
+
+    def __call__(self, rows, rows_total=None):
+        now = time.monotonic()
+        if now - self.last_write < PROGRESS_INTERVAL:
+            return
+        self.last_write = now
+        fields = {"rows_processed": rows, "rows_total": rows_total}
+        if self.handle is not None:
+            # Read position of the upload, for the progress estimate
+            fields["bytes_read"] = self.handle.tell()
+        update_job(self.job_id, **fields)
+
+
+def _run_upload(job):
+    with open(job["input_path"], "rb") as handle:
+        chunks = iter_upload_chunks(handle, job["file_name"])
+        if chunks is None:
+            raise ValueError("Unsupported file format")
+        stats = replace_records(chunks, progress=_Progress(job["_id"], handle))
+    try:
+        register_dataset(job["file_name"])
+    except Exception as e:
+        # The data is replaced; only the catalog entry is missing
+        stats["registration_error"] = str(e)
+    finally:
+        # Clients must reload the table whatever happened to the catalog
+        log_change(RESET)
+    # Build the new table's snapshot now rather than in the first export
+    current_snapshot()
+    return {
+        "rows_processed": stats["rows_inserted"],
+        "bytes_read": job["bytes_total"],
+        "result": stats,
+    }
+
+
+def _run_export(job):
+    write_export, file_name, content_type = EXPORTS[job["kind"]]
+    path = job_dir(job["_id"]) / file_name
+    options = {}
+    if job.get("chart"):
+        options["chart"] = run_aggregate(aggregate_plan(**job["chart"]))
+    with open(path, "wb") as out:
+        rows = write_export(
+            out, progress=_Progress(job["_id"]), **options, **export_source()
+        )
+    return {
+        "rows_processed": rows,
+        "bytes_written": path.stat().st_size,
+        "artifact_path": str(path),
+        "file_name": file_name,
+        "content_type": content_type,
+    }
+
+
+def _run_compaction(job):
+    result = compact_columns(progress=_Progress(job["_id"]))
+    return {"rows_processed": result["rows_compacted"], "result": result}
+
+
+def _heartbeat(job_id, stop):
+    # Keeps updated_at fresh so recover_jobs() can tell live jobs from dead ones
+    while not stop.wait(settings.JOB_HEARTBEAT_SECONDS):
+        try:
+            update_job(job_id)
+        except Exception as e:
+            print(f"Error updating job heartbeat in MongoDB: {str(e)}")
+
+
+def run_job(job_id):
+    """
+    Run a job inside a worker process, against the dataset it was queued on,
+    recording its outcome on the job document. Jobs on different datasets
+    touch different collections, so they run side by side. The job is
+    claimed by moving it from queued to running, so a job that was queued
+    twice (see recover_jobs) runs once; a job that is gone or already
+    claimed is skipped.
+    """
+    now = _now()
+    job = jobs.find_one_and_update(
+        {"_id": ObjectId(job_id), "status": "queued"},
+        {"$set": {"status": "running", "started_at": now, "updated_at": now}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if job is None:
+        return
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_id, stop), daemon=True).start()
+    try:
+        with using_dataset(job.get("dataset", DEFAULT_DATASET)):
+            if job["kind"] == "upload":
+                outcome = _run_upload(job)
+            elif job["kind"] == "compact_columns":
+                outcome = _run_compaction(job)
+            else:
+                outcome = _run_export(job)
+    except Exception as e:
+        update_job(job_id, status="failed", error=str(e), finished_at=_now())
+        return
+    finally:
+        stop.set()
+        if job.get("input_path"):
+            Path(job["input_path"]).unlink(missing_ok=True)
+    update_job(job_id, status="done", finished_at=_now(), **outcome)
+
+
+def recover_jobs():
+    """
+    Pick up the jobs of processes that stopped: running jobs whose heartbeat
+    is more than JOB_STALE_SECONDS old are marked as failed, and queued jobs
+    are handed to this process's worker pool (a job still queued elsewhere
+    runs only once, see run_job). Called when the server starts.
+    Returns the numbers of jobs failed and requeued.
+    """
+    cutoff = _now() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    try:
+        failed = jobs.update_many(
+            {"status": "running", "updated_at": {"$lt": cutoff}},
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": "Job was interrupted before it finished",
+                    "finished_at": _now(),
+                    "updated_at": _now(),
+                }
+            },
+        ).modified_count
+        queued = [job["_id"] for job in jobs.find({"status": "queued"}, {"_id": 1})]
+    except Exception as e:
+        raise ValueError(f"Error recovering jobs in MongoDB: {str(e)}")
+    for job_id in queued:
+        submit_job(str(job_id))
+    return {"failed": failed, "requeued": len(queued)}
+
+
+def recover_jobs_on_startup():
+    """
+    Run recover_jobs() if JOB_RECOVER_ON_STARTUP is set; called from the
+    WSGI/ASGI entry points, so job workers and management commands skip it.
+    """
+    if not settings.JOB_RECOVER_ON_STARTUP:
+        return
+    try:
+        recovered = recover_jobs()
+    except ValueError as e:
+        print(f"Error recovering jobs on startup: {str(e)}")
+        return
+    if any(recovered.values()):
+        print(f"Recovered jobs on startup: {recovered}")
+
+
+def prune_jobs():
+    """
+    Delete jobs, and their files, that finished more than JOB_RETENTION_HOURS ago.
+    """
+    cutoff = _now() - timedelta(hours=settings.JOB_RETENTION_HOURS)
+    for job in jobs.find({"finished_at": {"$lt": cutoff}}, {"_id": 1}):
+        shutil.rmtree(job_dir(job["_id"]), ignore_errors=True)
+        jobs.delete_one({"_id": job["_id"]})
+
+
+def describe_job(job):
+    """
+    Public view of a job document, with its completion fraction and ETA.
+    """
+    if job["kind"] == "upload":
+        done, total = job.get("bytes_read"), job.get("bytes_total")
+    else:
+        done, total = job.get("rows_processed"), job.get("rows_total")
+
+    fraction = None
+    if job["status"] == "done":
+        fraction = 1.0
+    elif total and done is not None:
+        fraction = min(done / total, 1.0)
+
+    eta_seconds = None
+    started_at = job.get("started_at")
+    if job["status"] == "running" and started_at and fraction:
+        if started_at.tzinfo is None:
+            started_at = started_at.replace(tzinfo=timezone.utc)
+        elapsed = (_now() - started_at).total_seconds()
+        eta_seconds = round(elapsed * (1 - fraction) / fraction, 1)
+
+    return {
+        "id": str(job["_id"]),
+        "kind": job["kind"],
+        "dataset": job.get("dataset", DEFAULT_DATASET),
+        "status": job["status"],
+        "rows_processed": job.get("rows_processed"),
+        "rows_total": job.get("rows_total"),
+        "bytes_read": job.get("bytes_read"),
+        "bytes_total": job.get("bytes_total"),
+        "bytes_written": job.get("bytes_written"),
+        "progress": round(fraction, 4) if fraction is not None else None,
+        "eta_seconds": eta_seconds,
+        "created_at": job.get("created_at"),
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "download_available": bool(job.get("artifact_path")),
+    }
@@ -0,0 +1,148 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .caching import data_version
+from .changes import fetch_changes
+from .models import current_dataset
+
+# Live updates fan out in-process: one poller per process and dataset tails
+# the dataset's change feed and hands every batch of changes to the queue of
+# each connected client, so the number of clients doesn't change the load
+# on MongoDB.
+
+_fetch_changes = sync_to_async(fetch_changes, thread_sensitive=False)
+_data_version = sync_to_async(data_version, thread_sensitive=False)
+
+
+class Subscription:
+    """
+    One connected client's queue of change batches. A client that falls
+    LIVE_QUEUE_SIZE batches behind is marked as overflowed instead of
+    growing the queue; it then has to reload the table.
+    """
+
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=settings.LIVE_QUEUE_SIZE)
+        self.overflowed = False
+
+    def push(self, changes):
+        try:
+            self.queue.put_nowait(changes)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class ChangeBroadcaster:
+    """
+    Polls the change feed every LIVE_POLL_INTERVAL seconds while at least
+    one client is subscribed and pushes each batch to all subscribers. The
+    poller runs in the context of the first subscriber, so it follows that
+    subscriber's dataset; use broadcaster_for() to get the right one.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.seq = None
+        self._task = None
+
+    async def subscribe(self):
+        subscription = Subscription()
+        self.subscribers.add(subscription)
+        if self._task is None or self._task.done():
+            self.seq = await _data_version(fresh=True)
+            self._task = asyncio.create_task(self._poll())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, changes):
+        for subscription in list(self.subscribers):
+            subscription.push(changes)
+
+    async def _poll(self):
+        while self.subscribers:
+            try:
+                changes = await _fetch_changes(self.seq)
+            except ValueError as e:
+                print(f"Error polling the change feed: {str(e)}")
+                await asyncio.sleep(settings.LIVE_POLL_INTERVAL)
+                continue
+            advanced = changes["seq"] != self.seq
+            if advanced:
+                self.seq = changes["seq"]
+                self.publish(changes)
+            # Poll again at once only while the feed moves and has more
+            if not (advanced and changes["has_more"]):
+                await asyncio.sleep(settings.LIVE_POLL_INTERVAL)
+
+
+_broadcasters = {}
+
+
+def broadcaster_for(dataset_id):
+    if dataset_id not in _broadcasters:
+        _broadcasters[dataset_id] = ChangeBroadcaster()
+    return _broadcasters[dataset_id]
+
+
+def sse_event(event, seq, data):
+    """
+    Format one server-sent event; `data` is already JSON-encoded.
+    """
+    return f"id: {seq}\nevent: {event}\ndata: {data}\n\n"
+
+
+async def change_events(since, encode):
+    """
+    Yield the server-sent events of one client: first the changes after
+    `since` (if given), then every batch the broadcaster publishes, with a
+    comment line every LIVE_HEARTBEAT_SECONDS to keep proxies from closing
+    the connection. The stream ends after LIVE_MAX_CONNECTION_SECONDS; the
+    browser's EventSource reconnects with Last-Event-ID and resumes.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.LIVE_MAX_CONNECTION_SECONDS
+    broadcaster = broadcaster_for(current_dataset())
+    subscription = await broadcaster.subscribe()
+    try:
+        seq = broadcaster.seq if since is None else since
+        yield "retry: 1000\n\n"
+        # Catch up; batches published meanwhile are queued and deduplicated below
+        while True:
+            changes = await _fetch_changes(seq)
+            advanced = changes["seq"] != seq
+            if advanced:
+                seq = changes["seq"]
+                yield sse_event(_event_name(changes), seq, encode(changes))
+            if not (advanced and changes["has_more"]):
+                break
+
+        while loop.time() < deadline:
+            if subscription.overflowed:
+                subscription.overflowed = False
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                seq = broadcaster.seq
+                reset = {"since": None, "seq": seq, "reset_required": True}
+                yield sse_event("reset", seq, encode(reset))
+                continue
+            try:
+                changes = await asyncio.wait_for(
+                    subscription.queue.get(), settings.LIVE_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if changes["seq"] <= seq and not changes["reset_required"]:
+                continue
+            seq = changes["seq"]
+            yield sse_event(_event_name(changes), seq, encode(changes))
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+def _event_name(changes):
+    return "reset" if changes["reset_required"] else "changes"
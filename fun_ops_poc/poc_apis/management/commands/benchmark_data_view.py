@@ -0,0 +1,163 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.utils.encoders import JSONEncoder
+
+from poc_apis.caching import DATA_VERSION_ID
+from poc_apis.datasets import dataset_exists, validate_dataset_id
+from poc_apis.models import (
+    column_schema,
+    deleted_columns,
+    meta,
+    scoped_name,
+    table_data,
+    using_dataset,
+)
+from poc_apis.schema import SCHEMA_VERSION_ID, write_column_schema
+from poc_apis.services import chunk_to_records, fetch_data_view
+
+
+def legacy_data_view(records, columns):
+    """
+    The /api/data/ response as it was built before pagination: six sequential
+    queries, three of them over the whole records collection.
+    """
+
+    def column_names(query):
+        return [
+            doc["column_name"]
+            for doc in columns.find(query, {"_id": 0, "column_name": 1})
+        ]
+
+    def clean(data):
+        for record in data:
+            for key, value in record.items():
+                if isinstance(value, float) and (
+                    pd.isna(value) or abs(value) == float("inf")
+                ):
+                    record[key] = None
+        return data
+
+    all_records = clean(list(records.find({})))
+    for record in all_records:
+        record["_id"] = str(record["_id"])
+    return {
+        "records": all_records,
+        "deleted_columns": column_names({"is_deleted": True}),
+        "deleted_by_admin_columns": column_names({"deleted_by_admin": True}),
+        "deleted_by_admin_records": clean(
+            list(records.find({"deleted_by_admin": True}, {"_id": 0}))
+        ),
+        "rejected_by_admin_columns": column_names({"deleted_by_admin": False}),
+        "rejected_by_admin_records": clean(
+            list(records.find({"deleted_by_admin": False}, {"_id": 0}))
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the old (full table, six queries) and new (paginated, concurrent) "
+        "/api/data/ responses on synthetic tables in a scratch dataset, which is "
+        "dropped afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+        )
+        parser.add_argument("--columns", type=int, default=12)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--dataset", default="benchmark")
+
+    def handle(self, *args, **options):
+        dataset = options["dataset"]
+        try:
+            validate_dataset_id(dataset)
+            exists = dataset_exists(dataset)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if exists:
+            # The scratch collections are dropped, so never use a real dataset
+            raise CommandError(f"Dataset '{dataset}' exists; pick another --dataset")
+        with using_dataset(dataset):
+            self.run(options)
+
+    def run(self, options):
+        """
+        Time both responses in the current (scratch) dataset. The new one
+        projects through the dataset's own column registry, written by `seed`.
+        """
+        page_params = {"limit": settings.DATA_PAGE_SIZE}
+        rng = np.random.default_rng(0)
+
+        try:
+            for rows in options["rows"]:
+                self.seed(table_data, deleted_columns, rows, options["columns"], rng)
+                for name, build in (
+                    ("old", lambda: legacy_data_view(table_data, deleted_columns)),
+                    ("new", lambda: fetch_data_view(page_params)),
+                ):
+                    timings = []
+                    for _ in range(options["repeat"]):
+                        started = time.perf_counter()
+                        payload = json.dumps(build(), cls=JSONEncoder)
+                        timings.append(time.perf_counter() - started)
+                    self.stdout.write(
+                        f"{rows:>9} rows  {name}:  best {min(timings) * 1000:9.1f} ms  "
+                        f"payload {len(payload) / 1024 / 1024:8.2f} MB"
+                    )
+        finally:
+            for collection in (table_data, deleted_columns, column_schema):
+                collection.drop()
+            meta.delete_many(
+                {
+                    "_id": {
+                        "$in": [
+                            scoped_name(SCHEMA_VERSION_ID),
+                            scoped_name(DATA_VERSION_ID),
+                        ]
+                    }
+                }
+            )
+
+    def seed(self, records, columns, rows, width, rng):
+        """
+        Fill the scratch collections with `rows` numeric/text rows, 1% of them
+        approved and 1% rejected for deletion, and a few reviewed columns, and
+        write the matching column registry.
+        """
+        records.drop()
+        columns.drop()
+        batch = 50_000
+        for start in range(0, rows, batch):
+            size = min(batch, rows - start)
+            df = pd.DataFrame(
+                {f"col_{i}": rng.normal(size=size) for i in range(width - 1)}
+            )
+            df["name"] = [f"row-{start + i}" for i in range(size)]
+            df.loc[df.sample(frac=0.05, random_state=start).index, "col_0"] = np.nan
+            flag = rng.random(size)
+            df["deleted_by_admin"] = np.where(
+                flag < 0.01, True, np.where(flag < 0.02, False, None)
+            )
+            # Unflagged rows don't carry the field at all, as in real uploads
+            docs = [
+                {k: v for k, v in doc.items() if v is not None}
+                for doc in chunk_to_records(df)
+            ]
+            records.insert_many(docs, ordered=False)
+        columns.insert_many(
+            [
+                {"column_name": "col_1", "is_deleted": True},
+                {"column_name": "col_2", "is_deleted": True, "deleted_by_admin": True},
+                {"column_name": "col_3", "deleted_by_admin": False},
+            ]
+        )
+        write_column_schema(
+            {**{f"col_{i}": "float" for i in range(width - 1)}, "name": "string"}
+        )
@@ -0,0 +1,63 @@
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from poc_apis.renderers import ORJSONRenderer
+
+
+def synthetic_response(rows, width, rng):
+    """
+    An /api/data/ style response body: `rows` cleaned records with float,
+    integer, text, date and null values.
+    """
+    started = datetime(2024, 1, 1)
+    floats = rng.normal(size=(rows, width)).tolist()
+    records = []
+    for index in range(rows):
+        record = {"_id": str(ObjectId())}
+        for column in range(width):
+            kind = column % 4
+            if kind == 0:
+                value = floats[index][column]
+            elif kind == 1:
+                value = index * width + column
+            elif kind == 2:
+                value = f"text-{index}-{column}"
+            else:
+                value = started + timedelta(minutes=index)
+            record[f"col_{column}"] = None if (index + column) % 20 == 0 else value
+        records.append(record)
+    return {"records": records, "next_cursor": None}
+
+
+class Command(BaseCommand):
+    help = "Compare DRF's JSONRenderer with the orjson renderer on large responses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000])
+        parser.add_argument("--columns", type=int, default=12)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        for rows in options["rows"]:
+            data = synthetic_response(rows, options["columns"], rng)
+            for name, renderer in (
+                ("drf", JSONRenderer()),
+                ("orjson", ORJSONRenderer()),
+            ):
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    body = renderer.render(data)
+                    timings.append(time.perf_counter() - started)
+                best = min(timings)
+                self.stdout.write(
+                    f"{rows:>8} rows  {name:>6}:  best {best * 1000:8.1f} ms  "
+                    f"{len(body) / best / 1024 / 1024:7.1f} MB/s  "
+                    f"{rows / best:10.0f} rows/s"
+                )
@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+
+from poc_apis.services import chunk_to_records, clean_record
+
+
+def legacy_chunk_to_records(chunk):
+    """
+    Upload conversion before ingestion-time sanitization: NaN/NaT become None
+    through an object-dtype copy of the frame, Inf is stored as is.
+    """
+    chunk.columns = chunk.columns.map(str)
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    return chunk.to_dict(orient="records")
+
+
+def legacy_clean_record(record):
+    """
+    Read-side cleanup before ingestion-time sanitization: a check per value.
+    """
+    record["_id"] = str(record["_id"])
+    for key, value in record.items():
+        if isinstance(value, float) and (
+            pd.isna(value) or value == float("inf") or value == float("-inf")
+        ):
+            record[key] = None
+    return record
+
+
+def synthetic_chunk(rows, width, rng):
+    """
+    A chunk shaped like a spreadsheet upload: float columns with 5% NaN and a
+    few Inf, integer, text and date columns.
+    """
+    data = {}
+    for index in range(width):
+        kind = index % 4
+        if kind == 0:
+            values = rng.normal(size=rows)
+            values[rng.random(rows) < 0.05] = np.nan
+            values[rng.random(rows) < 0.001] = np.inf
+        elif kind == 1:
+            values = rng.integers(0, 1_000_000, size=rows)
+        elif kind == 2:
+            values = np.array([f"text-{i}" for i in range(rows)], dtype=object)
+            values[rng.random(rows) < 0.05] = np.nan
+        else:
+            values = pd.Series(pd.date_range("2024-01-01", periods=rows, freq="min"))
+            values[rng.random(rows) < 0.05] = pd.NaT
+        data[f"col_{index}"] = values
+    return pd.DataFrame(data)
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark the per-row cost of converting upload chunks and of "
+        "cleaning records on read, before and after ingestion-time sanitization."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument("--columns", type=int, default=12)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        chunk = synthetic_chunk(rows, options["columns"], np.random.default_rng(0))
+
+        for name, convert, clean in (
+            ("old", legacy_chunk_to_records, legacy_clean_record),
+            ("new", chunk_to_records, clean_record),
+        ):
+            ingest = self.best(lambda: convert(chunk.copy()), repeat)
+            records = convert(chunk.copy())
+            for record in records:
+                record["_id"] = ObjectId()
+            # Reads clean a fresh copy of each record, as every request does
+            read = self.best(
+                lambda: [clean(dict(record)) for record in records], repeat
+            )
+            self.stdout.write(
+                f"{name}:  ingest {ingest / rows * 1e6:6.2f} us/row  "
+                f"read {read / rows * 1e6:6.2f} us/row"
+            )
+
+    def best(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from poc_apis.indexes import find_collection_scans
+from poc_apis.models import DEFAULT_DATASET, using_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Explain the queries the API endpoints run and fail if any of them "
+        "scans a whole collection (COLLSCAN)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dataset", default=DEFAULT_DATASET)
+
+    def handle(self, *args, **options):
+        with using_dataset(options["dataset"]):
+            offenders = find_collection_scans()
+        if offenders:
+            raise CommandError(
+                "Queries doing a COLLSCAN:\n  " + "\n  ".join(offenders)
+            )
+        self.stdout.write(self.style.SUCCESS("All endpoint queries use an index"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from poc_apis.indexes import ensure_indexes
+
+
+class Command(BaseCommand):
+    help = "Create the MongoDB indexes used by the API endpoints."
+
+    def handle(self, *args, **options):
+        try:
+            ensure_indexes()
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS("Indexes are up to date"))
@@ -0,0 +1,127 @@
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+
+def run_client(url, requests, slow_read, bust_cache, latencies, errors, start):
+    """
+    One simulated client: send `requests` GETs over a keep-alive connection,
+    reading each response in 8 KB blocks with `slow_read` seconds between
+    them to imitate a slow network.
+    """
+    parts = urlsplit(url)
+    connection_class = (
+        http.client.HTTPSConnection
+        if parts.scheme == "https"
+        else http.client.HTTPConnection
+    )
+    connection = connection_class(parts.netloc, timeout=120)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    start.wait()
+    for number in range(requests):
+        target = path
+        if bust_cache:
+            # A unique parameter makes every request miss the response cache
+            separator = "&" if "?" in target else "?"
+            target += f"{separator}_={threading.get_ident()}-{number}"
+        started = time.perf_counter()
+        try:
+            connection.request("GET", target)
+            response = connection.getresponse()
+            while response.read(8192):
+                if slow_read:
+                    time.sleep(slow_read)
+            if response.status >= 400:
+                errors.append(response.status)
+                continue
+        except Exception as e:
+            errors.append(type(e).__name__)
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test running deployments, e.g. the WSGI /api/data/ against the "
+        "ASGI /api/async/data/: --target wsgi=http://127.0.0.1:8000/api/data/ "
+        "--target asgi=http://127.0.0.1:8001/api/async/data/"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target",
+            action="append",
+            required=True,
+            help="NAME=URL; repeat to compare deployments",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, nargs="+", default=[10, 100, 300]
+        )
+        parser.add_argument("--requests", type=int, default=20, help="per client")
+        parser.add_argument(
+            "--slow-read-ms",
+            type=float,
+            default=0,
+            help="pause between 8 KB reads, to simulate slow clients",
+        )
+        parser.add_argument(
+            "--bust-cache",
+            action="store_true",
+            help="add a unique query parameter so every request reaches MongoDB",
+        )
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options["target"]:
+            name, _, url = target.partition("=")
+            if not url:
+                raise CommandError(f"Expected NAME=URL, got '{target}'")
+            targets.append((name, url))
+
+        for concurrency in options["concurrency"]:
+            for name, url in targets:
+                self.run(name, url, concurrency, options)
+
+    def run(self, name, url, concurrency, options):
+        latencies, errors = [], []
+        start = threading.Event()
+        threads = [
+            threading.Thread(
+                target=run_client,
+                args=(
+                    url,
+                    options["requests"],
+                    options["slow_read_ms"] / 1000,
+                    options["bust_cache"],
+                    latencies,
+                    errors,
+                    start,
+                ),
+                daemon=True,
+            )
+            for _ in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        started = time.perf_counter()
+        start.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if latencies:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        else:
+            p50 = p95 = p99 = float("nan")
+        self.stdout.write(
+            f"{name:>8}  {concurrency:>4} clients  "
+            f"{len(latencies) / elapsed:8.1f} req/s  "
+            f"p50 {p50:8.1f} ms  p95 {p95:8.1f} ms  p99 {p99:8.1f} ms  "
+            f"errors {len(errors)}"
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from poc_apis.models import DEFAULT_DATASET, using_dataset
+from poc_apis.services import sanitize_stored_values
+
+
+class Command(BaseCommand):
+    help = (
+        "Replace the NaN/Inf values stored by uploads made before ingestion-time "
+        "sanitization with null, so reads can return records as stored."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dataset", default=DEFAULT_DATASET)
+
+    def handle(self, *args, **options):
+        try:
+            with using_dataset(options["dataset"]):
+                modified = sanitize_stored_values()
+        except ValueError as e:
+            raise CommandError(str(e))
+        for field, count in modified.items():
+            self.stdout.write(f"{field}: {count} value(s) replaced")
+        self.stdout.write(
+            self.style.SUCCESS(f"{sum(modified.values())} value(s) sanitized")
+        )
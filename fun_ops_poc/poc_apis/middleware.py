@@ -0,0 +1,36 @@
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from .datasets import dataset_exists, validate_dataset_id
+from .models import DEFAULT_DATASET, activate_dataset
+
+
+class DatasetMiddleware(MiddlewareMixin):
+    """
+    Activate the dataset named by the `dataset` query parameter (the default
+    dataset without one) for the request, so every collection it touches is
+    that dataset's. Unknown datasets get a 404, except on views that create
+    them (`creates_dataset = True`, i.e. uploads).
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        activate_dataset(DEFAULT_DATASET)
+        dataset_id = request.GET.get("dataset")
+        if not dataset_id:
+            return None
+
+        try:
+            validate_dataset_id(dataset_id)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        try:
+            exists = dataset_exists(dataset_id)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=500)
+        view_class = getattr(view_func, "view_class", None)
+        if not exists and not getattr(view_class, "creates_dataset", False):
+            return JsonResponse(
+                {"error": f"Dataset '{dataset_id}' not found"}, status=404
+            )
+        activate_dataset(dataset_id)
+        return None
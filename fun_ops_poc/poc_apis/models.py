@@ -1,9 +1,323 @@
-from django.db import models
+import asyncio
+import contextvars
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+
 import pymongo
+from django.conf import settings
+from django.db import models
+from pymongo import monitoring
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool events for this process's client, for /api/health/.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(
+            [
+                "connections_created",
+                "connections_closed",
+                "checkouts",
+                "checkout_failures",
+                "checked_out",
+                "waiting",
+                "pools_cleared",
+            ],
+            0,
+        )
+
+    def _add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self.counters[name] += delta
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters["open_connections"] = (
+            counters["connections_created"] - counters["connections_closed"]
+        )
+        return counters
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add(pools_cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(connections_created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(connections_closed=1)
+
+    def connection_check_out_started(self, event):
+        self._add(waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._add(waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._add(waiting=-1, checkouts=1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._add(checked_out=-1)
+
+
+_client = None
+_client_pid = None
+_pool_metrics = None
+_client_lock = threading.Lock()
+
+
+def _forget_client():
+    # A forked child must not use the parent's sockets; it builds its own client
+    global _client, _client_pid, _pool_metrics
+    _client = _client_pid = _pool_metrics = None
+
+
+os.register_at_fork(after_in_child=_forget_client)
+
+
+def _client_options():
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    }
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = settings.MONGO_COMPRESSORS
+    return options
+
+
+def get_client():
+    """
+    The MongoClient for this process, created on first use from the MONGO_*
+    settings. A process forked after the client was created gets a new one.
+    """
+    global _client, _client_pid, _pool_metrics
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _pool_metrics = PoolMetrics()
+                _client = pymongo.MongoClient(
+                    settings.MONGO_URI,
+                    event_listeners=[_pool_metrics],
+                    **_client_options(),
+                )
+                _client_pid = pid
+    return _client
+
+
+def get_db():
+    return get_client()[settings.MONGO_DB_NAME]
+
+
+# Async clients are bound to the event loop they were first used on, so the
+# async views keep one per loop. Under an ASGI server that is one per process.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    The AsyncMongoClient of the running event loop, created on first use
+    from the same MONGO_* settings as the synchronous client.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = pymongo.AsyncMongoClient(settings.MONGO_URI, **_client_options())
+        _async_clients[loop] = client
+    return client
+
+
+def pool_metrics():
+    """
+    Connection pool counters of this process's client (empty before first use).
+    """
+    return _pool_metrics.snapshot() if _pool_metrics else {}
+
+
+class LazyDatabase:
+    """
+    Stand-in for the application database that resolves against this
+    process's client when used, so importing it never opens a connection.
+    """
+
+    def __getattr__(self, attr):
+        return getattr(get_db(), attr)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+
+# Every dataset lives in its own set of collections. The default dataset
+# keeps the original names (records, deleted_columns, ...); the collections
+# of any other dataset are prefixed with `dataset_<id>__`. The dataset is
+# held in a context variable, set per request by DatasetMiddleware and
+# around jobs and commands with using_dataset(), so every collection
+# handle below resolves to the current dataset's collection.
+DEFAULT_DATASET = "default"
+
+_current_dataset = contextvars.ContextVar("dataset", default=DEFAULT_DATASET)
+
+
+def current_dataset():
+    return _current_dataset.get()
+
+
+def activate_dataset(dataset_id):
+    """
+    Make `dataset_id` the dataset of the current request.
+    """
+    _current_dataset.set(dataset_id)
+
+
+@contextmanager
+def using_dataset(dataset_id):
+    """
+    Run the body of the `with` block against `dataset_id`.
+    """
+    token = _current_dataset.set(dataset_id)
+    try:
+        yield
+    finally:
+        _current_dataset.reset(token)
+
+
+def scoped_name(name, dataset_id=None):
+    """
+    The name of collection (or `meta` document) `name` in a dataset, the
+    current one by default.
+    """
+    dataset_id = dataset_id or current_dataset()
+    if dataset_id == DEFAULT_DATASET:
+        return name
+    return f"dataset_{dataset_id}__{name}"
+
+
+class LazyCollection:
+    """
+    Stand-in for a pymongo Collection resolved against this process's client
+    when used. With `secondary_reads` the collection uses the
+    MONGO_READ_PREFERENCE setting instead of reading from the primary.
+    Unless `per_dataset` is False, `name` is the current dataset's collection.
+    """
+
+    def __init__(self, name, secondary_reads=False, per_dataset=True):
+        self.base_name = name
+        self.secondary_reads = secondary_reads
+        self.per_dataset = per_dataset
+        self._resolved = (None, {})
+
+    @property
+    def name(self):
+        if self.per_dataset:
+            return scoped_name(self.base_name)
+        return self.base_name
+
+    def _collection(self):
+        client = get_client()
+        name = self.name
+        cached_client, collections = self._resolved
+        if cached_client is not client:
+            collections = {}
+            self._resolved = (client, collections)
+        collection = collections.get(name)
+        if collection is None:
+            collection = client[settings.MONGO_DB_NAME][name]
+            if self.secondary_reads:
+                mode = read_pref_mode_from_name(settings.MONGO_READ_PREFERENCE)
+                collection = collection.with_options(
+                    read_preference=make_read_preference(mode, None)
+                )
+            collections[name] = collection
+        return collection
+
+    def __getattr__(self, attr):
+        return getattr(self._collection(), attr)
+
+
+class AsyncLazyCollection:
+    """
+    Async counterpart of LazyCollection, resolved against the running event
+    loop's AsyncMongoClient.
+    """
+
+    def __init__(self, name, secondary_reads=False):
+        self.base_name = name
+        self.secondary_reads = secondary_reads
+
+    @property
+    def name(self):
+        return scoped_name(self.base_name)
+
+    def _collection(self):
+        collection = get_async_client()[settings.MONGO_DB_NAME][self.name]
+        if self.secondary_reads:
+            mode = read_pref_mode_from_name(settings.MONGO_READ_PREFERENCE)
+            collection = collection.with_options(
+                read_preference=make_read_preference(mode, None)
+            )
+        return collection
+
+    def __getattr__(self, attr):
+        return getattr(self._collection(), attr)
+
+
+db = LazyDatabase()
+table_data = LazyCollection("records")
+deleted_columns = LazyCollection("deleted_columns")
+column_schema = LazyCollection("column_schema")
+# Shared by all datasets: jobs record their dataset, and `meta` documents
+# are named per dataset with scoped_name()
+jobs = LazyCollection("jobs", per_dataset=False)
+meta = LazyCollection("meta", per_dataset=False)
+# The catalog of datasets other than the default one
+datasets = LazyCollection("datasets", per_dataset=False)
+# Append-only change feed, keyed by the data version each change produced
+changes = LazyCollection("changes")
+
+# Handles for the read-only GET and export paths; they use
+# MONGO_READ_PREFERENCE, so reads can be sent to secondaries.
+table_data_reads = LazyCollection("records", secondary_reads=True)
+deleted_columns_reads = LazyCollection("deleted_columns", secondary_reads=True)
+
+# The same collections for the async views (/api/async/...)
+async_table_data = AsyncLazyCollection("records")
+async_deleted_columns = AsyncLazyCollection("deleted_columns")
+async_table_data_reads = AsyncLazyCollection("records", secondary_reads=True)
+async_deleted_columns_reads = AsyncLazyCollection(
+    "deleted_columns", secondary_reads=True
+)
 
-url = "mongodb://localhost:27017"
-client = pymongo.MongoClient(url)
+# Uploads are written to a staging collection and renamed over `records`;
+# replaced tables are kept under the version prefix for rollback. Like the
+# collection names, the prefixes are per dataset (see scoped_name).
+STAGING_PREFIX = "records__staging_"
+COLUMN_SCHEMA_STAGING_PREFIX = "column_schema__staging_"
+VERSION_PREFIX = "records__version_"
+DELETED_COLUMNS_VERSION_PREFIX = "deleted_columns__version_"
+COLUMN_SCHEMA_VERSION_PREFIX = "column_schema__version_"
 
-db = client["table_records"]
-table_data = db["records"]
-deleted_columns = db["deleted_columns"]
+# Bookkeeping fields set on records by the soft-delete and approval endpoints
+RECORD_FLAG_FIELDS = ("is_deleted", "deleted_by_admin", "marked_as_deleted")
@@ -0,0 +1,55 @@
+import base64
+import decimal
+
+import orjson
+from bson import Decimal128, ObjectId
+from bson.raw_bson import RawBSONDocument
+from rest_framework.renderers import BaseRenderer
+
+# orjson writes NaN/Inf as null and handles datetimes, UUIDs, dataclasses and
+# numpy values natively; `_default` covers the BSON and other types it doesn't.
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, RawBSONDocument):
+        # Decoded lazily, one document at a time, as it is serialized
+        return dict(value.items())
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, bytes):
+        # Binary data (including bson.Binary) isn't necessarily text
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data, indent=False):
+    """
+    Serialize `data` to JSON bytes with orjson.
+    """
+    options = ORJSON_OPTIONS | orjson.OPT_INDENT_2 if indent else ORJSON_OPTIONS
+    return orjson.dumps(data, default=_default, option=options)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Drop-in replacement for DRF's JSONRenderer, several times faster on large
+    responses. Clients asking for `application/json; indent=...` get output
+    indented by two spaces.
+    """
+
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = "indent" in (accepted_media_type or "")
+        return dumps(data, indent=indent)
@@ -0,0 +1,610 @@
+import threading
+import time
+
+import pandas as pd
+from bson import ObjectId
+from django.conf import settings
+from pymongo import DeleteMany, ReturnDocument, UpdateOne
+
+from .indexes import SCHEMA_INDEXES
+from .models import (
+    RECORD_FLAG_FIELDS,
+    column_schema,
+    current_dataset,
+    deleted_columns,
+    meta,
+    scoped_name,
+    table_data,
+)
+
+# The column registry: one `column_schema` document per data column with its
+# name (what the API shows), position, inferred dtype, the physical `field`
+# its values are stored under and the `default` read when a record has no
+# value. Adding or renaming a column only changes the registry; compaction
+# later rewrites the records so every field matches its column name.
+#
+# The `meta` document below holds a version that is bumped on every schema
+# change (including column deletion flags), which is how other processes
+# notice their cached copy is stale.
+SCHEMA_VERSION_ID = "column_schema"
+
+# Records rewritten by a compaction are marked with its layout ID in this
+# field. While a compaction runs, a column being moved has its target field
+# in `compacted_field`, and marked records are read from there. Once it
+# finishes, columns with a default are marked `default_filled`: every record
+# then stores its own value, and the default only serves later inserts.
+LAYOUT_FIELD = "_layout"
+
+# pandas.api.types.infer_dtype results and BSON $type names mapped to the
+# registry's dtypes; anything not listed is "mixed".
+INFERRED_DTYPES = {
+    "integer": "integer",
+    "floating": "float",
+    "mixed-integer-float": "float",
+    "decimal": "float",
+    "boolean": "boolean",
+    "datetime": "datetime",
+    "datetime64": "datetime",
+    "date": "datetime",
+    "string": "string",
+    "empty": None,
+}
+BSON_DTYPES = {
+    "int": "integer",
+    "long": "integer",
+    "double": "float",
+    "decimal": "float",
+    "bool": "boolean",
+    "date": "datetime",
+    "string": "string",
+    "null": None,
+    "missing": None,
+}
+
+
+def merge_dtype(current, new):
+    """
+    Combine two inferred dtypes of the same column; None means no values yet.
+    """
+    if current is None or current == new:
+        return new
+    if new is None:
+        return current
+    if {current, new} == {"integer", "float"}:
+        return "float"
+    return "mixed"
+
+
+def track_chunk_dtypes(columns, chunk):
+    """
+    Fold the dtypes of a DataFrame chunk into `columns` (name -> dtype),
+    adding columns in the order they first appear.
+    """
+    for name in chunk.columns:
+        inferred = pd.api.types.infer_dtype(chunk[name], skipna=True)
+        dtype = INFERRED_DTYPES.get(inferred, "mixed")
+        columns[str(name)] = merge_dtype(columns.get(str(name)), dtype)
+
+
+def value_dtype(value):
+    """
+    Registry dtype of a single value, such as a column's default.
+    """
+    if value is None:
+        return "empty"
+    return INFERRED_DTYPES.get(pd.api.types.infer_dtype([value]), "mixed")
+
+
+def bump_schema_version():
+    """
+    Increment the schema version so every process reloads its registry.
+    """
+    try:
+        document = meta.find_one_and_update(
+            {"_id": scoped_name(SCHEMA_VERSION_ID)},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except Exception as e:
+        raise ValueError(f"Error updating schema version in MongoDB: {str(e)}")
+    invalidate_schema_cache()
+    return document["version"]
+
+
+def write_column_schema(columns, collection=column_schema):
+    """
+    Replace the registry with `columns` (name -> dtype, in column order),
+    each stored under a field of the same name. Uploads write the registry
+    of the new table to a staging `collection` that is swapped in with it;
+    the schema version is only bumped for the live registry.
+    """
+    operations = [DeleteMany({"name": {"$nin": list(columns)}})]
+    operations += [
+        UpdateOne(
+            {"name": name},
+            {
+                "$set": {
+                    "order": order,
+                    "dtype": dtype or "empty",
+                    "field": name,
+                    "default": None,
+                },
+                "$unset": {
+                    "compacted_field": "",
+                    "compacted_layout": "",
+                    "default_filled": "",
+                },
+            },
+            upsert=True,
+        )
+        for order, (name, dtype) in enumerate(columns.items())
+    ]
+    try:
+        collection.create_indexes(SCHEMA_INDEXES)
+        collection.bulk_write(operations, ordered=True)
+    except Exception as e:
+        raise ValueError(f"Error writing column schema to MongoDB: {str(e)}")
+    if collection is not column_schema:
+        return None
+    return bump_schema_version()
+
+
+def rebuild_column_schema():
+    """
+    Rebuild the registry from the records themselves: the first document's
+    fields in order, then any others, with dtypes from the BSON types stored.
+    Used for tables loaded before the registry existed.
+    """
+    pipeline = [
+        {"$project": {"_id": 0, "fields": {"$objectToArray": "$$ROOT"}}},
+        {"$unwind": "$fields"},
+        {
+            "$group": {
+                "_id": "$fields.k",
+                "types": {"$addToSet": {"$type": "$fields.v"}},
+            }
+        },
+    ]
+    try:
+        first = table_data.find_one({}) or {}
+        types = {doc["_id"]: doc["types"] for doc in table_data.aggregate(pipeline)}
+    except Exception as e:
+        raise ValueError(f"Error reading columns from MongoDB: {str(e)}")
+
+    hidden = set(RECORD_FLAG_FIELDS) | {"_id", LAYOUT_FIELD}
+    names = [name for name in first if name in types]
+    names += sorted(set(types) - set(names))
+    columns = {}
+    for name in names:
+        if name in hidden:
+            continue
+        dtype = None
+        for bson_type in types[name]:
+            dtype = merge_dtype(dtype, BSON_DTYPES.get(bson_type, "mixed"))
+        columns[name] = dtype
+    return write_column_schema(columns)
+
+
+def add_schema_column(name, default=None):
+    """
+    Add a column whose records all read as `default`. The column gets a new
+    physical field that no record has yet, so no record is rewritten. Adding
+    an existing column resets it the same way.
+    """
+    try:
+        last = column_schema.find_one({}, sort=[("order", -1)])
+        column_schema.update_one(
+            {"name": name},
+            {
+                "$set": {
+                    "dtype": value_dtype(default),
+                    "field": f"{name}__{ObjectId()}",
+                    "default": default,
+                },
+                "$unset": {
+                    "compacted_field": "",
+                    "compacted_layout": "",
+                    "default_filled": "",
+                },
+                "$setOnInsert": {"order": last["order"] + 1 if last else 0},
+            },
+            upsert=True,
+        )
+    except Exception as e:
+        raise ValueError(f"Error adding column to schema in MongoDB: {str(e)}")
+    return bump_schema_version()
+
+
+def rename_schema_column(old_name, new_name):
+    """
+    Rename a column, replacing any column already called `new_name`. The
+    values stay in their physical field, so no record is rewritten. Returns
+    False if there is no column called `old_name`.
+    """
+    try:
+        if not column_schema.find_one({"name": old_name}, {"_id": 1}):
+            return False
+        if old_name == new_name:
+            return True
+        column_schema.delete_one({"name": new_name})
+        column_schema.update_one({"name": old_name}, {"$set": {"name": new_name}})
+    except Exception as e:
+        raise ValueError(f"Error renaming column in schema in MongoDB: {str(e)}")
+    bump_schema_version()
+    return True
+
+
+# dataset -> {"version": ..., "columns": ..., "checked_at": ...}
+_schema_caches = {}
+_schema_lock = threading.Lock()
+
+
+def _schema_cache():
+    """
+    This process's cached registry of the current dataset; call with
+    _schema_lock held.
+    """
+    return _schema_caches.setdefault(
+        current_dataset(), {"version": None, "columns": None, "checked_at": 0.0}
+    )
+
+
+def invalidate_schema_cache():
+    with _schema_lock:
+        _schema_cache()["checked_at"] = 0.0
+
+
+def _load_columns():
+    """
+    The registered columns in order, with the deletion flags from
+    deleted_columns attached.
+    """
+    try:
+        flags = {
+            doc["column_name"]: doc
+            for doc in deleted_columns.find(
+                {}, {"_id": 0, "column_name": 1, "is_deleted": 1, "deleted_by_admin": 1}
+            )
+        }
+        documents = list(column_schema.find({}, {"_id": 0}).sort("order", 1))
+    except Exception as e:
+        raise ValueError(f"Error reading column schema from MongoDB: {str(e)}")
+    for document in documents:
+        flag = flags.get(document["name"], {})
+        document.setdefault("field", document["name"])
+        document.setdefault("default", None)
+        document["is_deleted"] = flag.get("is_deleted", False)
+        document["deleted_by_admin"] = flag.get("deleted_by_admin")
+    return documents
+
+
+def schema_columns():
+    """
+    The registry entries, including their physical fields, from this
+    process's cache. The cached copy is used as is for COLUMN_SCHEMA_TTL
+    seconds, then kept only if the schema version in MongoDB hasn't moved.
+    Changes made in this process reload it at once.
+    """
+    with _schema_lock:
+        cache = _schema_cache()
+        age = time.monotonic() - cache["checked_at"]
+        if cache["columns"] is not None and age < settings.COLUMN_SCHEMA_TTL:
+            return cache["columns"]
+
+    try:
+        document = meta.find_one({"_id": scoped_name(SCHEMA_VERSION_ID)})
+    except Exception as e:
+        raise ValueError(f"Error reading schema version from MongoDB: {str(e)}")
+    version = document["version"] if document else rebuild_column_schema()
+
+    with _schema_lock:
+        if cache["version"] == version:
+            cache["checked_at"] = time.monotonic()
+            return cache["columns"]
+
+    columns = _load_columns()
+    with _schema_lock:
+        cache.update(
+            version=version, columns=columns, checked_at=time.monotonic()
+        )
+    return columns
+
+
+def column_registry():
+    """
+    The table's columns as the API shows them.
+    """
+    return [
+        {
+            "name": column["name"],
+            "order": column["order"],
+            "dtype": column["dtype"],
+            "default": column["default"],
+            "is_deleted": column["is_deleted"],
+            "deleted_by_admin": column["deleted_by_admin"],
+        }
+        for column in schema_columns()
+    ]
+
+
+def schema_column_names():
+    """
+    Names of the registered columns, for validating record edits.
+    """
+    return frozenset(column["name"] for column in schema_columns())
+
+
+def columns_by_name():
+    return {column["name"]: column for column in schema_columns()}
+
+
+def stored_fields(columns):
+    """
+    Physical fields to project to read `columns`, in any record layout.
+    """
+    fields = {LAYOUT_FIELD}
+    for column in columns:
+        fields.add(column["field"])
+        if column.get("compacted_layout"):
+            fields.add(column["compacted_field"])
+    return fields
+
+
+def _source_field(column, document):
+    layout = column.get("compacted_layout")
+    if layout and document.get(LAYOUT_FIELD) == layout:
+        return column["compacted_field"]
+    return column["field"]
+
+
+def read_record(document, columns):
+    """
+    Map a stored document to `columns` by name, filling in defaults. `_id`
+    and the record flags are passed through; other stored fields are not.
+    """
+    record = {"_id": document["_id"]} if "_id" in document else {}
+    for column in columns:
+        record[column["name"]] = document.get(
+            _source_field(column, document), column["default"]
+        )
+    for flag in RECORD_FLAG_FIELDS:
+        if flag in document:
+            record[flag] = document[flag]
+    return record
+
+
+def record_update(changes, columns=None):
+    """
+    Update spec setting `changes` (column name -> value) on a record. While a
+    compaction is moving one of the columns it is a pipeline that writes to
+    the field matching the record's layout; otherwise a plain $set.
+    """
+    columns = columns or columns_by_name()
+    settled, old_layout, new_layout = {}, {}, {}
+    layout = None
+    for name, value in changes.items():
+        column = columns[name]
+        if (
+            column.get("compacted_layout")
+            and column["compacted_field"] != column["field"]
+        ):
+            layout = column["compacted_layout"]
+            old_layout[column["field"]] = value
+            new_layout[column["compacted_field"]] = value
+        else:
+            settled[column["field"]] = value
+    if layout is None:
+        return {"$set": settled}
+
+    def merged(fields):
+        return {"$mergeObjects": ["$$ROOT", {"$literal": {**settled, **fields}}]}
+
+    is_compacted = {"$eq": [f"${LAYOUT_FIELD}", {"$literal": layout}]}
+    return [
+        {
+            "$replaceWith": {
+                "$cond": [is_compacted, merged(new_layout), merged(old_layout)]
+            }
+        }
+    ]
+
+
+def stored_document(fields, columns=None):
+    """
+    The document to insert for a new record with `fields` (column name ->
+    value). While a compaction runs it is written in the compacted layout.
+    """
+    columns = columns or columns_by_name()
+    layouts = {
+        c["compacted_layout"] for c in columns.values() if c.get("compacted_layout")
+    }
+    layout = layouts.pop() if layouts else None
+    document = {}
+    for name, value in fields.items():
+        column = columns[name]
+        if layout and column.get("compacted_layout") == layout:
+            document[column["compacted_field"]] = value
+        else:
+            document[column["field"]] = value
+    if layout:
+        document[LAYOUT_FIELD] = layout
+    return document
+
+
+def sort_field(name, columns=None):
+    """
+    Physical field to sort on for a column name. During a compaction, a
+    column being moved sorts records that were already moved as if empty.
+    """
+    columns = columns or columns_by_name()
+    return columns[name]["field"] if name in columns else name
+
+
+def start_compaction():
+    """
+    Mark the columns stored under another field, or whose default hasn't
+    been written into the records yet, as moving to a new layout and return
+    its ID. A compaction that didn't
+    finish is resumed instead. Returns None if there is nothing to compact.
+    """
+    try:
+        documents = list(column_schema.find({}))
+        pending = {
+            d["compacted_layout"] for d in documents if d.get("compacted_layout")
+        }
+        if pending:
+            return pending.pop()
+        moving = [
+            d["name"]
+            for d in documents
+            if d.get("field", d["name"]) != d["name"]
+            or (d.get("default") is not None and not d.get("default_filled"))
+        ]
+        if not moving:
+            return None
+        layout = str(ObjectId())
+        column_schema.bulk_write(
+            [
+                UpdateOne(
+                    {"name": name},
+                    {"$set": {"compacted_field": name, "compacted_layout": layout}},
+                )
+                for name in moving
+            ]
+        )
+    except Exception as e:
+        raise ValueError(f"Error starting column compaction in MongoDB: {str(e)}")
+    bump_schema_version()
+    return layout
+
+
+def compaction_pipeline(moving, layout):
+    """
+    Update pipeline rewriting a record into `layout`: each moving column's
+    value (or its default) is written to its compacted field and the old
+    fields are removed. Other fields are left as they are.
+    """
+    removed = sorted(
+        {column["field"] for column in moving}
+        | {column["compacted_field"] for column in moving}
+    )
+    kept = {
+        "$arrayToObject": {
+            "$filter": {
+                "input": {"$objectToArray": "$$ROOT"},
+                "cond": {"$not": [{"$in": ["$$this.k", removed]}]},
+            }
+        }
+    }
+    values = []
+    for column in moving:
+        value = {
+            "$getField": {"field": {"$literal": column["field"]}, "input": "$$ROOT"}
+        }
+        values.append(
+            {
+                "k": {"$literal": column["compacted_field"]},
+                "v": {
+                    "$cond": [
+                        {"$eq": [{"$type": value}, "missing"]},
+                        {"$literal": column["default"]},
+                        value,
+                    ]
+                },
+            }
+        )
+    return [
+        {
+            "$replaceWith": {
+                "$mergeObjects": [
+                    kept,
+                    {"$arrayToObject": [values]},
+                    {LAYOUT_FIELD: {"$literal": layout}},
+                ]
+            }
+        }
+    ]
+
+
+def _compact_batch(ids, layout):
+    """
+    Rewrite the records in `ids` that aren't in `layout` yet. The moving
+    columns are re-read for every batch, so renames and additions made in
+    the meantime are respected.
+    """
+    moving = list(column_schema.find({"compacted_layout": layout}))
+    if not moving:
+        raise ValueError("The column schema was replaced while compacting")
+    result = table_data.update_many(
+        {"_id": {"$in": ids}, LAYOUT_FIELD: {"$ne": layout}},
+        compaction_pipeline(moving, layout),
+    )
+    return result.modified_count
+
+
+def compact_columns(progress=None):
+    """
+    Rewrite every record so each column is stored under its own name with
+    its default filled in, then point the registry at those fields.
+
+    Processes pick up the new layout on their next registry check, so the
+    rewrite starts after COLUMN_SCHEMA_TTL seconds; from then on, edits and
+    inserts made anywhere handle both layouts. Records are rewritten in
+    `_id` order in batches of COMPACTION_BATCH_SIZE, then any stragglers
+    (inserted behind the scan) are picked up before the registry is switched.
+    """
+    layout = start_compaction()
+    if layout is None:
+        return {"rows_compacted": 0}
+    time.sleep(settings.COLUMN_SCHEMA_TTL)
+
+    batch_size = settings.COMPACTION_BATCH_SIZE
+    try:
+        total = table_data.estimated_document_count()
+        compacted = 0
+        last_id = None
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id else {}
+            ids = [
+                doc["_id"]
+                for doc in table_data.find(query, {"_id": 1})
+                .sort("_id", 1)
+                .limit(batch_size)
+            ]
+            if not ids:
+                break
+            compacted += _compact_batch(ids, layout)
+            last_id = ids[-1]
+            if progress:
+                progress(compacted, total)
+
+        while True:
+            ids = [
+                doc["_id"]
+                for doc in table_data.find(
+                    {LAYOUT_FIELD: {"$ne": layout}}, {"_id": 1}
+                ).limit(batch_size)
+            ]
+            if not ids:
+                break
+            compacted += _compact_batch(ids, layout)
+
+        column_schema.update_many(
+            {"compacted_layout": layout},
+            [
+                {
+                    "$set": {
+                        "field": "$compacted_field",
+                        "default_filled": {"$ne": ["$default", None]},
+                    }
+                },
+                {"$unset": ["compacted_field", "compacted_layout"]},
+            ],
+        )
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Error compacting columns in MongoDB: {str(e)}")
+    bump_schema_version()
+    return {"rows_compacted": compacted}
@@ -1,7 +1,67 @@
+import numpy as np
 import pandas as pd
-from bson import ObjectId
-import math
-from .models import table_data, deleted_columns
+from bson import Decimal128, ObjectId, json_util
+from datetime import datetime
+import base64
+import contextvars
+import os
+import pymongo
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from openpyxl import load_workbook
+from pymongo import InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+from .indexes import (
+    COLUMN_FLAGS_MATCH,
+    SCHEMA_INDEXES,
+    ensure_column_indexes,
+    ensure_record_indexes,
+)
+from .schema import (
+    LAYOUT_FIELD,
+    add_schema_column,
+    bump_schema_version,
+    column_registry,
+    columns_by_name,
+    read_record,
+    rebuild_column_schema,
+    record_update,
+    schema_column_names,
+    schema_columns,
+    sort_field,
+    stored_document,
+    stored_fields,
+    track_chunk_dtypes,
+    write_column_schema,
+)
+from .models import (
+    RECORD_FLAG_FIELDS,
+    db,
+    get_db,
+    pool_metrics,
+    table_data,
+    table_data_reads,
+    deleted_columns,
+    deleted_columns_reads,
+    column_schema,
+    scoped_name,
+    STAGING_PREFIX,
+    COLUMN_SCHEMA_STAGING_PREFIX,
+    VERSION_PREFIX,
+    DELETED_COLUMNS_VERSION_PREFIX,
+    COLUMN_SCHEMA_VERSION_PREFIX,
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Records that haven't been soft-deleted or deleted by an admin
+LIVE_RECORDS_FILTER = {"is_deleted": {"$ne": True}, "deleted_by_admin": {"$ne": True}}
 
 
 # def process_excel_file(file):
@@ -16,167 +76,920 @@ from .models import table_data, deleted_columns
 #     except Exception as e:
 #         raise ValueError(f"Error reading Excel file: {str(e)}")
 
-def process_csv_file(file):
-    # Read the CSV file into a DataFrame using pandas
-    df = pd.read_csv(file)
-    # Convert DataFrame to a list of dictionaries for MongoDB insertion
-    records = df.to_dict(orient="records")
-    return records
+def iter_csv_chunks(file, delimiter=",", chunksize=None):
+    """
+    Read a CSV (or TSV) file lazily, yielding DataFrames of at most `chunksize` rows.
+    """
+    chunksize = chunksize or settings.UPLOAD_CHUNK_SIZE
+    with pd.read_csv(file, delimiter=delimiter, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def iter_tsv_chunks(file, chunksize=None):
+    return iter_csv_chunks(file, delimiter="\t", chunksize=chunksize)
+
 
+def excel_column_names(header):
+    """
+    Column names for a sheet's header row, as pandas.read_excel gives them:
+    empty cells become "Unnamed: <index>" and repeated names get ".1", ".2",
+    ... so no column is lost when rows become dicts.
+    """
+    names = [
+        str(name) if name is not None else f"Unnamed: {index}"
+        for index, name in enumerate(header)
+    ]
+    unnamed = [index for index, name in enumerate(header) if name is None]
+    named = [index for index, name in enumerate(header) if name is not None]
+    counts = {}
+    # Named columns first, so they keep their names over unnamed ones
+    for index in named + unnamed:
+        name = original = names[index]
+        count = counts.get(name, 0)
+        while count:
+            counts[original] = count + 1
+            name = f"{original}.{count}"
+            # Skip suffixes the header already uses, like pandas
+            count = count + 1 if name in names else counts.get(name, 0)
+        names[index] = name
+        counts[name] = count + 1
+    return names
+
+
+def iter_excel_chunks(file, chunksize=None):
+    """
+    Stream the first sheet of an .xlsx file with openpyxl's read-only mode,
+    yielding DataFrames of at most `chunksize` rows. The first row is the header;
+    values in columns to the right of it get unnamed columns of their own.
+    """
+    chunksize = chunksize or settings.UPLOAD_CHUNK_SIZE
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.active
+        header = next(worksheet.iter_rows(max_row=1, values_only=True), None)
+        if header is None:
+            return
+        header = list(header)
+        # Read-only sheets pad rows with empty cells up to the sheet's width
+        while header and header[-1] is None:
+            header.pop()
+        columns = excel_column_names(header)
 
-def process_excel_file(file):
-    # Read the Excel file into a DataFrame using pandas
+        def frame(rows):
+            width = len(columns)
+            rows = [row[:width] + (None,) * (width - len(row)) for row in rows]
+            return pd.DataFrame.from_records(rows, columns=columns)
+
+        batch = []
+        for row in worksheet.iter_rows(min_row=2, values_only=True):
+            # Read-only sheets report trailing formatted-but-empty rows too
+            if all(value is None for value in row):
+                continue
+            width = max(i for i, value in enumerate(row) if value is not None) + 1
+            if width > len(header):
+                header += [None] * (width - len(header))
+                columns = excel_column_names(header)
+            batch.append(row)
+            if len(batch) >= chunksize:
+                yield frame(batch)
+                batch = []
+        if batch:
+            yield frame(batch)
+    finally:
+        workbook.close()
+
+
+def iter_xls_chunks(file, chunksize=None):
+    """
+    Legacy .xls files can't be streamed by openpyxl; the format is capped at
+    65,536 rows, so read it whole and hand it out in chunks like the others.
+    """
+    chunksize = chunksize or settings.UPLOAD_CHUNK_SIZE
     df = pd.read_excel(file)
-    # Convert DataFrame to a list of dictionaries for MongoDB insertion
-    records = df.to_dict(orient="records")
-    return records
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start : start + chunksize]
+
+
+UPLOAD_EXTENSIONS = (".xlsx", ".xls", ".csv", ".tsv")
+
+
+def iter_upload_chunks(file, file_name):
+    """
+    Pick the chunk reader for an uploaded file by its extension.
+    Returns None for unsupported formats.
+    """
+    if file_name.endswith(".xlsx"):
+        return iter_excel_chunks(file)
+    if file_name.endswith(".xls"):
+        return iter_xls_chunks(file)
+    if file_name.endswith(".csv"):
+        return iter_csv_chunks(file)
+    if file_name.endswith(".tsv"):
+        return iter_tsv_chunks(file)
+    return None
+
+
+def bson_values(series):
+    """
+    The values of a DataFrame column as BSON-native Python values, with NaN,
+    NaT and +/-Inf replaced by None. The missing values are found with one
+    vectorized mask per column instead of a check per cell.
+    """
+    if series.dtype.kind == "M":
+        values = series.array.to_pydatetime().tolist()
+        missing = series.isna().to_numpy()
+    elif series.dtype.kind == "f":
+        array = series.to_numpy()
+        values = array.tolist()
+        missing = ~np.isfinite(array)
+    elif series.dtype.kind in "iub" and not pd.api.types.is_extension_array_dtype(
+        series.dtype
+    ):
+        return series.tolist()
+    else:
+        array = series.to_numpy(dtype=object)
+        values = array.tolist()
+        missing = pd.isna(array)
+        # Inf can hide in object columns too; pd.NA can't be compared, so skip it
+        present = np.flatnonzero(~missing)
+        infinite = np.isin(array[present], [np.inf, -np.inf])
+        missing[present[infinite]] = True
+    for index in np.flatnonzero(missing):
+        values[index] = None
+    return values
 
 
-def process_tsv_file(file):
-    # Read the TSV file into a DataFrame using pandas
-    df = pd.read_csv(file, delimiter="\t")
-    # Convert DataFrame to a list of dictionaries for MongoDB insertion
-    records = df.to_dict(orient="records")
-    return records
+def chunk_to_records(chunk):
+    """
+    Convert a DataFrame chunk to a list of dictionaries for MongoDB insertion,
+    with string column names and sanitized values (see bson_values). Records
+    are stored clean, so reads don't need to fix up values.
+    """
+    columns = [str(column) for column in chunk.columns]
+    values = [bson_values(chunk.iloc[:, index]) for index in range(len(columns))]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB, or None where unavailable.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
 
 
-def clear_existing_records():
+def ingest_chunks(chunks, collection=table_data, progress=None, columns=None):
     """
-    Clear existing records from the MongoDB collection.
+    Sanitize and insert each chunk as soon as it is read, so memory stays
+    bounded by the chunk size rather than the file size.
+    `progress`, if given, is called with the running row count after each chunk.
+    `columns`, if given, is filled with each column's inferred dtype.
+    Returns the number of rows inserted, rows/sec and the peak RSS.
     """
+    started = time.perf_counter()
+    rows = 0
     try:
-        table_data.delete_many({})  # Remove all documents from the collection
+        for chunk in chunks:
+            if columns is not None:
+                track_chunk_dtypes(columns, chunk)
+            records = chunk_to_records(chunk)
+            if records:
+                insert_records(records, collection)
+                rows += len(records)
+                if progress:
+                    progress(rows)
+    except ValueError:
+        raise
     except Exception as e:
-        raise ValueError(f"Error clearing existing data in MongoDB: {str(e)}")
+        raise ValueError(f"Error processing file: {str(e)}")
 
+    elapsed = time.perf_counter() - started
+    stats = {
+        "rows_inserted": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(rows / elapsed) if elapsed else rows,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    return stats
 
-def clear_deleted_columns():
+
+def create_staging_collection(prefix=STAGING_PREFIX):
     """
-    Clear all records from the deleted_columns collection.
+    Create an empty, uniquely named collection for an upload to be written into.
     """
     try:
-        deleted_columns.delete_many(
-            {}
-        )  # Delete all documents in the deleted_columns collection
+        return db.create_collection(scoped_name(f"{prefix}{ObjectId()}"))
     except Exception as e:
-        print(f"Error clearing deleted columns from MongoDB: {str(e)}")
+        raise ValueError(f"Error creating staging collection in MongoDB: {str(e)}")
+
+
+def list_record_versions():
+    """
+    List the archived versions of the records collection, newest first.
+    """
+    prefix = scoped_name(VERSION_PREFIX)
+    names = db.list_collection_names(
+        filter={"name": {"$regex": f"^{re.escape(prefix)}"}}
+    )
+    versions = sorted((name[len(prefix) :] for name in names), reverse=True)
+    return [
+        {"version": version, "replaced_at": ObjectId(version).generation_time}
+        for version in versions
+    ]
 
 
-def insert_records(records):
+def prune_record_versions(keep):
     """
-    Insert records into MongoDB.
+    Drop all but the `keep` newest archived versions.
     """
+    for entry in list_record_versions()[keep:]:
+        for prefix in (
+            VERSION_PREFIX,
+            DELETED_COLUMNS_VERSION_PREFIX,
+            COLUMN_SCHEMA_VERSION_PREFIX,
+        ):
+            db.drop_collection(scoped_name(f"{prefix}{entry['version']}"))
+
+
+def archive_collection(collection, name):
+    """
+    Copy a collection aside under `name` with $out, on the server.
+    """
+    collection.aggregate([{"$out": name}])
+
+
+def swap_in_staging(staging, staging_schema):
+    """
+    Make the staging collection the live `records` collection and the
+    staging registry the live `column_schema`.
+
+    Each swap is a renameCollection with dropTarget, so readers see either
+    the old table or the new one, never a partial or missing one, and the
+    old data is dropped as a metadata operation instead of a delete_many.
+    When UPLOAD_KEEP_VERSIONS is set, the current table (and its
+    deleted_columns and column_schema) is first copied aside as a version.
+    That copy rewrites the whole live table, since renaming it aside would
+    leave `records` missing until the staging collection is renamed in.
+    Should swapping in the registry fail, it is rebuilt from the new
+    records so it never describes the old table.
+    """
+    keep = settings.UPLOAD_KEEP_VERSIONS
     try:
-        table_data.insert_many(records)
+        existing = set(db.list_collection_names())
+        if keep and table_data.name in existing:
+            version = str(ObjectId())
+            if deleted_columns.name in existing:
+                archive_collection(
+                    deleted_columns,
+                    scoped_name(f"{DELETED_COLUMNS_VERSION_PREFIX}{version}"),
+                )
+            if column_schema.name in existing:
+                archive_collection(
+                    column_schema,
+                    scoped_name(f"{COLUMN_SCHEMA_VERSION_PREFIX}{version}"),
+                )
+            archive_collection(table_data, scoped_name(f"{VERSION_PREFIX}{version}"))
+        staging.rename(table_data.name, dropTarget=True)
     except Exception as e:
-        raise ValueError(f"Error inserting data into MongoDB: {str(e)}")
+        raise ValueError(f"Error swapping in uploaded data in MongoDB: {str(e)}")
+
+    try:
+        deleted_columns.drop()
+        staging_schema.rename(column_schema.name, dropTarget=True)
+    except Exception as e:
+        print(f"Error swapping in column schema in MongoDB: {str(e)}")
+        staging_schema.drop()
+        rebuild_column_schema()
+    else:
+        bump_schema_version()
 
+    # deleted_columns starts empty again and needs its indexes back
+    ensure_column_indexes()
 
-def fetch_all_deleted_column_names():
+    prune_record_versions(keep)
+
+
+def replace_records(chunks, progress=None):
+    """
+    Load the chunks into a staging collection, and their column registry
+    into another, and swap both in. If anything fails before the swap the
+    staging collections are dropped and the live table is left untouched.
+    """
+    staging = create_staging_collection()
+    staging_schema = None
+    columns = {}
+    try:
+        stats = ingest_chunks(chunks, staging, progress, columns)
+        # Indexes are built once after the bulk load instead of during it
+        ensure_record_indexes(staging)
+        staging_schema = create_staging_collection(COLUMN_SCHEMA_STAGING_PREFIX)
+        write_column_schema(columns, staging_schema)
+        swap_in_staging(staging, staging_schema)
+    except ValueError:
+        staging.drop()
+        if staging_schema is not None:
+            staging_schema.drop()
+        raise
+    return stats
+
+
+def rollback_records(version=None):
     """
-    Fetch all column names from documents where 'is_deleted' is True.
+    Swap an archived version (the newest by default) back in as `records`,
+    replacing the current table.
     """
+    versions = [entry["version"] for entry in list_record_versions()]
+    if not versions:
+        raise ValueError("No previous version available to roll back to")
+    version = version or versions[0]
+    if version not in versions:
+        raise ValueError(f"Version '{version}' not found")
+
     try:
-        # Fetch all records where is_deleted is True
-        deleted_columns_list = deleted_columns.find(
-            {"is_deleted": True}, {"_id": 0, "column_name": 1}
+        existing = set(db.list_collection_names())
+        archived_deleted_columns = scoped_name(
+            f"{DELETED_COLUMNS_VERSION_PREFIX}{version}"
         )
+        if archived_deleted_columns in existing:
+            db[archived_deleted_columns].rename(deleted_columns.name, dropTarget=True)
+        else:
+            deleted_columns.drop()
+        archived_schema = scoped_name(f"{COLUMN_SCHEMA_VERSION_PREFIX}{version}")
+        if archived_schema in existing:
+            db[archived_schema].rename(column_schema.name, dropTarget=True)
+        else:
+            column_schema.drop()
+        # Versions are copied aside without their indexes
+        archived = db[scoped_name(f"{VERSION_PREFIX}{version}")]
+        ensure_record_indexes(archived)
+        archived.rename(table_data.name, dropTarget=True)
+    except Exception as e:
+        raise ValueError(f"Error rolling back records in MongoDB: {str(e)}")
+
+    ensure_column_indexes()
+    if archived_schema in existing:
+        column_schema.create_indexes(SCHEMA_INDEXES)
+        bump_schema_version()
+    else:
+        # Versions archived before the registry existed
+        rebuild_column_schema()
+
+    return {"message": f"Records rolled back to version '{version}'"}
 
-        # Extract the column_name from each document
-        column_names = [doc["column_name"] for doc in deleted_columns_list]
-        print(column_names)
-        return column_names
 
+def insert_records(records, collection=table_data):
+    """
+    Insert records into MongoDB as an unordered bulk write.
+    """
+    try:
+        collection.insert_many(records, ordered=False)
     except Exception as e:
-        print(f"Error fetching deleted columns from MongoDB: {str(e)}")
-        return []
+        raise ValueError(f"Error inserting data into MongoDB: {str(e)}")
+
 
-def fetch_all_deleted_by_admin_column_names():
+def chunked(values, size):
     """
-    Fetch all column names from documents where 'deleted_by_admin' is True.
+    Split `values` into lists of at most `size` items.
     """
+    values = list(values)
+    return [values[start : start + size] for start in range(0, len(values), size)]
+
+
+def run_bulk_writes(collection, operations, batch_size=None):
+    """
+    Send write operations to MongoDB in unordered bulk_write calls of at most
+    `batch_size` operations. Returns the summed counts and the failed
+    operations as {"index", "message"}, indexed into `operations`.
+    """
+    batch_size = batch_size or settings.BULK_WRITE_BATCH_SIZE
+    totals = new_write_totals()
+    for batch_number, batch in enumerate(chunked(operations, batch_size)):
+        try:
+            result = collection.bulk_write(batch, ordered=False)
+            counts = result.bulk_api_result
+        except BulkWriteError as e:
+            # Unordered: the rest of the batch was still applied
+            counts = e.details
+        except Exception as e:
+            raise ValueError(f"Error running bulk write in MongoDB: {str(e)}")
+        add_write_counts(totals, counts, batch_number * batch_size)
+    return totals
+
+
+def new_write_totals():
+    return {
+        "matched_count": 0,
+        "modified_count": 0,
+        "inserted_count": 0,
+        "upserted_count": 0,
+        "errors": [],
+    }
+
+
+def add_write_counts(totals, counts, offset):
+    """
+    Add a bulk write result (or BulkWriteError details) to `totals`; the
+    indexes of failed operations are shifted by the batch's `offset`.
+    """
+    totals["matched_count"] += counts.get("nMatched", 0)
+    totals["modified_count"] += counts.get("nModified", 0)
+    totals["inserted_count"] += counts.get("nInserted", 0)
+    totals["upserted_count"] += counts.get("nUpserted", 0)
+    totals["errors"].extend(
+        {"index": offset + error["index"], "message": error["errmsg"]}
+        for error in counts.get("writeErrors", [])
+    )
+
+
+def update_changes(document, update):
+    """
+    Whether applying a $set/$unset `update` would change `document`.
+    """
+    for field, value in update.get("$set", {}).items():
+        if field not in document or document[field] != value:
+            return True
+    return any(field in document for field in update.get("$unset", {}))
+
+
+def bulk_update_by_key(collection, key, values, update, chunk_size=None):
+    """
+    Apply `update` to every document whose `key` is in `values`, as UpdateMany
+    operations over `$in` lists of at most `chunk_size` values sent with
+    run_bulk_writes.
+
+    Returns the totals and a (value, matched, modified) tuple per distinct
+    value. The per-value flags come from reading the documents just before
+    the write, so a concurrent change can make them differ from the totals.
+    """
+    chunks = chunked(dict.fromkeys(values), chunk_size or settings.BULK_IN_CHUNK_SIZE)
+    projection = update_projection(key, update)
+
+    current = {}
     try:
-        # Fetch all records where deleted_by_admin is True
-        deleted_by_admin_columns_list = deleted_columns.find(
-            {"deleted_by_admin": True}, {"_id": 0, "column_name": 1}
+        for chunk in chunks:
+            for document in collection.find({key: {"$in": chunk}}, projection):
+                current[document[key]] = document
+    except Exception as e:
+        raise ValueError(f"Error reading documents to update in MongoDB: {str(e)}")
+
+    operations = [UpdateMany({key: {"$in": chunk}}, update) for chunk in chunks]
+    totals = run_bulk_writes(collection, operations)
+    return totals, bulk_update_results(chunks, current, update, totals)
+
+
+def update_projection(key, update):
+    """
+    Fields to read before applying `update`, to tell which documents change.
+    """
+    projection = {field: 1 for fields in update.values() for field in fields}
+    projection[key] = 1
+    return projection
+
+
+def bulk_update_results(chunks, current, update, totals):
+    """
+    The (value, matched, modified) tuples of bulk_update_by_key, from the
+    documents read before the write (`current`, by key value).
+    """
+    if totals["errors"]:
+        raise ValueError(
+            f"Error updating documents in MongoDB: {totals['errors'][0]['message']}"
         )
+    results = []
+    for chunk in chunks:
+        for value in chunk:
+            document = current.get(value)
+            modified = document is not None and update_changes(document, update)
+            results.append((value, document is not None, modified))
+    return results
 
-        # Extract the column_name from each document
-        column_names = [doc["column_name"] for doc in deleted_by_admin_columns_list]
-        print(column_names)
-        return column_names
 
+_COLUMN_NAME_ONLY = {"$project": {"_id": 0, "column_name": 1}}
+COLUMN_FLAGS_PIPELINE = [
+    {"$match": COLUMN_FLAGS_MATCH},
+    {
+        "$facet": {
+            "deleted_columns": [{"$match": {"is_deleted": True}}, _COLUMN_NAME_ONLY],
+            "deleted_by_admin_columns": [
+                {"$match": {"deleted_by_admin": True}},
+                _COLUMN_NAME_ONLY,
+            ],
+            "rejected_by_admin_columns": [
+                {"$match": {"deleted_by_admin": False}},
+                _COLUMN_NAME_ONLY,
+            ],
+        }
+    },
+]
+
+# Only `_id` and the flag of the records an admin has reviewed
+RECORD_FLAGS_QUERY = {"deleted_by_admin": {"$in": [True, False]}}
+RECORD_FLAGS_PROJECTION = {"_id": 1, "deleted_by_admin": 1}
+
+
+def fetch_column_flags(collection=deleted_columns_reads):
+    """
+    Fetch the soft-deleted, deleted-by-admin and rejected-by-admin column names
+    with a single $facet aggregation over the deleted_columns collection.
+    """
+    try:
+        facets = next(collection.aggregate(COLUMN_FLAGS_PIPELINE), {})
     except Exception as e:
-        print(f"Error fetching deleted columns from MongoDB: {str(e)}")
-        return []
-    
-def fetch_all_rejected_by_admin_column_names():
+        raise ValueError(f"Error fetching deleted columns from MongoDB: {str(e)}")
+    return column_flags_from_facets(facets)
+
+
+def column_flags_from_facets(facets):
+    return {
+        key: [doc["column_name"] for doc in facets.get(key, [])]
+        for key in (
+            "deleted_columns",
+            "deleted_by_admin_columns",
+            "rejected_by_admin_columns",
+        )
+    }
+
+
+def fetch_record_flags(collection=table_data_reads):
+    """
+    Fetch the IDs of records approved or rejected for deletion by an admin,
+    reading only `_id` and the flag of the flagged records in one query.
+    """
     try:
-        # Fetch all records where deleted_by_admin is True
-        rejected_by_admin_columns_list = deleted_columns.find(
-            {"deleted_by_admin": False}, {"_id": 0, "column_name": 1}
+        return record_flags_from(
+            collection.find(RECORD_FLAGS_QUERY, RECORD_FLAGS_PROJECTION)
         )
-        column_names = [doc["column_name"] for doc in rejected_by_admin_columns_list]
-        print(column_names)
-        return column_names
-
-    except Exception as e:
-        print(f"Error fetching deleted columns from MongoDB: {str(e)}")
-        return []
-    
-def sanitize_data(data):
-    if isinstance(data, list):
-        return [sanitize_data(item) for item in data]
-    elif isinstance(data, dict):
-        return {key: sanitize_data(value) for key, value in data.items()}
-    elif isinstance(data, float) and (math.isnan(data) or math.isinf(data)):
+    except Exception as e:
+        raise ValueError(f"Error fetching flagged records from MongoDB: {str(e)}")
+
+
+def record_flags_from(documents):
+    flags = {"deleted_by_admin_records": [], "rejected_by_admin_records": []}
+    for doc in documents:
+        key = (
+            "deleted_by_admin_records"
+            if doc["deleted_by_admin"]
+            else "rejected_by_admin_records"
+        )
+        flags[key].append(str(doc["_id"]))
+    return flags
+
+
+def clean_record(record):
+    """
+    Make a record JSON-safe by stringifying its ObjectId. Values are already
+    sanitized at ingestion (see chunk_to_records); records stored before that
+    are fixed by `manage.py sanitize_legacy_records`.
+    """
+    record["_id"] = str(record["_id"])  # Convert ObjectId to string
+    return record
+
+
+def parse_sort(sort):
+    """
+    Parse a sort string such as "-Amount,Name" into pymongo sort keys.
+    `_id` is always appended as a tie-breaker so the order is total.
+    """
+    sort_keys = []
+    for field in filter(None, (part.strip() for part in (sort or "").split(","))):
+        if field.startswith("-"):
+            sort_keys.append((field[1:], pymongo.DESCENDING))
+        else:
+            sort_keys.append((field.lstrip("+"), pymongo.ASCENDING))
+    if not any(field == "_id" for field, _ in sort_keys):
+        sort_keys.append(("_id", pymongo.ASCENDING))
+    return sort_keys
+
+
+def encode_cursor(sort_keys, record):
+    """
+    Build an opaque cursor from the sort key values of the last record on a page.
+    """
+    payload = {
+        "sort": [[field, direction] for field, direction in sort_keys],
+        "after": [record.get(field) for field, _ in sort_keys],
+    }
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor, sort_keys):
+    """
+    Return the sort key values stored in a cursor, checking it was issued for the same sort.
+    """
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+        after = payload["after"]
+        cursor_sort = [tuple(key) for key in payload["sort"]]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort_keys:
+        raise ValueError("Cursor does not match the requested sort")
+    return after
+
+
+# MongoDB orders values of different types by type first, in this order
+# (after null and missing fields), and $gt/$lt only match values of the same
+# type. Keyset filters on a column holding several types add the types that
+# sort after (or before) the cursor's value.
+BSON_TYPE_ORDER = [
+    ((int, float, Decimal128), ["number"]),
+    ((str,), ["string", "symbol"]),
+    ((dict,), ["object"]),
+    ((list,), ["array"]),
+    ((bytes,), ["binData"]),
+    ((ObjectId,), ["objectId"]),
+    ((bool,), ["bool"]),
+    ((datetime,), ["date"]),
+]
+
+
+def _type_rank(value):
+    """
+    Position of a value's type in BSON_TYPE_ORDER, or None if not listed.
+    """
+    for rank, (python_types, _) in enumerate(BSON_TYPE_ORDER):
+        # bool is an int subclass but sorts after numbers
+        if isinstance(value, python_types) and not (
+            isinstance(value, bool) and bool not in python_types
+        ):
+            return rank
+    return None
+
+
+def _past(field, direction, value):
+    """
+    Filter for documents that sort strictly after `value` on a single field,
+    including values of the types that sort after its type. Null and missing
+    values sort first ascending and last descending, as in MongoDB.
+    """
+    if direction == pymongo.ASCENDING:
+        if value is None:
+            return {field: {"$ne": None}}
+        clauses = [{field: {"$gt": value}}]
+        rank = _type_rank(value)
+        later = BSON_TYPE_ORDER[rank + 1 :] if rank is not None else []
+        if later:
+            types = [name for _, names in later for name in names]
+            clauses.append({field: {"$type": types}})
+        return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+    if value is None:
         return None
-    return data
+    clauses = [{field: {"$lt": value}}]
+    rank = _type_rank(value)
+    if rank:
+        types = [name for _, names in BSON_TYPE_ORDER[:rank] for name in names]
+        clauses.append({field: {"$type": types}})
+    return {"$or": clauses + [{field: None}]}
+
+
+def keyset_filter(sort_keys, after):
+    """
+    Filter selecting the documents that come after the `after` values in
+    `sort_keys` order, so each page is an index range scan instead of a skip.
+    """
+    branches = []
+    for index, (field, direction) in enumerate(sort_keys):
+        past = _past(field, direction, after[index])
+        if past is None:
+            continue
+        equal = [
+            {prev_field: prev_value}
+            for (prev_field, _), prev_value in zip(sort_keys[:index], after[:index])
+        ]
+        branches.append({"$and": equal + [past]} if equal else past)
+    if not branches:
+        return {"_id": {"$in": []}}
+    return branches[0] if len(branches) == 1 else {"$or": branches}
 
-def fetch_all_deleted_by_admin_record_names():
+
+def fetch_records_page(
+    limit,
+    after=None,
+    fields=None,
+    sort=None,
+    include_total=False,
+    where=None,
+    collection=table_data_reads,
+):
+    """
+    Fetch one page of records using keyset pagination on the sort keys plus `_id`.
+    Returns the cleaned records, the cursor for the next page (None on the
+    last page) and, if asked for, the collection's estimated document count
+    (the number of matching records when `where`, a compiled filter, is given).
+    Fields and sort keys are column names, mapped to stored fields through
+    the column registry.
+    """
+    plan = page_plan(limit, after, fields, sort, where)
     try:
-        # Fetch all records where deleted_by_admin is True
-        deleted_by_admin_record_list = list(
-            table_data.find({"deleted_by_admin": True}, {"_id": 0})
+        records = list(
+            collection.find(plan["query"], plan["projection"])
+            .sort(plan["sort_keys"])
+            .limit(limit + 1)
         )
-        
-        # Sanitize the data to handle any NaN or invalid values
-        sanitized_data = sanitize_data(deleted_by_admin_record_list)
-        return sanitized_data
-
+        estimated_total = None
+        if include_total:
+            estimated_total = (
+                collection.count_documents(where)
+                if where
+                else collection.estimated_document_count()
+            )
     except Exception as e:
-        print(f"Error fetching deleted records from MongoDB: {str(e)}")
-        return []
-    
-def fetch_all_rejected_by_admin_record_names():
+        raise ValueError(f"Error fetching records from MongoDB: {str(e)}")
+    return build_page(plan, records, limit, include_total, estimated_total)
+
+
+def page_plan(limit, after=None, fields=None, sort=None, where=None):
+    """
+    The query, projection and sort keys of one page, and the registry
+    entries of the selected columns. Raises ValueError on a bad cursor.
+    """
+    columns = columns_by_name()
+    sort_keys = [(sort_field(name, columns), d) for name, d in parse_sort(sort)]
+    query = keyset_filter(sort_keys, decode_cursor(after, sort_keys)) if after else {}
+    if where:
+        query = {"$and": [where, query]} if query else where
+
+    selected = schema_columns()
+    projection = None
+    if fields:
+        selected = [columns[name] for name in fields if name in columns]
+        # Sort keys are needed to build the next cursor
+        projection = dict.fromkeys(
+            stored_fields(selected) | {f for f, _ in sort_keys}, 1
+        )
+    return {
+        "query": query,
+        "projection": projection,
+        "sort_keys": sort_keys,
+        "selected": selected,
+    }
+
+
+def build_page(plan, records, limit, include_total=False, estimated_total=None):
+    """
+    Turn the (up to limit + 1) documents fetched for `plan` into a page.
+    """
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(plan["sort_keys"], records[-1])
+
+    page = {
+        "records": [clean_record(read_record(r, plan["selected"])) for r in records],
+        "next_cursor": next_cursor,
+    }
+    if include_total:
+        page["estimated_total"] = estimated_total
+    return page
+
+
+def iter_records(fields=None, sort=None, where=None, collection=table_data_reads):
+    """
+    Yield every record (or those matching `where`, a compiled filter),
+    cleaned one at a time as it comes off the cursor, so callers can stream
+    the table without holding it in memory.
+    """
+    columns = columns_by_name()
+    sort_keys = [(sort_field(name, columns), d) for name, d in parse_sort(sort)]
+    selected = schema_columns()
+    projection = None
+    if fields:
+        selected = [columns[name] for name in fields if name in columns]
+        projection = dict.fromkeys(stored_fields(selected), 1)
+    cursor = (
+        collection.find(where or {}, projection)
+        .sort(sort_keys)
+        .batch_size(settings.STREAM_BATCH_SIZE)
+    )
+    if len(sort_keys) > 1:
+        # Sorting on an unindexed column may exceed the in-memory sort limit
+        cursor = cursor.allow_disk_use(True)
+    for record in cursor:
+        yield clean_record(read_record(record, selected))
+
+
+def fetch_export_columns():
+    """
+    Column names to export, in order: the registered columns except those
+    that are soft-deleted or deleted by an admin.
+    """
+    return [
+        column["name"]
+        for column in column_registry()
+        if not column["is_deleted"] and not column["deleted_by_admin"]
+    ]
+
+
+def apply_record_edits(updates, new_rows):
+    """
+    Apply a batch of grid edits: `updates` is a list of
+    {"record_id", "changes"} and `new_rows` a list of field dicts. Fields are
+    checked against the column registry, then all writes go out together through
+    run_bulk_writes. Returns the counts and a status per update and new row.
+    """
+    columns = columns_by_name()
+
+    def unknown_fields(fields):
+        if not isinstance(fields, dict) or not fields:
+            return "Expected a non-empty object of fields"
+        unknown = sorted(str(field) for field in fields if field not in columns)
+        if unknown:
+            return f"Unknown field(s): {', '.join(unknown)}"
+        return None
+
+    update_results = []
+    pending_updates = []
+    for update in updates:
+        record_id = update.get("record_id") if isinstance(update, dict) else None
+        result = {"record_id": record_id}
+        update_results.append(result)
+        if not ObjectId.is_valid(record_id):
+            result.update(status="invalid", error="Invalid record_id")
+            continue
+        error = unknown_fields(update.get("changes"))
+        if error:
+            result.update(status="invalid", error=error)
+            continue
+        pending_updates.append((result, ObjectId(record_id), update["changes"]))
+
+    # One read for the whole batch tells missing records apart
+    object_ids = [object_id for _, object_id, _ in pending_updates]
+    existing = set()
     try:
-        # Fetch all records where deleted_by_admin is False
-        rejected_by_admin_record_list = list(
-            table_data.find({"deleted_by_admin": False}, {"_id": 0})
+        for chunk in chunked(object_ids, settings.BULK_IN_CHUNK_SIZE):
+            cursor = table_data.find({"_id": {"$in": chunk}}, {"_id": 1})
+            existing.update(doc["_id"] for doc in cursor)
+    except Exception as e:
+        raise ValueError(f"Error reading records to update from MongoDB: {str(e)}")
+
+    operations = []
+    results_by_operation = []
+    for result, object_id, changes in pending_updates:
+        if object_id not in existing:
+            result.update(status="not_found", error="Record not found")
+            continue
+        operations.append(
+            UpdateOne({"_id": object_id}, record_update(changes, columns))
         )
-        
-        # Sanitize the data to handle any NaN or invalid values
-        sanitized_data = sanitize_data(rejected_by_admin_record_list)
-        return sanitized_data
-
-    except Exception as e:
-        print(f"Error fetching rejected records from MongoDB: {str(e)}")
-        return []
-    
-def fetch_all_records():
-    # Fetch all records from MongoDB
-    records = list(table_data.find({}))
-    # Process records to replace NaN values
-    for record in records:
-        # Convert MongoDB ObjectId to string
-        record["_id"] = str(record["_id"])  # Convert ObjectId to string
-        # Replace NaN values with None
-        for key, value in record.items():
-            if isinstance(value, float) and (
-                pd.isna(value) or value == float("inf") or value == float("-inf")
-            ):
-                record[key] = None
-    return records
+        results_by_operation.append(result)
+        result["status"] = "updated"
+
+    new_row_results = []
+    for index, row in enumerate(new_rows):
+        result = {"index": index}
+        new_row_results.append(result)
+        error = unknown_fields(row)
+        if error:
+            result.update(status="invalid", error=error)
+            continue
+        document = {"_id": ObjectId(), **stored_document(row, columns)}
+        operations.append(InsertOne(document))
+        results_by_operation.append(result)
+        result.update(status="created", id=str(document["_id"]))
+
+    totals = run_bulk_writes(table_data, operations)
+    for error in totals.pop("errors"):
+        result = results_by_operation[error["index"]]
+        result.pop("id", None)
+        result.update(status="failed", error=error["message"])
+
+    return {
+        "matched_count": totals["matched_count"],
+        "modified_count": totals["modified_count"],
+        "inserted_count": totals["inserted_count"],
+        "updates": update_results,
+        "new_rows": new_row_results,
+    }
+
+
+def fetch_data_view(
+    page_params, records=table_data_reads, columns=deleted_columns_reads
+):
+    """
+    Build the /api/data/ response: one page of records plus the column and
+    record flags. The three queries are independent, so they run concurrently
+    and the response costs one round-trip per query rather than six in a row.
+    The column list comes from the cached registry. Each query runs in a
+    copy of the caller's context, so it reads the caller's dataset.
+    """
+    context = contextvars.copy_context
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        page = pool.submit(
+            context().run, fetch_records_page, collection=records, **page_params
+        )
+        column_flags = pool.submit(context().run, fetch_column_flags, columns)
+        record_flags = pool.submit(context().run, fetch_record_flags, records)
+        return {
+            "columns": column_registry(),
+            **page.result(),
+            **column_flags.result(),
+            **record_flags.result(),
+        }
+
 
 def update_record(record_id, update_data):
     """
@@ -184,11 +997,7 @@ def update_record(record_id, update_data):
     """
     try:
         object_id = ObjectId(record_id)
-        current_document = table_data.find_one({"_id": object_id})
-        if not current_document:
-            raise ValueError("Record not found")
-
-        allowed_fields = set(current_document.keys())
+        allowed_fields = schema_column_names()
         filtered_update_data = {
             key: value for key, value in update_data.items() if key in allowed_fields
         }
@@ -197,7 +1006,7 @@ def update_record(record_id, update_data):
             raise ValueError("No valid fields to update")
 
         result = table_data.update_one(
-            {"_id": object_id}, {"$set": filtered_update_data}
+            {"_id": object_id}, record_update(filtered_update_data)
         )
         if result.matched_count == 0:
             raise ValueError("Record not found")
@@ -207,12 +1016,30 @@ def update_record(record_id, update_data):
         raise ValueError(f"Error updating record in MongoDB: {str(e)}")
 
 
+def new_record_document(fields):
+    """
+    The document to insert for a new record with `fields`. Fields that
+    aren't columns yet are registered as new (empty) columns first; record
+    flags are stored as they are.
+    """
+    data = {k: v for k, v in fields.items() if k not in RECORD_FLAG_FIELDS}
+    flags = {k: v for k, v in fields.items() if k in RECORD_FLAG_FIELDS}
+    columns = columns_by_name()
+    unknown = [name for name in data if name != "_id" and name not in columns]
+    for name in unknown:
+        add_schema_column(name)
+    if unknown:
+        columns = columns_by_name()
+    data.pop("_id", None)
+    return {**stored_document(data, columns), **flags}
+
+
 def create_record(new_data):
     """
     Create a new row in the MongoDB collection.
     """
     try:
-        result = table_data.insert_one(new_data)
+        result = table_data.insert_one(new_record_document(new_data))
         print("entered")
         return {
             "message": "New row created successfully",
@@ -236,3 +1063,52 @@ def soft_delete_record(record_id):
         return {"message": "Record marked as deleted successfully"}
     except Exception as e:
         raise ValueError(f"Error marking record as deleted in MongoDB: {str(e)}")
+
+
+# Values that chunk_to_records stores as None but older uploads stored raw
+NON_FINITE_FLOATS = [float("nan"), float("inf"), float("-inf")]
+
+
+def sanitize_stored_values(collection=table_data):
+    """
+    Replace the NaN and +/-Inf values that records uploaded before
+    ingestion-time sanitization still hold with None, with one update_many
+    per stored column field. Returns the number of modified values per field.
+    """
+    fields = sorted(stored_fields(schema_columns()) - {LAYOUT_FIELD})
+    modified = {}
+    try:
+        for field in fields:
+            result = collection.update_many(
+                {field: {"$in": NON_FINITE_FLOATS}}, {"$set": {field: None}}
+            )
+            if result.modified_count:
+                modified[field] = result.modified_count
+    except Exception as e:
+        raise ValueError(f"Error sanitizing records in MongoDB: {str(e)}")
+    return modified
+
+
+def mongo_health():
+    """
+    Ping MongoDB and report this process's connection pool settings and usage.
+    Raises ValueError if the server can't be reached.
+    """
+    started = time.perf_counter()
+    try:
+        get_db().command("ping")
+    except Exception as e:
+        raise ValueError(f"MongoDB is unreachable: {str(e)}")
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "ping_ms": round((time.perf_counter() - started) * 1000, 2),
+        "read_preference": settings.MONGO_READ_PREFERENCE,
+        "compressors": settings.MONGO_COMPRESSORS,
+        "pool": {
+            "max_pool_size": settings.MONGO_MAX_POOL_SIZE,
+            "min_pool_size": settings.MONGO_MIN_POOL_SIZE,
+            "wait_queue_timeout_ms": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            **pool_metrics(),
+        },
+    }
@@ -0,0 +1,421 @@
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from django.conf import settings
+
+from .caching import data_version
+from .changes import fetch_changes
+from .models import current_dataset, table_data
+from .schema import read_record, schema_columns
+from .services import LIVE_RECORDS_FILTER
+
+# Columnar snapshots of the live table (soft-deleted records left out), one
+# Arrow IPC file per dataset under SNAPSHOT_DIR/<dataset>/<data version>.arrow.
+# The files are uncompressed so readers memory-map them and get zero-copy
+# columns instead of decoding BSON. A stale snapshot is brought up to date
+# from the change feed when only a few rows changed, and rebuilt from
+# MongoDB otherwise. Every registered column is kept, soft-deleted ones
+# included, so flagging a column doesn't invalidate the snapshot; readers
+# pick the columns they need.
+SNAPSHOT_SUFFIX = ".arrow"
+ID_COLUMN = "_id"
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _dataset_lock():
+    with _locks_lock:
+        return _locks.setdefault(current_dataset(), threading.Lock())
+
+
+def snapshot_dir():
+    return settings.SNAPSHOT_DIR / current_dataset()
+
+
+def snapshot_path(version):
+    return snapshot_dir() / f"{version}{SNAPSHOT_SUFFIX}"
+
+
+def latest_snapshot_version():
+    """
+    Data version of the newest snapshot on disk, or None.
+    """
+    try:
+        names = os.listdir(snapshot_dir())
+    except FileNotFoundError:
+        return None
+    versions = [
+        int(name[: -len(SNAPSHOT_SUFFIX)])
+        for name in names
+        if name.endswith(SNAPSHOT_SUFFIX) and name[: -len(SNAPSHOT_SUFFIX)].isdigit()
+    ]
+    return max(versions, default=None)
+
+
+def load_snapshot(version):
+    """
+    Memory-map a snapshot file; the columns point into the mapped file.
+    """
+    with pa.memory_map(str(snapshot_path(version))) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+@contextmanager
+def snapshot_writer(version, schema):
+    """
+    Write the snapshot of `version` batch by batch through the yielded Arrow
+    writer, then remove older snapshots. The file is written under a
+    temporary name and renamed into place when the block ends without an
+    error, so readers never map a partial file.
+    """
+    directory = snapshot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = snapshot_path(version)
+    partial = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}")
+    try:
+        with pa.OSFile(str(partial), "wb") as sink:
+            with pa.ipc.new_file(sink, schema) as writer:
+                yield writer
+        os.replace(partial, path)
+    finally:
+        partial.unlink(missing_ok=True)
+    for name in os.listdir(directory):
+        if name != path.name and name.endswith(SNAPSHOT_SUFFIX):
+            try:
+                (directory / name).unlink()
+            except OSError:
+                # Still mapped by a reader on a platform that won't unlink it
+                pass
+
+
+def write_snapshot(table, version):
+    """
+    Write `table` as the snapshot of `version`.
+    """
+    with snapshot_writer(version, table.schema) as writer:
+        writer.write_table(table)
+
+
+# Arrow types of the registry's dtypes. Columns of any other dtype, or whose
+# values no longer match their dtype (e.g. text typed into a number column),
+# are stored as MIXED_TYPE unions, in which each value keeps its own type.
+ARROW_TYPES = {
+    "integer": pa.int64(),
+    "float": pa.float64(),
+    "boolean": pa.bool_(),
+    "datetime": pa.timestamp("us"),
+    "string": pa.string(),
+    "empty": pa.null(),
+}
+MIXED_KINDS = {
+    "null": pa.null(),
+    "bool": pa.bool_(),
+    "int": pa.int64(),
+    "float": pa.float64(),
+    "datetime": pa.timestamp("us"),
+    "str": pa.string(),
+}
+MIXED_TYPE = pa.dense_union(
+    [pa.field(kind, arrow_type) for kind, arrow_type in MIXED_KINDS.items()]
+)
+
+
+class ColumnTypeMismatch(Exception):
+    """
+    A column's values don't fit the Arrow type chosen for it.
+    """
+
+    def __init__(self, name):
+        super().__init__(f"Column '{name}' holds values of another type")
+        self.name = name
+
+
+def _value_kind(value):
+    if value is None:
+        return "null", None
+    if isinstance(value, bool):
+        return "bool", value
+    if isinstance(value, int) and -(2**63) <= value < 2**63:
+        return "int", value
+    if isinstance(value, float):
+        return "float", value
+    if isinstance(value, datetime):
+        return "datetime", value
+    # Strings, and the values exports write as text anyway
+    return "str", value if isinstance(value, str) else str(value)
+
+
+def mixed_column(values):
+    """
+    A MIXED_TYPE union array of `values`, for columns holding values of
+    several types (e.g. numbers and "N/A").
+    """
+    kinds = list(MIXED_KINDS)
+    children = {kind: [] for kind in kinds}
+    type_ids, offsets = [], []
+    for value in values:
+        kind, value = _value_kind(value)
+        type_ids.append(kinds.index(kind))
+        offsets.append(len(children[kind]))
+        children[kind].append(value)
+    return pa.UnionArray.from_dense(
+        pa.array(type_ids, pa.int8()),
+        pa.array(offsets, pa.int32()),
+        [
+            (
+                pa.nulls(len(child))
+                if kind == "null"
+                else pa.array(child, MIXED_KINDS[kind])
+            )
+            for kind, child in children.items()
+        ],
+        kinds,
+    )
+
+
+def snapshot_schema(columns, mixed=()):
+    """
+    The schema of a snapshot of the registered `columns`: `_id` as text,
+    then each column with the Arrow type of its dtype, or MIXED_TYPE for
+    the columns named in `mixed`.
+    """
+    fields = [pa.field(ID_COLUMN, pa.string())]
+    for column in columns:
+        arrow_type = ARROW_TYPES.get(column["dtype"], MIXED_TYPE)
+        if column["name"] in mixed:
+            arrow_type = MIXED_TYPE
+        fields.append(pa.field(column["name"], arrow_type))
+    return pa.schema(fields)
+
+
+def records_to_batch(records, schema):
+    """
+    A record batch of read records, raising ColumnTypeMismatch when a
+    column's values don't fit its type in `schema`.
+    """
+    arrays = [pa.array([str(record[ID_COLUMN]) for record in records], pa.string())]
+    for field in schema:
+        if field.name == ID_COLUMN:
+            continue
+        values = [record[field.name] for record in records]
+        if field.type == MIXED_TYPE:
+            arrays.append(mixed_column(values))
+            continue
+        try:
+            arrays.append(pa.array(values, field.type, from_pandas=True))
+        except (pa.ArrowInvalid, TypeError, OverflowError):
+            raise ColumnTypeMismatch(field.name)
+    return pa.record_batch(arrays, schema=schema)
+
+
+def is_live(record):
+    return not record.get("is_deleted") and not record.get("deleted_by_admin")
+
+
+def _record_batches(columns, schema):
+    """
+    Read the live records from the primary, in `_id` order, as record
+    batches of STREAM_BATCH_SIZE rows.
+    """
+    batch = []
+    try:
+        cursor = (
+            table_data.find(LIVE_RECORDS_FILTER)
+            .sort(ID_COLUMN, 1)
+            .batch_size(settings.STREAM_BATCH_SIZE)
+        )
+        for document in cursor:
+            batch.append(read_record(document, columns))
+            if len(batch) >= settings.STREAM_BATCH_SIZE:
+                yield records_to_batch(batch, schema)
+                batch = []
+    except ColumnTypeMismatch:
+        raise
+    except Exception as e:
+        raise ValueError(f"Error reading records for snapshot from MongoDB: {str(e)}")
+    if batch:
+        yield records_to_batch(batch, schema)
+
+
+def build_snapshot(columns, version):
+    """
+    Write the snapshot of `version` from the live records of the registered
+    `columns`, one batch at a time, so only a batch is held in memory. A
+    column whose values don't fit its dtype is stored as a union instead,
+    which means reading the records again.
+    """
+    mixed = set()
+    while True:
+        schema = snapshot_schema(columns, mixed)
+        try:
+            with snapshot_writer(version, schema) as writer:
+                for batch in _record_batches(columns, schema):
+                    writer.write_batch(batch)
+            return
+        except ColumnTypeMismatch as e:
+            mixed.add(e.name)
+
+
+def pending_changes(since):
+    """
+    The rows and column changes after `since` from the change feed, as
+    (seq, rows by ID, column changes), or None when the snapshot can't be
+    updated from them: the table was replaced, the changes are no longer
+    kept, or more than SNAPSHOT_MAX_CHANGED_ROWS rows changed.
+    """
+    rows, column_changes = {}, []
+    while True:
+        result = fetch_changes(since)
+        if result["reset_required"]:
+            return None
+        for row in result["rows"]:
+            rows[row[ID_COLUMN]] = row
+        column_changes += result.get("column_changes", [])
+        if len(rows) > settings.SNAPSHOT_MAX_CHANGED_ROWS:
+            return None
+        advanced = result["seq"] != since
+        since = result["seq"]
+        # This runs under the dataset's lock: stop as soon as seq stalls
+        if not (advanced and result["has_more"]):
+            return since, rows, column_changes
+
+
+def apply_changes(table, rows, column_changes, columns):
+    """
+    Bring a snapshot up to date: rename columns and replace the changed rows
+    (dropping those soft-deleted since). Returns None when the snapshot has
+    to be rebuilt instead: a column was added (which also resets a deleted
+    column's values), renamed over another column, or no longer lines up
+    with the registry, or a changed value doesn't fit its column's type.
+    Flag changes leave the snapshot as is, since it keeps every column.
+    """
+    for change in column_changes:
+        if change["op"] == "flags":
+            continue
+        if change["op"] != "rename":
+            return None
+        old_name, new_name = change["column"], change["new_name"]
+        if old_name == new_name:
+            continue
+        if old_name not in table.column_names or new_name in table.column_names:
+            return None
+        table = table.rename_columns(
+            [new_name if name == old_name else name for name in table.column_names]
+        )
+
+    names = [ID_COLUMN, *(column["name"] for column in columns)]
+    if sorted(table.column_names) != sorted(names):
+        return None
+    table = table.select(names)
+    live = [row for row in rows.values() if is_live(row)]
+    try:
+        changed = records_to_batch(live, table.schema)
+    except ColumnTypeMismatch:
+        return None
+    kept = table.filter(
+        pc.invert(
+            pc.is_in(table[ID_COLUMN], value_set=pa.array(list(rows), pa.string()))
+        )
+    )
+    return pa.concat_tables(
+        [kept, pa.Table.from_batches([changed], table.schema)]
+    ).sort_by(ID_COLUMN)
+
+
+def refresh_snapshot():
+    """
+    Make sure the current dataset has a snapshot of its current data version
+    and return it, memory-mapped. Only one thread per process refreshes a
+    dataset at a time; the others wait and reuse its file.
+    """
+    with _dataset_lock():
+        version = data_version(fresh=True)
+        previous = latest_snapshot_version()
+        if previous == version:
+            return load_snapshot(version)
+
+        columns = schema_columns()
+        if previous is not None and previous < version:
+            pending = pending_changes(previous)
+            if pending is not None:
+                seq, rows, column_changes = pending
+                table = apply_changes(
+                    load_snapshot(previous), rows, column_changes, columns
+                )
+                if table is not None:
+                    write_snapshot(table, seq)
+                    return load_snapshot(seq)
+        build_snapshot(columns, version)
+        return load_snapshot(version)
+
+
+def current_snapshot():
+    """
+    The up-to-date snapshot of the current dataset, or None when snapshots
+    are disabled or can't be built (callers then read MongoDB).
+    """
+    if not settings.SNAPSHOTS_ENABLED:
+        return None
+    try:
+        return refresh_snapshot()
+    except (ValueError, OSError, pa.ArrowException) as e:
+        print(f"Error refreshing snapshot: {str(e)}")
+        return None
+
+
+def column_values(array):
+    """
+    The values of an Arrow array as Python objects. Numbers, booleans,
+    timestamps and strings go through numpy, which is an order of magnitude
+    faster than Array.to_pylist().
+    """
+    kind = array.type
+    if pa.types.is_string(kind):
+        return array.to_numpy(zero_copy_only=False).tolist()
+    is_timestamp = pa.types.is_timestamp(kind) and kind.unit != "ns"
+    if not (
+        is_timestamp
+        or pa.types.is_integer(kind)
+        or pa.types.is_floating(kind)
+        or pa.types.is_boolean(kind)
+    ):
+        return array.to_pylist()
+    filled = array.fill_null(False if pa.types.is_boolean(kind) else 0)
+    values = filled.to_numpy(zero_copy_only=False)
+    if is_timestamp:
+        values = values.astype(object)
+    values = values.tolist()
+    if array.null_count:
+        for index in np.flatnonzero(array.is_null().to_numpy(zero_copy_only=False)):
+            values[index] = None
+    return values
+
+
+def iter_snapshot_rows(table, columns):
+    """
+    Yield the rows of a snapshot as tuples of values in `columns` order,
+    STREAM_BATCH_SIZE rows at a time.
+    """
+    selected = table.select(columns)
+    for batch in selected.to_batches(settings.STREAM_BATCH_SIZE):
+        yield from zip(*(column_values(column) for column in batch.columns))
+
+
+def export_source():
+    """
+    Keyword arguments that make exports.write_*_export read the current
+    snapshot instead of MongoDB; empty when there is no snapshot.
+    """
+    table = current_snapshot()
+    if table is None:
+        return {}
+    return {
+        "read_rows": lambda columns: iter_snapshot_rows(table, columns),
+        "total_rows": table.num_rows,
+    }
@@ -0,0 +1,235 @@
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+import mongomock
+import mongomock.aggregate
+import mongomock.collection
+import mongomock.filtering
+from bson import Decimal128, ObjectId
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIClient
+
+from poc_apis import caching, datasets, models, schema
+
+# mongomock stands in for MongoDB in the tests. A few things the code
+# relies on are missing from it: the `sort` option pymongo passes with every
+# UpdateOne, $type with a list of types, the $type aggregation expression
+# and the $unset pipeline stage. The shims patch mongomock internals, so
+# mongomock is pinned in requirements.txt to the version they were written for.
+_add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+
+def _add_update_without_sort(self, *args, sort=None, **kwargs):
+    return _add_update(self, *args, **kwargs)
+
+
+mongomock.collection.BulkOperationBuilder.add_update = _add_update_without_sort
+
+_operators = mongomock.filtering._filterer_inst._operator_map
+_type_query = _operators["$type"]
+
+
+def _type_query_with_lists(value, types):
+    if isinstance(types, list):
+        return any(_type_query(value, name) for name in types)
+    return _type_query(value, types)
+
+
+_operators["$type"] = _type_query_with_lists
+
+BSON_TYPE_NAMES = [
+    (bool, "bool"),
+    (int, "int"),
+    (float, "double"),
+    (Decimal128, "decimal"),
+    (str, "string"),
+    (datetime, "date"),
+    (ObjectId, "objectId"),
+    (dict, "object"),
+    (list, "array"),
+    (bytes, "binData"),
+]
+
+
+def bson_type(value):
+    if value is None:
+        return "null"
+    for python_type, name in BSON_TYPE_NAMES:
+        if isinstance(value, python_type):
+            return name
+    return "object"
+
+
+if "$type" not in mongomock.aggregate.type_operators:
+    mongomock.aggregate.type_operators.append("$type")
+    _handle_type_operator = mongomock.aggregate._Parser._handle_type_operator
+
+    def _handle_type_operator_with_type(self, operator, values):
+        if operator != "$type":
+            return _handle_type_operator(self, operator, values)
+        try:
+            return bson_type(self.parse(values))
+        except KeyError:
+            return "missing"
+
+    mongomock.aggregate._Parser._handle_type_operator = _handle_type_operator_with_type
+
+
+def _handle_unset_stage(in_collection, unused_database, fields):
+    fields = [fields] if isinstance(fields, str) else fields
+    return [
+        {key: value for key, value in document.items() if key not in fields}
+        for document in in_collection
+    ]
+
+
+if mongomock.aggregate._PIPELINE_HANDLERS.get("$unset") is None:
+    mongomock.aggregate._PIPELINE_HANDLERS["$unset"] = _handle_unset_stage
+
+
+class MongoTestCase(SimpleTestCase):
+    """
+    Runs each test against a fresh in-memory MongoDB (mongomock), with empty
+    caches and snapshot and job directories of its own.
+    """
+
+    def setUp(self):
+        super().setUp()
+        files = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, files, ignore_errors=True)
+        settings = override_settings(
+            SNAPSHOT_DIR=files / "snapshots",
+            JOB_STORAGE_DIR=files / "job_files",
+            FILTER_INDEX_THRESHOLD=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        patcher = mock.patch("pymongo.MongoClient", mongomock.MongoClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        models._forget_client()
+        self.addCleanup(models._forget_client)
+
+        cache.clear()
+        caching._version_cache.clear()
+        schema._schema_caches.clear()
+        datasets._known_datasets.intersection_update({models.DEFAULT_DATASET})
+        self.api = APIClient()
+
+    def upload(self, content, name="data.csv", dataset=None):
+        """
+        Upload a CSV (or Excel) file through /api/upload/.
+        """
+        url = "/api/upload/"
+        if dataset:
+            url += f"?dataset={dataset}"
+        return self.api.post(
+            url, {"file": SimpleUploadedFile(name, content)}, format="multipart"
+        )
+
+
+class AsyncCursor:
+    """
+    Async cursor over a mongomock cursor, standing in for pymongo's.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.iterator = None
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, count):
+        self.cursor = self.cursor.limit(count)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def allow_disk_use(self, allow):
+        return self
+
+    async def to_list(self, length=None):
+        if self.iterator is None:
+            self.iterator = iter(self.cursor)
+        documents = []
+        for document in self.iterator:
+            documents.append(document)
+            if length and len(documents) >= length:
+                break
+        return documents
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.iterator is None:
+            self.iterator = iter(self.cursor)
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncCollection:
+    """
+    The part of pymongo's AsyncCollection the async services use, over the
+    synchronous mongomock collection of the same name.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline, **kwargs):
+        return AsyncCursor(self.collection.aggregate(pipeline))
+
+    async def bulk_write(self, *args, **kwargs):
+        return self.collection.bulk_write(*args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return self.collection.update_many(*args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return self.collection.insert_one(*args, **kwargs)
+
+    async def count_documents(self, *args, **kwargs):
+        return self.collection.count_documents(*args, **kwargs)
+
+    async def estimated_document_count(self):
+        return self.collection.estimated_document_count()
+
+    def with_options(self, **kwargs):
+        return self
+
+
+class AsyncMongoTestCase(MongoTestCase):
+    """
+    MongoTestCase whose async MongoDB client reads and writes the same
+    in-memory database as the synchronous one.
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        class Database:
+            def __getitem__(self, name):
+                return AsyncCollection(models.get_db()[name])
+
+        class Client:
+            def __getitem__(self, name):
+                return Database()
+
+        patcher = mock.patch.object(models, "get_async_client", Client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
@@ -0,0 +1,96 @@
+import json
+
+from .base import MongoTestCase
+
+
+class AggregateTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload(
+            b"Name,City,Year,Amount\n"
+            b"a,Pune,2023,100\n"
+            b"b,Pune,2024,200\n"
+            b"c,Delhi,2023,50\n"
+            b"d,Delhi,2023,150\n"
+            b"e,Mumbai,2024,700\n"
+        )
+
+    def aggregate(self, **params):
+        response = self.api.get("/api/aggregate/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_whole_table(self):
+        result = self.aggregate(metrics="count,sum:Amount")
+        self.assertEqual(result["columns"], ["count", "sum:Amount"])
+        self.assertEqual(result["rows"], [[5, 1200]])
+
+    def test_group_by_with_metrics_and_sort(self):
+        result = self.aggregate(
+            group_by="City", metrics="sum:Amount,avg:Amount,count", sort="-sum:Amount"
+        )
+        self.assertEqual(
+            result["columns"], ["City", "sum:Amount", "avg:Amount", "count"]
+        )
+        self.assertEqual(
+            result["rows"],
+            [
+                ["Mumbai", 700, 700.0, 1],
+                ["Pune", 300, 150.0, 2],
+                ["Delhi", 200, 100.0, 2],
+            ],
+        )
+        self.assertFalse(result["truncated"])
+
+    def test_limit_truncates(self):
+        result = self.aggregate(group_by="City", limit=2)
+        self.assertEqual([row[0] for row in result["rows"]], ["Delhi", "Mumbai"])
+        self.assertTrue(result["truncated"])
+
+    def test_pivot(self):
+        result = self.aggregate(group_by="City", pivot="Year", metrics="sum:Amount")
+        self.assertEqual(result["pivot_values"], [2023, 2024])
+        self.assertNotIn("columns", result)
+        self.assertEqual(
+            result["rows"],
+            [
+                ["Delhi", [200], None],
+                ["Mumbai", None, [700]],
+                ["Pune", [100], [200]],
+            ],
+        )
+
+    def test_filter_and_soft_deleted_records(self):
+        record = self.api.get(
+            "/api/data/", {"filter": json.dumps({"Name": "e"})}
+        ).json()["records"][0]
+        self.api.delete(f"/api/create_or_update_record/{record['_id']}/")
+        result = self.aggregate(
+            group_by="City", metrics="count", filter=json.dumps({"Year": 2023})
+        )
+        self.assertEqual(result["rows"], [["Delhi", 2], ["Pune", 1]])
+        result = self.aggregate(group_by="Year", metrics="sum:Amount")
+        self.assertEqual(result["rows"], [[2023, 300], [2024, 200]])
+
+    def test_added_column_is_counted_with_its_default(self):
+        self.api.post(
+            "/api/add-column/",
+            {"column_name": "Region", "default": "West"},
+            format="json",
+        )
+        result = self.aggregate(group_by="Region", metrics="count")
+        self.assertEqual(result["rows"], [["West", 5]])
+
+    def test_errors(self):
+        cases = [
+            ({"group_by": "Country"}, "Unknown column 'Country'"),
+            ({"metrics": "median:Amount"}, "Unknown metric"),
+            ({"metrics": "sum"}, "needs a column"),
+            ({"limit": "lots"}, "limit"),
+            ({"filter": "{"}, "must be a JSON object"),
+        ]
+        for params, message in cases:
+            with self.subTest(params=params):
+                response = self.api.get("/api/aggregate/", params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(message, response.json()["error"])
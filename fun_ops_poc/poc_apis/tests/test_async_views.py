@@ -0,0 +1,52 @@
+import json
+
+from django.test import AsyncClient
+
+from .base import AsyncMongoTestCase
+
+
+class AsyncApprovalViewTests(AsyncMongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload(b"Name,City\nAsha,Pune\nRavi,Delhi\n")
+        self.record_ids = [
+            record["_id"] for record in self.api.get("/api/data/").json()["records"]
+        ]
+        self.api.post("/api/soft-delete-column/", {"column_name": "City"})
+        # Like a browser or curl without a session: no CSRF token
+        self.async_client = AsyncClient(enforce_csrf_checks=True)
+
+    async def post(self, path, body):
+        response = await self.async_client.post(
+            f"/api/async/{path}/", json.dumps(body), content_type="application/json"
+        )
+        return response.status_code, json.loads(response.content)
+
+    async def test_column_approvals_accept_posts_without_csrf_token(self):
+        status, body = await self.post(
+            "col_deletion_approval", {"column_names": ["City"]}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(body["matched_count"], 1)
+        status, body = await self.post(
+            "col_deletion_rejection", {"column_names": ["City"]}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(body["matched_count"], 1)
+
+    async def test_record_approvals_accept_posts_without_csrf_token(self):
+        status, body = await self.post(
+            "record_deletion_approved", {"record_ids": self.record_ids[:1]}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(body["matched_count"], 1)
+        status, body = await self.post(
+            "record_deletion_disapproved", {"record_ids": self.record_ids}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(body["matched_count"], 2)
+
+    async def test_empty_body_is_rejected(self):
+        status, body = await self.post("col_deletion_approval", {})
+        self.assertEqual(status, 400)
+        self.assertEqual(body, {"error": "No column names provided"})
@@ -0,0 +1,91 @@
+from bson import ObjectId
+
+from .base import MongoTestCase
+
+
+class BulkRecordEditTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload(b"Name,Amount\na,1\nb,2\n")
+
+    def test_body_must_be_an_object(self):
+        response = self.api.post("/api/records/bulk/", [], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("JSON object", response.json()["error"])
+
+    def records(self):
+        records = self.api.get("/api/data/").json()["records"]
+        return {record["Name"]: record for record in records}
+
+    def test_results_per_update_and_new_row(self):
+        record_id = self.records()["a"]["_id"]
+        missing_id = str(ObjectId())
+        response = self.api.post(
+            "/api/records/bulk/",
+            {
+                "updates": [
+                    {"record_id": record_id, "changes": {"Amount": 10}},
+                    {"record_id": missing_id, "changes": {"Amount": 20}},
+                    {"record_id": "nope", "changes": {"Amount": 30}},
+                    {"record_id": record_id, "changes": {"Colour": "red"}},
+                    {"record_id": record_id, "changes": {}},
+                ],
+                "new_rows": [{"Name": "c", "Amount": 3}, {"Size": 4}],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result["message"], "1 record(s) updated, 1 created")
+        self.assertEqual(
+            [update["status"] for update in result["updates"]],
+            ["updated", "not_found", "invalid", "invalid", "invalid"],
+        )
+        self.assertEqual(result["updates"][3]["error"], "Unknown field(s): Colour")
+        self.assertEqual(result["new_rows"][0]["status"], "created")
+        self.assertEqual(
+            result["new_rows"][1],
+            {"index": 1, "status": "invalid", "error": "Unknown field(s): Size"},
+        )
+
+        records = self.records()
+        self.assertEqual(records["a"]["Amount"], 10)
+        self.assertEqual(records["c"]["_id"], result["new_rows"][0]["id"])
+        self.assertEqual(records["c"]["Amount"], 3)
+
+    def test_changes_are_logged(self):
+        since = self.api.get("/api/data/changes/", {"since": 0}).json()["seq"]
+        record_id = self.records()["b"]["_id"]
+        self.api.post(
+            "/api/records/bulk/",
+            {"updates": [{"record_id": record_id, "changes": {"Amount": 5}}]},
+            format="json",
+        )
+        changes = self.api.get("/api/data/changes/", {"since": since}).json()
+        self.assertEqual([row["_id"] for row in changes["rows"]], [record_id])
+        self.assertEqual(changes["rows"][0]["Amount"], 5)
+
+    def test_renamed_and_added_columns_are_accepted(self):
+        self.api.post(
+            "/api/rename-column/",
+            {"old_column_name": "Amount", "new_column_name": "Total"},
+            format="json",
+        )
+        self.api.post("/api/add-column/", {"column_name": "Note"}, format="json")
+        record_id = self.records()["a"]["_id"]
+        result = self.api.post(
+            "/api/records/bulk/",
+            {
+                "updates": [
+                    {"record_id": record_id, "changes": {"Total": 7, "Note": "x"}},
+                    {"record_id": record_id, "changes": {"Amount": 8}},
+                ]
+            },
+            format="json",
+        ).json()
+        self.assertEqual(
+            [update["status"] for update in result["updates"]], ["updated", "invalid"]
+        )
+        record = self.records()["a"]
+        self.assertEqual((record["Total"], record["Note"]), (7, "x"))
+        self.assertNotIn("Amount", record)
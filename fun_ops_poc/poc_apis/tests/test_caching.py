@@ -0,0 +1,54 @@
+from django.test import override_settings
+
+from poc_apis.caching import DATA_VERSION_ID
+from poc_apis.models import column_schema, meta, scoped_name
+from poc_apis.schema import SCHEMA_VERSION_ID
+
+from .base import MongoTestCase
+
+
+@override_settings(DATA_VERSION_TTL=0, COLUMN_SCHEMA_TTL=60)
+class DataCacheSchemaTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload(b"Name,Amount\na,1\nb,2\n")
+
+    def rename_in_other_process(self, old_name, new_name):
+        # Written straight to MongoDB, so this process's caches don't hear of it
+        column_schema.update_one({"name": old_name}, {"$set": {"name": new_name}})
+        meta.update_one(
+            {"_id": scoped_name(SCHEMA_VERSION_ID)}, {"$inc": {"version": 1}}
+        )
+        meta.update_one({"_id": scoped_name(DATA_VERSION_ID)}, {"$inc": {"version": 1}})
+
+    def test_new_data_version_reloads_the_registry(self):
+        first = self.api.get("/api/data/")
+        self.assertEqual(
+            [column["name"] for column in first.json()["columns"]], ["Name", "Amount"]
+        )
+        self.rename_in_other_process("Amount", "Total")
+
+        second = self.api.get("/api/data/")
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertEqual(
+            [column["name"] for column in second.json()["columns"]], ["Name", "Total"]
+        )
+        self.assertEqual(
+            sorted(record["Total"] for record in second.json()["records"]), [1, 2]
+        )
+        # The cached copy has the new shape too
+        self.assertEqual(self.api.get("/api/data/").content, second.content)
+
+    def test_filters_use_the_new_registry(self):
+        self.api.get("/api/data/")
+        self.rename_in_other_process("Amount", "Total")
+        response = self.api.get("/api/data/", {"filter": '{"Total": 2}'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([r["Name"] for r in response.json()["records"]], ["b"])
+
+    def test_aggregates_use_the_new_registry(self):
+        self.api.get("/api/aggregate/", {"metrics": "sum:Amount"})
+        self.rename_in_other_process("Amount", "Total")
+        response = self.api.get("/api/aggregate/", {"metrics": "sum:Total"})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["rows"], [[3]])
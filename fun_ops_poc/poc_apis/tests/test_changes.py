@@ -0,0 +1,91 @@
+from unittest import mock
+
+from django.test import override_settings
+
+from poc_apis import changes
+from poc_apis.caching import advance_data_version, data_version
+from poc_apis.changes import log_change
+
+from .base import MongoTestCase
+
+
+class ChangeFeedTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload(b"Name,Amount\nAsha,10\nRavi,20\nMeera,30\n")
+        self.since = data_version(fresh=True)
+        self.records = self.api.get("/api/data/?sort=Amount").json()["records"]
+
+    def edit(self, record, amount):
+        response = self.api.post(
+            f"/api/create_or_update_record/{record['_id']}/",
+            {"Amount": amount},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def changes_since(self, since):
+        response = self.api.get(f"/api/data/changes/?since={since}")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    @override_settings(CHANGES_PAGE_SIZE=2)
+    def test_pages_through_changes_in_order(self):
+        for amount, record in zip((11, 21, 31), self.records):
+            self.edit(record, amount)
+        self.api.post("/api/add-column/", {"column_name": "City"}, format="json")
+
+        first = self.changes_since(self.since)
+        self.assertTrue(first["has_more"])
+        self.assertEqual(first["seq"], self.since + 2)
+        self.assertEqual([row["Amount"] for row in first["rows"]], [11, 21])
+
+        second = self.changes_since(first["seq"])
+        self.assertFalse(second["has_more"])
+        self.assertEqual(second["seq"], data_version(fresh=True))
+        self.assertEqual([row["Amount"] for row in second["rows"]], [31])
+        self.assertEqual(
+            [change["column"] for change in second["column_changes"]], ["City"]
+        )
+
+        last = self.changes_since(second["seq"])
+        self.assertEqual(last["rows"], [])
+        self.assertFalse(last["has_more"])
+
+    def test_no_more_when_nothing_is_past_since(self):
+        # A version with no entry behind it yet must not report more changes
+        advance_data_version(self.since + 3)
+        result = self.changes_since(self.since)
+        self.assertEqual(result["seq"], self.since)
+        self.assertEqual(result["rows"], [])
+        self.assertFalse(result["has_more"])
+
+    def test_entries_are_written_before_the_version_moves(self):
+        # An entry whose version bump hasn't happened yet stays hidden, and
+        # the next change follows it without a gap
+        with mock.patch.object(changes, "advance_data_version"):
+            hidden = log_change("records", record_ids=[self.records[0]["_id"]])
+        self.assertEqual(hidden, self.since + 1)
+        self.assertEqual(self.changes_since(self.since)["rows"], [])
+
+        self.edit(self.records[1], 99)
+        result = self.changes_since(self.since)
+        self.assertEqual(result["seq"], self.since + 2)
+        self.assertEqual(
+            {row["_id"] for row in result["rows"]},
+            {self.records[0]["_id"], self.records[1]["_id"]},
+        )
+
+    def test_insert_errors_are_raised(self):
+        with mock.patch.object(
+            changes.changes, "insert_one", side_effect=RuntimeError("down")
+        ):
+            with self.assertRaisesMessage(
+                ValueError, "Error logging change in MongoDB: down"
+            ):
+                log_change("records", record_ids=[self.records[0]["_id"]])
+        self.assertEqual(data_version(fresh=True), self.since)
+
+    def test_upload_resets_the_feed(self):
+        self.upload(b"Name\nZoe\n")
+        self.assertTrue(self.changes_since(self.since)["reset_required"])
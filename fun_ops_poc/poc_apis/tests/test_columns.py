@@ -0,0 +1,109 @@
+from poc_apis.models import table_data
+
+from .base import MongoTestCase
+
+
+class LazyColumnTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload(b"Name,Amount\na,1\nb,2\n")
+
+    def data(self):
+        return self.api.get("/api/data/").json()
+
+    def records(self):
+        return {record["Name"]: record for record in self.data()["records"]}
+
+    def column_names(self):
+        return [column["name"] for column in self.data()["columns"]]
+
+    def add_column(self, name, default=None):
+        return self.api.post(
+            "/api/add-column/", {"column_name": name, "default": default}, format="json"
+        )
+
+    def rename_column(self, old_name, new_name):
+        return self.api.post(
+            "/api/rename-column/",
+            {"old_column_name": old_name, "new_column_name": new_name},
+            format="json",
+        )
+
+    def stored_fields(self):
+        return {field for document in table_data.find({}) for field in document}
+
+    def test_added_column_reads_its_default_without_rewriting_records(self):
+        before = self.stored_fields()
+        response = self.add_column("Status", "open")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stored_fields(), before)
+        self.assertEqual(self.column_names(), ["Name", "Amount", "Status"])
+        status = self.data()["columns"][-1]
+        self.assertEqual((status["dtype"], status["default"]), ("string", "open"))
+        self.assertEqual(
+            {name: record["Status"] for name, record in self.records().items()},
+            {"a": "open", "b": "open"},
+        )
+
+    def test_edits_and_new_records_use_the_added_column(self):
+        self.add_column("Status", "open")
+        record_id = self.records()["a"]["_id"]
+        self.api.post(
+            f"/api/create_or_update_record/{record_id}/",
+            {"Status": "closed"},
+            format="json",
+        )
+        self.api.post(
+            "/api/create_or_update_record/", {"Name": "c", "Amount": 3}, format="json"
+        )
+        records = self.records()
+        self.assertEqual(records["a"]["Status"], "closed")
+        self.assertEqual(records["b"]["Status"], "open")
+        self.assertEqual(records["c"]["Status"], "open")
+
+    def test_adding_an_existing_column_resets_it(self):
+        self.add_column("Status", "open")
+        record_id = self.records()["a"]["_id"]
+        self.api.post(
+            f"/api/create_or_update_record/{record_id}/",
+            {"Status": "closed"},
+            format="json",
+        )
+        self.add_column("Status")
+        self.assertEqual(
+            [record["Status"] for record in self.records().values()], [None, None]
+        )
+
+    def test_rename_keeps_values_and_position(self):
+        before = self.stored_fields()
+        response = self.rename_column("Name", "Label")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stored_fields(), before)
+        self.assertEqual(self.column_names(), ["Label", "Amount"])
+        records = self.data()["records"]
+        self.assertEqual(
+            sorted((r["Label"], r["Amount"]) for r in records), [("a", 1), ("b", 2)]
+        )
+        self.assertTrue(all("Name" not in record for record in records))
+
+    def test_rename_onto_an_existing_column_replaces_it(self):
+        self.add_column("Status", "open")
+        self.rename_column("Amount", "Status")
+        self.assertEqual(self.column_names(), ["Name", "Status"])
+        self.assertEqual(
+            sorted(record["Status"] for record in self.data()["records"]), [1, 2]
+        )
+
+    def test_renamed_added_column_keeps_its_default(self):
+        self.add_column("Status", "open")
+        self.rename_column("Status", "State")
+        self.assertEqual(
+            [record["State"] for record in self.records().values()], ["open", "open"]
+        )
+        response = self.api.get("/api/data/", {"sort": "State"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_rename_errors(self):
+        self.assertEqual(self.rename_column("Colour", "Color").status_code, 404)
+        self.assertEqual(self.rename_column("Name", "").status_code, 400)
+        self.assertEqual(self.add_column("").status_code, 400)
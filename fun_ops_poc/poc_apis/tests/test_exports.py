@@ -0,0 +1,117 @@
+import io
+import re
+import zlib
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from poc_apis import exports
+
+# Wide enough to be split into several column groups
+COLUMNS = [f"Column number {i} with a long name" for i in range(30)]
+
+
+def read_rows(count):
+    return lambda columns: iter([[f"row {i}"] * len(columns) for i in range(count)])
+
+
+def font_objects(pdf):
+    """
+    The font dictionaries of the document, by base font.
+    """
+    fonts = re.findall(rb"<< /Type /Font [^>]*/BaseFont /([\w-]+)[^>]*>>", pdf)
+    objects = re.findall(rb"<< /Type /Font [^>]*>>", pdf)
+    return dict(zip((font.decode() for font in fonts), objects))
+
+
+def page_texts(pdf):
+    """
+    The decompressed content stream of every page, in order.
+    """
+    streams = re.findall(rb"/FlateDecode >>\nstream\n(.*?)\nendstream", pdf, re.S)
+    return [zlib.decompress(stream).decode("latin-1") for stream in streams]
+
+
+@mock.patch("poc_apis.exports.fetch_export_columns", lambda: COLUMNS)
+class PdfExportTests(SimpleTestCase):
+    def test_every_group_gets_a_header_page_without_rows(self):
+        out = io.BytesIO()
+        written = exports.write_pdf_export(out, read_rows=read_rows(0), total_rows=0)
+        pdf = out.getvalue()
+        pages = page_texts(pdf)
+        self.assertEqual(written, 0)
+        self.assertGreater(len(pages), 1)
+        self.assertIn(f"/Count {len(pages)} ", pdf.decode("latin-1"))
+        for number, text in enumerate(pages, start=1):
+            self.assertIn(f"group {number}/{len(pages)}", text)
+            self.assertIn("Column number", text)
+        self.assertTrue(pdf.endswith(b"%%EOF\n"))
+
+    def test_pages_are_written_as_they_finish(self):
+        out = io.BytesIO()
+        sizes = []
+        written = exports.write_pdf_export(
+            out,
+            read_rows=read_rows(200),
+            total_rows=200,
+            progress=lambda rendered, total: sizes.append(out.tell()),
+        )
+        pdf = out.getvalue()
+        self.assertEqual(written, 200)
+        self.assertEqual(len(sizes), len(page_texts(pdf)))
+        # Each page is in the output before the next one is drawn
+        self.assertEqual(sizes, sorted(set(sizes)))
+        self.assertLess(sizes[-1], len(pdf))
+        self.assertIn("(row 199)", page_texts(pdf)[-1])
+
+    def test_rows_are_read_once_and_groups_follow_each_block(self):
+        calls = []
+
+        def counted(columns):
+            calls.append(columns)
+            return read_rows(100)(columns)
+
+        out = io.BytesIO()
+        written = exports.write_pdf_export(out, read_rows=counted, total_rows=100)
+        self.assertEqual(written, 100)
+        self.assertEqual(len(calls), 1)
+        pages = page_texts(out.getvalue())
+        groups = sum("(row 0)" in text for text in pages)
+        self.assertGreater(groups, 1)
+        self.assertGreater(len(pages), groups)
+        self.assertEqual(len(pages) % groups, 0)
+        for number, text in enumerate(pages):
+            self.assertIn(f"group {number % groups + 1}/{groups}", text)
+        self.assertIn("(row 0)", pages[groups - 1])
+        self.assertIn("(row 99)", pages[-1])
+
+    def test_fonts_keep_their_own_encoding(self):
+        # reportlab draws characters Helvetica lacks in a symbol font
+        rows = lambda columns: iter([["\u2713 done"] * len(columns)])
+        out = io.BytesIO()
+        exports.write_pdf_export(out, read_rows=rows, total_rows=1)
+        fonts = font_objects(out.getvalue())
+        self.assertIn(b"/Encoding /WinAnsiEncoding", fonts["Helvetica"])
+        self.assertIn(b"/Encoding /WinAnsiEncoding", fonts["Helvetica-Bold"])
+        self.assertNotIn(b"/Encoding", fonts["ZapfDingbats"])
+
+
+class PdfPageCanvasTests(SimpleTestCase):
+    # PdfPageCanvas reads reportlab internals; these pin down what it needs
+    def test_each_page_is_handed_over_with_its_fonts(self):
+        pages = []
+        canvas = exports.PdfPageCanvas(exports.PDF_PAGE_SIZE, pages.append)
+        canvas.setFont("Helvetica", 10)
+        canvas.drawString(10, 10, "first")
+        canvas.showPage()
+        canvas.setFont("Courier", 10)
+        canvas.drawString(10, 10, "second")
+        canvas.showPage()
+
+        self.assertEqual(len(pages), 2)
+        self.assertIn(b"(first) Tj", pages[0])
+        self.assertNotIn(b"first", pages[1])
+        self.assertIn(b"(second) Tj", pages[1])
+        self.assertEqual(sorted(canvas.font_names().values()), ["Courier", "Helvetica"])
+        for name in canvas.font_names():
+            self.assertIn(f"/{name} ".encode(), pages[0] + pages[1])
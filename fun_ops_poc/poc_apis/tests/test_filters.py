@@ -0,0 +1,111 @@
+import json
+
+from .base import MongoTestCase
+
+
+class FilterTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload(
+            b"Name,Amount,City\n"
+            b"Asha,100,Pune\n"
+            b"Bala,250,Delhi\n"
+            b"Chitra,600,Pune\n"
+            b"Dev,50,Mumbai\n"
+        )
+
+    def get(self, spec=None, **params):
+        if spec is not None:
+            params["filter"] = spec if isinstance(spec, str) else json.dumps(spec)
+        return self.api.get("/api/data/", params)
+
+    def names(self, spec=None, **params):
+        response = self.get(spec, **params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(record["Name"] for record in response.json()["records"])
+
+    def error(self, spec):
+        response = self.get(spec)
+        self.assertEqual(response.status_code, 400)
+        return response.json()["error"]
+
+    def test_equality_and_comparisons(self):
+        self.assertEqual(self.names({"City": "Pune"}), ["Asha", "Chitra"])
+        self.assertEqual(
+            self.names({"Amount": {"gte": 100, "lt": 500}}), ["Asha", "Bala"]
+        )
+        self.assertEqual(self.names({"Amount": {"ne": 50}}), ["Asha", "Bala", "Chitra"])
+
+    def test_list_and_text_operators(self):
+        self.assertEqual(
+            self.names({"City": {"in": ["Delhi", "Mumbai"]}}), ["Bala", "Dev"]
+        )
+        self.assertEqual(self.names({"City": {"nin": ["Pune"]}}), ["Bala", "Dev"])
+        self.assertEqual(self.names({"Name": {"contains": "HI"}}), ["Chitra"])
+        self.assertEqual(self.names({"Name": {"startswith": "B"}}), ["Bala"])
+        self.assertEqual(self.names({"Name": {"startswith": "b"}}), [])
+
+    def test_combinators(self):
+        self.assertEqual(
+            self.names({"or": [{"City": "Mumbai"}, {"Amount": {"gt": 500}}]}),
+            ["Chitra", "Dev"],
+        )
+        self.assertEqual(
+            self.names(
+                {"City": "Pune", "and": [{"or": [{"Amount": 100}, {"Amount": 50}]}]}
+            ),
+            ["Asha"],
+        )
+
+    def test_filter_and_search_combine(self):
+        self.assertEqual(self.names(search="pune"), ["Asha", "Chitra"])
+        self.assertEqual(self.names({"Amount": {"lt": 200}}, search="pune"), ["Asha"])
+
+    def test_added_column_matches_on_its_default(self):
+        self.api.post(
+            "/api/add-column/",
+            {"column_name": "Status", "default": "open"},
+            format="json",
+        )
+        record_id = self.get({"Name": "Dev"}).json()["records"][0]["_id"]
+        self.api.post(
+            f"/api/create_or_update_record/{record_id}/",
+            {"Status": "closed"},
+            format="json",
+        )
+        self.assertEqual(self.names({"Status": "open"}), ["Asha", "Bala", "Chitra"])
+        self.assertEqual(self.names({"Status": {"ne": "open"}}), ["Dev"])
+        self.assertEqual(
+            self.names({"Status": {"exists": True}}), ["Asha", "Bala", "Chitra", "Dev"]
+        )
+
+    def test_renamed_column_is_filtered_by_its_new_name(self):
+        self.api.post(
+            "/api/rename-column/",
+            {"old_column_name": "City", "new_column_name": "Town"},
+            format="json",
+        )
+        self.assertEqual(self.names({"Town": "Pune"}), ["Asha", "Chitra"])
+        self.assertIn("Unknown column 'City'", self.error({"City": "Pune"}))
+
+    def test_errors(self):
+        cases = [
+            ("{not json", "must be a JSON object"),
+            (["City"], "must be a JSON object"),
+            ({"Country": "India"}, "Unknown column 'Country'"),
+            ({"Amount": {"between": [1, 2]}}, "Unknown operator 'between'"),
+            ({"Amount": {}}, "Empty condition"),
+            ({"City": {"in": "Pune"}}, "'in' takes a list"),
+            ({"Name": {"contains": ""}}, "non-empty string"),
+            (
+                {"Name": {"contains": "a", "startswith": "A"}},
+                "only one of 'contains' and 'startswith'",
+            ),
+            ({"City": {"exists": "yes"}}, "'exists' takes true or false"),
+            ({"_id": "nope"}, "Invalid record ID"),
+            ({"or": {"City": "Pune"}}, "'or' takes a list"),
+            ({"City": {"eq": ["Pune"]}}, "Invalid value"),
+        ]
+        for spec, message in cases:
+            with self.subTest(spec=spec):
+                self.assertIn(message, self.error(spec))
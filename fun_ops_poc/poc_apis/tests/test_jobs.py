@@ -0,0 +1,122 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
+
+from bson import ObjectId
+from django.test import override_settings
+
+from poc_apis import jobs as job_runner
+from poc_apis.models import jobs
+
+from .base import MongoTestCase
+
+
+class RunJobTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload(b"Name,Amount\na,1\nb,2\n")
+
+    def test_missing_job_is_skipped(self):
+        job_runner.run_job(str(ObjectId()))
+        self.assertEqual(jobs.count_documents({}), 0)
+
+    def test_claimed_job_is_not_run_again(self):
+        job_id = job_runner.create_job("export_pdf")
+        job_runner.update_job(job_id, status="running")
+        job_runner.run_job(job_id)
+        job = jobs.find_one({"_id": ObjectId(job_id)})
+        self.assertEqual(job["status"], "running")
+        self.assertNotIn("artifact_path", job)
+
+    def test_queued_job_runs_once(self):
+        job_id = job_runner.create_job("export_pdf")
+        job_runner.run_job(job_id)
+        finished_at = jobs.find_one({"_id": ObjectId(job_id)})["finished_at"]
+        job_runner.run_job(job_id)
+        job = jobs.find_one({"_id": ObjectId(job_id)})
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["rows_processed"], 2)
+        self.assertEqual(job["finished_at"], finished_at)
+
+
+@override_settings(JOB_STALE_SECONDS=60)
+class RecoverJobsTests(MongoTestCase):
+    def add_job(self, status, seconds_ago):
+        job_id = job_runner.create_job("export_pdf")
+        updated_at = job_runner._now() - timedelta(seconds=seconds_ago)
+        jobs.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$set": {"status": status, "updated_at": updated_at}},
+        )
+        return job_id
+
+    def status(self, job_id):
+        return jobs.find_one({"_id": ObjectId(job_id)})["status"]
+
+    @mock.patch("poc_apis.jobs.submit_job")
+    def test_stale_running_jobs_fail_and_queued_jobs_are_requeued(self, submit_job):
+        stale = self.add_job("running", 120)
+        live = self.add_job("running", 10)
+        queued = self.add_job("queued", 600)
+        done = self.add_job("done", 600)
+
+        recovered = job_runner.recover_jobs()
+
+        self.assertEqual(recovered, {"failed": 1, "requeued": 1})
+        self.assertEqual(self.status(stale), "failed")
+        self.assertIn("interrupted", jobs.find_one({"_id": ObjectId(stale)})["error"])
+        self.assertEqual(self.status(live), "running")
+        self.assertEqual(self.status(done), "done")
+        submit_job.assert_called_once_with(queued)
+
+    @mock.patch("poc_apis.jobs.submit_job")
+    def test_recovery_can_be_turned_off(self, submit_job):
+        self.add_job("queued", 600)
+        with override_settings(JOB_RECOVER_ON_STARTUP=False):
+            job_runner.recover_jobs_on_startup()
+        submit_job.assert_not_called()
+        job_runner.recover_jobs_on_startup()
+        submit_job.assert_called_once()
+
+
+class FakeExecutor:
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.submitted = []
+
+    def submit(self, function, *args):
+        if self.broken:
+            raise BrokenProcessPool("A worker died")
+        self.submitted.append(args)
+        return Future()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class SubmitJobTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(setattr, job_runner, "_executor", None)
+
+    def test_broken_pool_is_replaced(self):
+        job_runner._executor = FakeExecutor(broken=True)
+        replacement = FakeExecutor()
+        with mock.patch("poc_apis.jobs.ProcessPoolExecutor", return_value=replacement):
+            job_id = job_runner.submit_job(job_runner.create_job("export_pdf"))
+        self.assertIs(job_runner._executor, replacement)
+        self.assertEqual(replacement.submitted, [(job_id,)])
+        self.assertEqual(jobs.find_one({"_id": ObjectId(job_id)})["status"], "queued")
+
+    def test_job_fails_when_the_new_pool_is_broken_too(self):
+        job_runner._executor = FakeExecutor(broken=True)
+        job_id = job_runner.create_job("export_pdf")
+        with mock.patch(
+            "poc_apis.jobs.ProcessPoolExecutor", return_value=FakeExecutor(broken=True)
+        ):
+            with self.assertRaises(BrokenProcessPool):
+                job_runner.submit_job(job_id)
+        job = jobs.find_one({"_id": ObjectId(job_id)})
+        self.assertEqual(job["status"], "failed")
+        self.assertIn("A worker died", job["error"])
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.test import AsyncClient, Client, override_settings
+
+from poc_apis import live
+
+from .base import MongoTestCase
+
+
+def stuck_feed(seq):
+    """
+    A change feed reporting more changes without ever moving past `seq`.
+    """
+
+    async def fetch_changes(since):
+        await asyncio.sleep(0)
+        return {
+            "since": since,
+            "seq": seq,
+            "reset_required": False,
+            "has_more": True,
+            "rows": [],
+        }
+
+    return mock.AsyncMock(side_effect=fetch_changes)
+
+
+@override_settings(LIVE_POLL_INTERVAL=0.05, LIVE_MAX_CONNECTION_SECONDS=0)
+class LiveChangesTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        live._broadcasters.clear()
+        self.addCleanup(live._broadcasters.clear)
+
+    async def test_poller_waits_when_the_feed_does_not_advance(self):
+        broadcaster = live.ChangeBroadcaster()
+        fetch_changes = stuck_feed(0)
+        with mock.patch.object(live, "_fetch_changes", fetch_changes):
+            subscription = await broadcaster.subscribe()
+            await asyncio.sleep(0.2)
+            broadcaster.unsubscribe(subscription)
+            await broadcaster._task
+        self.assertLessEqual(fetch_changes.await_count, 6)
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_catch_up_stops_when_the_feed_does_not_advance(self):
+        fetch_changes = stuck_feed(5)
+        with mock.patch.object(live, "_fetch_changes", fetch_changes):
+            events = [event async for event in live.change_events(3, json.dumps)]
+        self.assertEqual(events[0], "retry: 1000\n\n")
+        # One event to reach seq 5, then no more requests for the same seq
+        self.assertEqual(len(events), 2)
+        self.assertTrue(events[1].startswith("id: 5\nevent: changes\n"))
+
+
+class DataEventsViewTests(MongoTestCase):
+    def test_wsgi_requests_are_refused(self):
+        response = Client().get("/api/data/events/")
+        self.assertEqual(response.status_code, 501)
+        self.assertIn("ASGI", response.json()["error"])
+
+    async def test_asgi_requests_are_served(self):
+        response = await AsyncClient().get("/api/data/events/?since=x")
+        self.assertEqual(response.status_code, 400)
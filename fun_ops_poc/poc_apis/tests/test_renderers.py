@@ -0,0 +1,32 @@
+import decimal
+
+import orjson
+from bson import Binary, Decimal128, ObjectId
+from django.test import SimpleTestCase
+
+from poc_apis.renderers import dumps
+
+
+class DumpsTests(SimpleTestCase):
+    def test_bson_values(self):
+        object_id = ObjectId()
+        data = {
+            "_id": object_id,
+            "price": Decimal128("12.50"),
+            "total": decimal.Decimal("3.25"),
+            "tags": {"a"},
+        }
+        self.assertEqual(
+            orjson.loads(dumps(data)),
+            {"_id": str(object_id), "price": 12.5, "total": 3.25, "tags": ["a"]},
+        )
+
+    def test_binary_values_are_base64_encoded(self):
+        data = {"raw": b"\xff\x00abc", "binary": Binary(b"\x89PNG", subtype=0)}
+        self.assertEqual(
+            orjson.loads(dumps(data)), {"raw": "/wBhYmM=", "binary": "iVBORw=="}
+        )
+
+    def test_unknown_types_still_fail(self):
+        with self.assertRaises(TypeError):
+            dumps({"value": object()})
@@ -0,0 +1,55 @@
+from unittest import mock
+
+from django.test import override_settings
+
+from poc_apis.models import column_schema, table_data
+from poc_apis.schema import (
+    LAYOUT_FIELD,
+    add_schema_column,
+    compact_columns,
+    start_compaction,
+)
+
+from .base import MongoTestCase
+
+
+def mark_layout(ids, layout):
+    # mongomock has no $replaceWith, so records are only marked as moved
+    return table_data.update_many(
+        {"_id": {"$in": ids}, LAYOUT_FIELD: {"$ne": layout}},
+        {"$set": {LAYOUT_FIELD: layout}},
+    ).modified_count
+
+
+@override_settings(COLUMN_SCHEMA_TTL=0)
+@mock.patch("poc_apis.schema._compact_batch", mark_layout)
+class CompactionTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload(b"Name,Amount\na,1\nb,2\n")
+
+    def status_column(self):
+        return column_schema.find_one({"name": "Status"})
+
+    def test_columns_with_defaults_are_compacted_once(self):
+        add_schema_column("Status", "new")
+        self.assertEqual(compact_columns(), {"rows_compacted": 2})
+        column = self.status_column()
+        self.assertEqual(column["field"], "Status")
+        self.assertEqual(column["default"], "new")
+        self.assertTrue(column["default_filled"])
+        self.assertIsNone(start_compaction())
+        self.assertEqual(compact_columns(), {"rows_compacted": 0})
+
+    def test_columns_without_defaults_are_not_marked(self):
+        add_schema_column("Status")
+        compact_columns()
+        self.assertFalse(self.status_column()["default_filled"])
+        self.assertIsNone(start_compaction())
+
+    def test_re_adding_a_column_compacts_it_again(self):
+        add_schema_column("Status", "new")
+        compact_columns()
+        add_schema_column("Status", "old")
+        self.assertNotIn("default_filled", self.status_column())
+        self.assertIsNotNone(start_compaction())
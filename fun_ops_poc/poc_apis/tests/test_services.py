@@ -0,0 +1,34 @@
+from .base import MongoTestCase
+
+
+class KeysetPagingTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        # Numbers, text, booleans and empty cells in one column
+        self.upload(b"Name,Value\na,3\nb,x\nc,1\nd,\ne,true\nf,y\ng,2\n")
+        self.api.post(
+            f"/api/create_or_update_record/{self.record_id('e')}/",
+            {"Value": True},
+            format="json",
+        )
+
+    def record_id(self, name):
+        records = self.api.get("/api/data/").json()["records"]
+        return next(record["_id"] for record in records if record["Name"] == name)
+
+    def pages(self, sort):
+        url = f"/api/data/?limit=2&sort={sort}"
+        names = []
+        while url:
+            page = self.api.get(url).json()
+            names += [record["Name"] for record in page["records"]]
+            cursor = page["next_cursor"]
+            url = cursor and f"/api/data/?limit=2&sort={sort}&after={cursor}"
+        return names
+
+    def test_mixed_type_column_pages_ascending(self):
+        # Empty first, then numbers, text and booleans, as MongoDB sorts them
+        self.assertEqual(self.pages("Value"), ["d", "c", "g", "a", "b", "f", "e"])
+
+    def test_mixed_type_column_pages_descending(self):
+        self.assertEqual(self.pages("-Value"), ["e", "f", "b", "a", "g", "c", "d"])
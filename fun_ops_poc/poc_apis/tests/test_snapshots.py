@@ -0,0 +1,114 @@
+from unittest import mock
+
+import pyarrow as pa
+from django.test import override_settings
+
+from poc_apis import snapshots
+from poc_apis.caching import data_version
+
+from .base import MongoTestCase
+
+
+class PendingChangesTests(MongoTestCase):
+    def test_stops_when_seq_does_not_advance(self):
+        stuck = {
+            "since": 4,
+            "seq": 4,
+            "reset_required": False,
+            "has_more": True,
+            "rows": [],
+        }
+        with mock.patch.object(
+            snapshots, "fetch_changes", return_value=stuck
+        ) as fetch_changes:
+            self.assertEqual(snapshots.pending_changes(4), (4, {}, []))
+        fetch_changes.assert_called_once_with(4)
+
+
+@override_settings(STREAM_BATCH_SIZE=2)
+class SnapshotReplayTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload(b"Name,Amount,City\nAsha,10,Pune\nRavi,20,Delhi\nMeera,30,Goa\n")
+        self.records = self.api.get("/api/data/?sort=Amount").json()["records"]
+        self.snapshot = snapshots.current_snapshot()
+
+    def post(self, path, body):
+        response = self.api.post(path, body, format="json")
+        self.assertIn(response.status_code, (200, 201), response.content)
+        return response
+
+    def refresh(self):
+        """
+        Refresh the snapshot, returning it and whether it was rebuilt.
+        """
+        with mock.patch.object(
+            snapshots, "build_snapshot", wraps=snapshots.build_snapshot
+        ) as build_snapshot:
+            table = snapshots.current_snapshot()
+        self.assertEqual(snapshots.latest_snapshot_version(), data_version())
+        return table, build_snapshot.called
+
+    def rows(self, table):
+        return {row.pop("_id"): row for row in table.to_pylist()}
+
+    def test_built_in_batches_with_registry_types(self):
+        self.assertEqual(self.snapshot.num_rows, 3)
+        self.assertEqual(len(self.snapshot.to_batches()), 2)
+        self.assertEqual(self.snapshot.schema.field("Amount").type, pa.int64())
+        self.assertEqual(
+            self.rows(self.snapshot)[self.records[0]["_id"]],
+            {"Name": "Asha", "Amount": 10, "City": "Pune"},
+        )
+
+    def test_edits_are_applied_from_the_change_feed(self):
+        self.post(
+            f"/api/create_or_update_record/{self.records[0]['_id']}/", {"Amount": 11}
+        )
+        created = self.post(
+            "/api/create_or_update_record/",
+            {"Name": "Zoe", "Amount": 5, "City": "Agra"},
+        ).json()["id"]
+        self.post(
+            "/api/rename-column/",
+            {"old_column_name": "City", "new_column_name": "Town"},
+        )
+        self.post("/api/soft-delete-column/", {"column_name": "Name"})
+
+        table, rebuilt = self.refresh()
+        self.assertFalse(rebuilt)
+        rows = self.rows(table)
+        self.assertEqual(
+            rows[self.records[0]["_id"]], {"Name": "Asha", "Amount": 11, "Town": "Pune"}
+        )
+        self.assertEqual(rows[created], {"Name": "Zoe", "Amount": 5, "Town": "Agra"})
+        self.assertEqual(list(rows), sorted(rows))
+
+    def test_column_deleted_and_re_added_is_rebuilt_with_its_default(self):
+        self.post("/api/soft-delete-column/", {"column_name": "City"})
+        self.post("/api/add-column/", {"column_name": "City", "default": "n/a"})
+
+        table, rebuilt = self.refresh()
+        self.assertTrue(rebuilt)
+        self.assertEqual(table["City"].to_pylist(), ["n/a"] * 3)
+
+    def test_rename_over_an_existing_column_is_rebuilt(self):
+        self.post(
+            "/api/rename-column/",
+            {"old_column_name": "City", "new_column_name": "Name"},
+        )
+
+        table, rebuilt = self.refresh()
+        self.assertTrue(rebuilt)
+        self.assertEqual(table.column_names, ["_id", "Amount", "Name"])
+        self.assertEqual(table["Name"].to_pylist(), ["Pune", "Delhi", "Goa"])
+
+    def test_values_that_no_longer_fit_their_type_become_a_union(self):
+        self.post(
+            f"/api/create_or_update_record/{self.records[2]['_id']}/", {"Amount": "N/A"}
+        )
+
+        table, rebuilt = self.refresh()
+        self.assertTrue(rebuilt)
+        self.assertEqual(table.schema.field("Amount").type, snapshots.MIXED_TYPE)
+        self.assertEqual(table["Amount"].to_pylist(), [10, 20, "N/A"])
@@ -0,0 +1,134 @@
+import io
+from unittest import mock
+
+import mongomock
+from django.test import override_settings
+from openpyxl import Workbook
+
+from poc_apis import services, views
+from poc_apis.caching import data_version
+from poc_apis.models import get_db, table_data
+from poc_apis.schema import schema_columns
+
+from .base import MongoTestCase
+
+
+class UploadSwapTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload(b"Name,Amount\nAsha,10\nRavi,20\n")
+
+    def columns(self):
+        return [column["name"] for column in schema_columns()]
+
+    def names(self):
+        return [
+            record["Name"] for record in self.api.get("/api/data/").json()["records"]
+        ]
+
+    @override_settings(UPLOAD_KEEP_VERSIONS=1)
+    def test_records_never_go_missing_during_the_swap(self):
+        rename = mongomock.collection.Collection.rename
+        present = []
+
+        def checked_rename(collection, new_name, **kwargs):
+            present.append(table_data.name in get_db().list_collection_names())
+            return rename(collection, new_name, **kwargs)
+
+        with mock.patch.object(
+            mongomock.collection.Collection, "rename", checked_rename
+        ):
+            response = self.upload(b"Name,City\nZoe,Agra\n")
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(present and all(present))
+        self.assertEqual(self.names(), ["Zoe"])
+        self.assertEqual(self.columns(), ["Name", "City"])
+
+    @override_settings(UPLOAD_KEEP_VERSIONS=1)
+    def test_rollback_restores_the_previous_table_and_registry(self):
+        self.upload(b"Name,City\nZoe,Agra\n")
+        response = self.api.post("/api/upload/rollback/", {}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names(), ["Asha", "Ravi"])
+        self.assertEqual(self.columns(), ["Name", "Amount"])
+
+    def test_no_version_is_kept_by_default(self):
+        with mock.patch.object(services, "archive_collection") as archive:
+            self.upload(b"Name,City\nZoe,Agra\n")
+        archive.assert_not_called()
+        self.assertEqual(services.list_record_versions(), [])
+        response = self.api.post("/api/upload/rollback/", {}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_failed_registry_write_leaves_the_live_table_untouched(self):
+        with mock.patch.object(
+            services, "write_column_schema", side_effect=ValueError("down")
+        ):
+            response = self.upload(b"Name,City\nZoe,Agra\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.names(), ["Asha", "Ravi"])
+        self.assertEqual(self.columns(), ["Name", "Amount"])
+        self.assertEqual(
+            [name for name in get_db().list_collection_names() if "staging" in name],
+            [],
+        )
+
+    def test_failed_registry_swap_rebuilds_it_from_the_new_records(self):
+        rename = mongomock.collection.Collection.rename
+
+        def failing_rename(collection, new_name, **kwargs):
+            if new_name == "column_schema":
+                raise RuntimeError("down")
+            return rename(collection, new_name, **kwargs)
+
+        with mock.patch.object(
+            mongomock.collection.Collection, "rename", failing_rename
+        ):
+            response = self.upload(b"Name,City\nZoe,Agra\n")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.names(), ["Zoe"])
+        self.assertEqual(self.columns(), ["Name", "City"])
+
+
+class UploadChangeFeedTests(MongoTestCase):
+    def test_reset_is_logged_when_registration_fails(self):
+        self.upload(b"Name\nAsha\n")
+        since = data_version(fresh=True)
+        with mock.patch.object(
+            views, "register_dataset", side_effect=ValueError("catalog down")
+        ):
+            response = self.upload(b"Name\nZoe\n")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["registration_error"], "catalog down")
+        changes = self.api.get(f"/api/data/changes/?since={since}").json()
+        self.assertTrue(changes["reset_required"])
+        self.assertEqual(changes["seq"], since + 1)
+
+
+class ExcelUploadTests(MongoTestCase):
+    def xlsx(self, *rows):
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        content = io.BytesIO()
+        workbook.save(content)
+        return content.getvalue()
+
+    def test_repeated_and_missing_headers_keep_every_column(self):
+        response = self.upload(
+            self.xlsx(["A", "A", "B"], [1, 2, "x"], [3, 4, "y", None, "extra"]),
+            name="data.xlsx",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        data = self.api.get("/api/data/", {"sort": "A"}).json()
+        self.assertEqual(
+            [column["name"] for column in data["columns"]],
+            ["A", "A.1", "B", "Unnamed: 3", "Unnamed: 4"],
+        )
+        self.assertEqual(
+            [
+                [record.get(name) for name in ("A", "A.1", "B", "Unnamed: 4")]
+                for record in data["records"]
+            ],
+            [[1, 2, "x", None], [3, 4, "y", "extra"]],
+        )
@@ -1,33 +1,81 @@
-from django.urls import path
-from .views import ExcelUploadView
-from .views import ExcelDataView
+from django.urls import include, path
+from .async_views import (
+    AsyncColDeletionApprovedView,
+    AsyncColDeletionRejectedView,
+    AsyncExcelDataView,
+    AsyncExcelExportView,
+    AsyncPdfExportView,
+    AsyncRecordDeletionApproved,
+    AsyncRecordDeletionDisapproved,
+)
+from .views import ExcelUploadView, UploadRollbackView
+from .views import ExcelDataView, AggregateView, DataChangesView, DataEventsView
 from .views import (
     ModifyRecordView,
+    BulkRecordEditView,
     AddColumnView,
     SoftDeleteColumnView,
     RenameColumnView,
+    CompactColumnsView,
     ExcelExportView,
     PdfExportView,
     ColDeletionApprovedView,
     ColDeletionRejectedView,
     RecordDeletionApproved,
     RecordDeletionDisapproved,
+    JobStatusView,
+    JobDownloadView,
+    DatasetListView,
+    HealthView,
 )
 
+# ASGI-native versions of the read, export and approval endpoints
+async_urlpatterns = [
+    path("data/", AsyncExcelDataView.as_view(), name="async-excel-data"),
+    path("export/excel/", AsyncExcelExportView.as_view(), name="async_export_excel"),
+    path("export/pdf/", AsyncPdfExportView.as_view(), name="async_export_pdf"),
+    path(
+        "col_deletion_approval/",
+        AsyncColDeletionApprovedView.as_view(),
+        name="async_col_deletion_approval",
+    ),
+    path(
+        "col_deletion_rejection/",
+        AsyncColDeletionRejectedView.as_view(),
+        name="async_col_deletion_rejection",
+    ),
+    path(
+        "record_deletion_approved/",
+        AsyncRecordDeletionApproved.as_view(),
+        name="async_record_deletion_approved",
+    ),
+    path(
+        "record_deletion_disapproved/",
+        AsyncRecordDeletionDisapproved.as_view(),
+        name="async_record_deletion_disapproved",
+    ),
+]
+
 urlpatterns = [
     path("upload/", ExcelUploadView.as_view(), name="excel-upload"),
+    path("upload/rollback/", UploadRollbackView.as_view(), name="upload-rollback"),
     path("data/", ExcelDataView.as_view(), name="excel-data"),
+    path("data/changes/", DataChangesView.as_view(), name="data-changes"),
+    path("data/events/", DataEventsView.as_view(), name="data-events"),
+    path("aggregate/", AggregateView.as_view(), name="aggregate"),
     path("create_or_update_record/", ModifyRecordView.as_view(), name="create-record"),
     path(
         "create_or_update_record/<str:record_id>/",
         ModifyRecordView.as_view(),
         name="update-record",
     ),
+    path("records/bulk/", BulkRecordEditView.as_view(), name="records-bulk"),
     path("add-column/", AddColumnView.as_view(), name="add_column"),
     path(
         "soft-delete-column/", SoftDeleteColumnView.as_view(), name="soft_delete_column"
     ),
     path("rename-column/", RenameColumnView.as_view(), name="rename_column"),
+    path("columns/compact/", CompactColumnsView.as_view(), name="compact_columns"),
     path("export/excel/", ExcelExportView.as_view(), name="export_excel"),
     path("export/pdf/", PdfExportView.as_view(), name="export_pdf"),
     path(
@@ -50,4 +98,11 @@ urlpatterns = [
         RecordDeletionDisapproved.as_view(),
         name="record_deletion_disapproved",
     ),
+    path("datasets/", DatasetListView.as_view(), name="datasets"),
+    path("health/", HealthView.as_view(), name="health"),
+    path("jobs/<str:job_id>/", JobStatusView.as_view(), name="job_status"),
+    path(
+        "jobs/<str:job_id>/download/", JobDownloadView.as_view(), name="job_download"
+    ),
+    path("async/", include(async_urlpatterns)),
 ]
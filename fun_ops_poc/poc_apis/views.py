@@ -1,55 +1,86 @@
-import pandas as pd
-from io import BytesIO
-from django.http import HttpResponse
+import tempfile
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from bson import ObjectId
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.views import View
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from openpyxl import Workbook
-from openpyxl.drawing.image import Image
-from openpyxl.chart import BarChart, Reference
-from openpyxl.chart import BarChart, Reference, Series
-from openpyxl.chart.layout import Layout, ManualLayout
-from openpyxl import load_workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-import matplotlib.pyplot as plt
-from .models import table_data, deleted_columns
+from .models import RECORD_FLAG_FIELDS, current_dataset, table_data, deleted_columns, jobs
+from .aggregates import aggregate_plan, run_aggregate
+from .caching import (
+    data_etag,
+    data_version,
+    etag_matches,
+    query_fingerprint,
+)
+from .changes import RESET, fetch_changes, log_change
+from .datasets import list_datasets, register_dataset
+from .exports import XLSX_CONTENT_TYPE, write_excel_export, write_pdf_export
+from .filters import check_sort, record_filter
+from .jobs import (
+    describe_job,
+    submit_compaction_job,
+    submit_export_job,
+    submit_upload_job,
+)
+from .live import change_events
+from .renderers import dumps
+from .snapshots import export_source
+from .schema import (
+    add_schema_column,
+    bump_schema_version,
+    record_update,
+    rename_schema_column,
+    schema_column_names,
+)
 from .services import (
-    process_excel_file,
-    insert_records,
-    clear_existing_records,
-    clear_deleted_columns,
-    fetch_all_deleted_column_names,
-    fetch_all_deleted_by_admin_column_names,
-    fetch_all_records,
-    process_csv_file,
-    process_excel_file,
-    process_tsv_file,
-    fetch_all_deleted_by_admin_record_names,
-    fetch_all_rejected_by_admin_column_names,
-    fetch_all_rejected_by_admin_record_names,
+    UPLOAD_EXTENSIONS,
+    apply_record_edits,
+    bulk_update_by_key,
+    fetch_data_view,
+    iter_records,
+    iter_upload_chunks,
+    list_record_versions,
+    new_record_document,
+    mongo_health,
+    replace_records,
+    rollback_records,
 
 
 )
 
-def plot_chart():
-    file_path = r"C:\Users\bhawna.atrish\Downloads\chartData.xlsx"
-    df = pd.read_excel(file_path, "Sheet1")
-    month = df["Month"]
-    profit = df["Profit"]
-    plt.figure(figsize=(10, 5))
-    plt.bar(month, profit, color="Skyblue")
-    plt.show()
+def wants_background(request):
+    """
+    Whether the caller asked for the work to run as a background job (?background=true).
+    """
+    return request.GET.get("background", "").lower() in ("1", "true")
+
+
+def job_accepted(job_id):
+    return {"job_id": job_id, "status_url": f"/api/jobs/{job_id}/"}
+
+
+def queue_export(kind, chart=None):
+    try:
+        job_id = submit_export_job(kind, chart)
+    except Exception as e:
+        return JsonResponse({"error": f"Error queueing export job: {str(e)}"}, status=500)
+    return JsonResponse(job_accepted(job_id), status=202)
+
 
 class ExcelUploadView(APIView):
+    # Uploading to a dataset that doesn't exist yet creates it
+    creates_dataset = True
+
     def post(self, request, *args, **kwargs):
         """
         Handle POST requests to upload an Excel, CSV, or TSV file and replace existing data in MongoDB.
+        With ?dataset=<id> the file creates or replaces that dataset instead of the default one.
         http://localhost:8000/api/upload/
+        http://localhost:8000/api/upload/?dataset=sales-2024
         """
         if "file" not in request.FILES:
             return Response(
@@ -59,17 +90,13 @@ class ExcelUploadView(APIView):
         uploaded_file = request.FILES["file"]
         file_name = uploaded_file.name
 
+        if wants_background(request):
+            return self.post_background(uploaded_file)
+
         try:
-            if file_name.endswith(".xlsx") or file_name.endswith(".xls"):
-                # Process Excel file
-                records = process_excel_file(uploaded_file)
-            elif file_name.endswith(".csv"):
-                # Process CSV file
-                records = process_csv_file(uploaded_file)
-            elif file_name.endswith(".tsv"):
-                # Process TSV file
-                records = process_tsv_file(uploaded_file)
-            else:
+            # Files are read lazily in chunks; nothing is parsed until ingestion
+            chunks = iter_upload_chunks(uploaded_file, file_name)
+            if chunks is None:
                 return Response(
                     {
                         "error": "Unsupported file format. Please upload an Excel, CSV, or TSV file."
@@ -77,53 +104,362 @@ class ExcelUploadView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            # Clear existing data and insert new records
-            clear_deleted_columns()
-            clear_existing_records()
-            insert_records(records)
+            # Stream the new records into a staging collection and swap it in
+            stats = replace_records(chunks)
         except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(
-            {"message": "Data successfully replaced in MongoDB"},
-            status=status.HTTP_201_CREATED,
-        )
+        response_data = {"message": "Data successfully replaced in MongoDB", "stats": stats}
+        try:
+            register_dataset(file_name)
+        except Exception as e:
+            # The data is replaced; only the catalog entry is missing
+            response_data["registration_error"] = str(e)
+        finally:
+            # Clients must reload the table whatever happened to the catalog
+            try:
+                log_change(RESET)
+            except ValueError as e:
+                response_data["change_feed_error"] = str(e)
+
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+    def post_background(self, uploaded_file):
+        if not uploaded_file.name.endswith(UPLOAD_EXTENSIONS):
+            return Response(
+                {
+                    "error": "Unsupported file format. Please upload an Excel, CSV, or TSV file."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            job_id = submit_upload_job(uploaded_file)
+        except Exception as e:
+            return Response(
+                {"error": f"Error queueing upload job: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        return Response(job_accepted(job_id), status=status.HTTP_202_ACCEPTED)
+
+
+class UploadRollbackView(APIView):
+    def get(self, request, *args, **kwargs):
+        """
+        List the previous tables kept from earlier uploads, newest first.
+        http://localhost:8000/api/upload/rollback/
+        """
+        try:
+            versions = list_record_versions()
+        except Exception as e:
+            return Response(
+                {"error": f"Error listing versions in MongoDB: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        return Response({"versions": versions}, status=status.HTTP_200_OK)
+
+    def post(self, request, *args, **kwargs):
+        """
+        Swap a previous table back in. Takes an optional 'version' (defaults to the newest).
+        http://localhost:8000/api/upload/rollback/
+        """
+        try:
+            result = rollback_records(request.data.get("version"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        log_change(RESET)
+
+        return Response(result, status=status.HTTP_200_OK)
+
+
+def parse_fields(fields):
+    """
+    Split a comma-separated 'fields' parameter into column names.
+    """
+    return [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+
+def parse_limit(query_params, default, maximum):
+    """
+    Read a 'limit' parameter between 1 and `maximum`, raising ValueError on bad input.
+    """
+    limit = query_params.get("limit", default)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError("'limit' must be an integer")
+    if limit < 1 or limit > maximum:
+        raise ValueError(f"'limit' must be between 1 and {maximum}")
+    return limit
+
+
+def parse_page_params(query_params):
+    """
+    Read the pagination parameters of /api/data/, raising ValueError on bad input.
+    """
+    limit = parse_limit(
+        query_params, settings.DATA_PAGE_SIZE, settings.DATA_MAX_PAGE_SIZE
+    )
+
+    return {
+        "limit": limit,
+        "after": query_params.get("after") or None,
+        "include_total": query_params.get("include_total", "").lower() in ("1", "true"),
+        **parse_query_params(query_params),
+    }
+
+
+def parse_query_params(query_params):
+    """
+    Read the fields, sort, filter and search parameters of /api/data/ (pages
+    and streams alike), compiling the filter against the column registry.
+    Raises ValueError on unknown columns or a malformed filter.
+    """
+    sort = query_params.get("sort")
+    check_sort(sort)
+    return {
+        "fields": parse_fields(query_params.get("fields")),
+        "sort": sort,
+        "where": record_filter(
+            query_params.get("filter"), query_params.get("search")
+        ),
+    }
+
+
+def parse_aggregate_params(query_params):
+    """
+    Read the parameters of /api/aggregate/ as arguments of
+    aggregates.aggregate_plan, raising ValueError on a bad limit.
+    """
+    return {
+        "group_by": parse_fields(query_params.get("group_by")) or [],
+        "metrics": parse_fields(query_params.get("metrics")) or ["count"],
+        "pivot": query_params.get("pivot") or None,
+        "sort": query_params.get("sort"),
+        "limit": parse_limit(
+            query_params, settings.AGGREGATE_MAX_GROUPS, settings.AGGREGATE_MAX_GROUPS
+        ),
+        "filter_text": query_params.get("filter"),
+        "search": query_params.get("search"),
+    }
+
+
+def parse_chart_params(query_params):
+    """
+    Read the chart parameters of the Excel export: None without 'chart',
+    otherwise the aggregate_plan arguments of the summary to chart (the
+    /api/aggregate/ parameters). Raises ValueError on bad input, so bad
+    columns are reported before the export starts.
+    """
+    chart = query_params.get("chart")
+    if not chart:
+        return None
+    if chart != "bar":
+        raise ValueError("'chart' must be 'bar'")
+    params = parse_aggregate_params(query_params)
+    aggregate_plan(**params)
+    return params
+
+
+def stream_records(records, stream_format):
+    """
+    Encode records as NDJSON lines or as one JSON array, yielding a chunk per
+    STREAM_BATCH_SIZE records so the response never holds the whole table.
+    """
+    separator = b"\n" if stream_format == "ndjson" else b","
+    batch = []
+    first = True
+    if stream_format == "json":
+        yield b"["
+    try:
+        for record in records:
+            batch.append(dumps(record))
+            if len(batch) >= settings.STREAM_BATCH_SIZE:
+                yield (b"" if first else separator) + separator.join(batch)
+                batch, first = [], False
+        if batch:
+            yield (b"" if first else separator) + separator.join(batch)
+    except Exception as e:
+        # Headers are already sent; end the stream and leave a trace in the logs
+        print(f"Error streaming records from MongoDB: {str(e)}")
+        raise
+    if stream_format == "ndjson":
+        yield b"\n"
+    else:
+        yield b"]"
+
 
 class ExcelDataView(APIView):
     """
-    Handle GET requests to retrieve data from MongoDB and return it as a list of dictionaries.
-    http://localhost:8000/api/data/
+    Handle GET requests to retrieve one page of data from MongoDB.
+    Query parameters: limit, after (cursor from the previous page's next_cursor),
+    fields (comma-separated projection), sort (e.g. "-Amount,Name"), filter
+    (JSON, see filters.py), search (text to find in any text column), include_total.
+    With stream=ndjson or stream=json the whole table is streamed instead of a page.
+    http://localhost:8000/api/data/?limit=100&sort=-Amount
+    http://localhost:8000/api/data/?filter={"Amount":{"gte":100}}&search=pune
+    http://localhost:8000/api/data/?stream=ndjson
+    """
+
+    def get(self, request, *args, **kwargs):
+        stream_format = request.query_params.get("stream")
+        if stream_format:
+            return self.stream(request, stream_format)
+
+        # Read the version first: a new one makes the filter use a fresh registry
+        try:
+            version = data_version()
+        except ValueError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        try:
+            page_params = parse_page_params(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = query_fingerprint(request.query_params)
+        etag = data_etag(version, fingerprint)
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return HttpResponse(status=304, headers={"ETag": etag})
+
+        # Responses are cached rendered, keyed by the data version
+        cache_key = f"data:{current_dataset()}:{version}:{fingerprint}"
+        content = cache.get(cache_key)
+        if content is None:
+            try:
+                # Fetch the page, the deleted/reviewed columns and the flagged record IDs
+                response_data = fetch_data_view(page_params)
+            except ValueError as e:
+                return Response(
+                    {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+            content = dumps(response_data)
+            cache.set(cache_key, content, settings.DATA_CACHE_TIMEOUT)
+
+        return HttpResponse(
+            content, content_type="application/json", headers={"ETag": etag}
+        )
+
+    def stream(self, request, stream_format):
+        if stream_format not in ("ndjson", "json"):
+            return Response(
+                {"error": "'stream' must be 'ndjson' or 'json'"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            query_params = parse_query_params(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return StreamingHttpResponse(
+            stream_records(iter_records(**query_params), stream_format),
+            content_type=(
+                "application/x-ndjson" if stream_format == "ndjson" else "application/json"
+            ),
+        )
+
+
+class AggregateView(APIView):
+    """
+    Summarize the live records for charts: group them by columns, optionally
+    pivot a column's values into columns, and compute metrics per group.
+    Query parameters: group_by (comma-separated columns), metrics
+    (comma-separated, e.g. "sum:Amount,avg:Amount,count"; default "count"),
+    pivot (a column), sort (group columns or metrics, e.g. "-sum:Amount"),
+    limit (groups), and filter/search as for /api/data/.
+    http://localhost:8000/api/aggregate/?group_by=City&metrics=sum:Amount,count
+    http://localhost:8000/api/aggregate/?group_by=City&pivot=Year&metrics=sum:Amount
     """
 
     def get(self, request, *args, **kwargs):
+        # Read the version first: a new one makes the plan use a fresh registry
+        try:
+            version = data_version()
+        except ValueError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        try:
+            plan = aggregate_plan(**parse_aggregate_params(request.query_params))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = query_fingerprint(request.query_params)
+        etag = data_etag(version, fingerprint)
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return HttpResponse(status=304, headers={"ETag": etag})
+
+        # Summaries only change with the data, so they are cached per version
+        cache_key = f"aggregate:{current_dataset()}:{version}:{fingerprint}"
+        content = cache.get(cache_key)
+        if content is None:
+            try:
+                content = dumps(run_aggregate(plan))
+            except ValueError as e:
+                return Response(
+                    {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+            cache.set(cache_key, content, settings.AGGREGATE_CACHE_TIMEOUT)
+
+        return HttpResponse(
+            content, content_type="application/json", headers={"ETag": etag}
+        )
+
+
+class DataChangesView(APIView):
+    def get(self, request, *args, **kwargs):
+        """
+        Return what changed since sequence number 'since': the changed rows,
+        the column changes, and the 'seq' to pass as 'since' next time. With
+        'reset_required' the client must reload /api/data/ instead.
+        http://localhost:8000/api/data/changes/?since=42
+        """
         try:
-            # Fetch all records
-            records = fetch_all_records()
-
-            # Fetch deleted columns
-            deleted_columns = fetch_all_deleted_column_names()
-            deleted_by_admin_columns = fetch_all_deleted_by_admin_column_names()
-            deleted_by_admin_records = fetch_all_deleted_by_admin_record_names()
-            rejected_by_admin_columns = fetch_all_rejected_by_admin_column_names()
-            rejected_by_admin_records = fetch_all_rejected_by_admin_record_names()
-
-            # Combine the data into a single response
-            response_data = {
-                "records": records,
-                "deleted_columns": deleted_columns,
-                "deleted_by_admin_columns": deleted_by_admin_columns,
-                "deleted_by_admin_records": deleted_by_admin_records,
-                "rejected_by_admin_columns": rejected_by_admin_columns,
-                "rejected_by_admin_records": rejected_by_admin_records,
-
-            }
+            since = int(request.query_params.get("since", ""))
+        except ValueError:
+            return Response(
+                {"error": "'since' must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
+        try:
+            result = fetch_changes(since)
         except ValueError as e:
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+        return Response(result, status=status.HTTP_200_OK)
 
-        return Response(response_data, status=status.HTTP_200_OK)
+
+class DataEventsView(View):
+    """
+    Push changes to the client as server-sent events instead of polling.
+    Each event carries the same body as /api/data/changes/ ('changes', or
+    'reset' when the client must reload /api/data/) with its seq as the
+    event ID, so a reconnecting EventSource resumes from Last-Event-ID.
+    Needs an ASGI server (e.g. uvicorn fun_ops_poc.asgi:application).
+    http://localhost:8000/api/data/events/?since=42
+    """
+
+    async def get(self, request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            # Under WSGI Django would buffer the endless stream and send nothing
+            return JsonResponse(
+                {"error": "Live updates need the ASGI server (fun_ops_poc.asgi)"},
+                status=501,
+            )
+        since = request.headers.get("Last-Event-ID") or request.GET.get("since")
+        try:
+            since = int(since) if since else None
+        except ValueError:
+            return JsonResponse({"error": "'since' must be an integer"}, status=400)
+
+        response = StreamingHttpResponse(
+            change_events(since, lambda data: dumps(data).decode()),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
 
 
 class ModifyRecordView(APIView):
@@ -139,15 +475,9 @@ class ModifyRecordView(APIView):
             if record_id:
                 # Update an existing record
                 object_id = ObjectId(record_id)
-                current_document = table_data.find_one({"_id": object_id})
 
-                if not current_document:
-                    return Response(
-                        {"error": "Record not found"}, status=status.HTTP_404_NOT_FOUND
-                    )
-
-                # Filter out any fields not in the current document
-                allowed_fields = set(current_document.keys())
+                # Filter out any fields that aren't columns of the table
+                allowed_fields = schema_column_names()
                 filtered_update_data = {
                     key: value
                     for key, value in update_data.items()
@@ -161,21 +491,33 @@ class ModifyRecordView(APIView):
                     )
 
                 result = table_data.update_one(
-                    {"_id": object_id}, {"$set": filtered_update_data}
+                    {"_id": object_id}, record_update(filtered_update_data)
                 )
 
                 if result.matched_count == 0:
                     return Response(
                         {"error": "Record not found"}, status=status.HTTP_404_NOT_FOUND
                     )
+                log_change("records", record_ids=[object_id])
 
                 return Response(
                     {"message": "Record updated successfully"},
                     status=status.HTTP_200_OK,
                 )
             else:
-                # Create a new record
-                result = table_data.insert_one(update_data)
+                # Create a new record; unknown fields become new columns
+                known = schema_column_names()
+                added = [
+                    {"op": "add", "column": name, "default": None}
+                    for name in update_data
+                    if name not in known and name not in RECORD_FLAG_FIELDS + ("_id",)
+                ]
+                result = table_data.insert_one(new_record_document(update_data))
+                log_change(
+                    "schema" if added else "records",
+                    record_ids=[result.inserted_id],
+                    columns=added,
+                )
                 return Response(
                     {
                         "message": "New row created successfully",
@@ -204,6 +546,7 @@ class ModifyRecordView(APIView):
                 return Response(
                     {"error": "Record not found"}, status=status.HTTP_404_NOT_FOUND
                 )
+            log_change("records", record_ids=[record_id])
 
             return Response(
                 {"message": "Record marked as deleted successfully"},
@@ -217,10 +560,73 @@ class ModifyRecordView(APIView):
             )
 
 
+class BulkRecordEditView(APIView):
+    def post(self, request, *args, **kwargs):
+        """
+        Save a batch of grid edits in one request:
+        {"updates": [{"record_id": ..., "changes": {...}}], "new_rows": [{...}]}
+        Returns a status per update and per new row.
+        http://localhost:8000/api/records/bulk/
+        """
+        if not isinstance(request.data, dict):
+            return Response(
+                {"error": "Request body must be a JSON object"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        updates = request.data.get("updates", [])
+        new_rows = request.data.get("new_rows", [])
+
+        if not isinstance(updates, list) or not isinstance(new_rows, list):
+            return Response(
+                {"error": "'updates' and 'new_rows' must be lists"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not updates and not new_rows:
+            return Response(
+                {"error": "No updates or new rows provided"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(updates) + len(new_rows) > settings.BULK_EDIT_MAX_ROWS:
+            return Response(
+                {"error": f"At most {settings.BULK_EDIT_MAX_ROWS} rows per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            summary = apply_record_edits(updates, new_rows)
+        except Exception as e:
+            return Response(
+                {"error": f"Error saving records in MongoDB: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        changed = [
+            result["record_id"]
+            for result in summary["updates"]
+            if result["status"] == "updated"
+        ]
+        changed += [
+            result["id"]
+            for result in summary["new_rows"]
+            if result["status"] == "created"
+        ]
+        if changed:
+            log_change("records", record_ids=changed)
+
+        return Response(
+            {
+                "message": f"{summary['matched_count']} record(s) updated, {summary['inserted_count']} created",
+                **summary,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class AddColumnView(APIView):
     def post(self, request, *args, **kwargs):
         """
         Add a new column to every document in the MongoDB collection.
+        Only the column registry changes: every record reads the optional
+        "default" (null if omitted) until a compaction stores it.
         http://localhost:8000/api/add-column/
         """
         try:
@@ -231,11 +637,17 @@ class AddColumnView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            result = table_data.update_many({}, {"$set": {column_name: None}})
+            default = request.data.get("default")
+            add_schema_column(column_name, default)
+            log_change(
+                "schema",
+                columns=[{"op": "add", "column": column_name, "default": default}],
+            )
+            count = table_data.estimated_document_count()
 
             return Response(
                 {
-                    "message": f"Column '{column_name}' added to {result.modified_count} documents"
+                    "message": f"Column '{column_name}' added to {count} documents"
                 },
                 status=status.HTTP_200_OK,
             )
@@ -262,19 +674,14 @@ class SoftDeleteColumnView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            # Check if the column is already in the `deleted_columns` collection
-            existing_entry = deleted_columns.find_one({"column_name": column_name})
-
-            if existing_entry:
-                # If it exists, update the "is_deleted" field to True
-                deleted_columns.update_one(
-                    {"column_name": column_name}, {"$set": {"is_deleted": True}}
-                )
-            else:
-                # If it does not exist, create a new document for the column
-                deleted_columns.insert_one(
-                    {"column_name": column_name, "is_deleted": True}
-                )
+            # Set "is_deleted" on the column's tracking document, creating it if needed
+            deleted_columns.update_one(
+                {"column_name": column_name},
+                {"$set": {"is_deleted": True}},
+                upsert=True,
+            )
+            bump_schema_version()
+            log_change("schema", columns=[{"op": "flags", "column": column_name}])
 
             return Response(
                 {
@@ -295,6 +702,8 @@ class RenameColumnView(APIView):
         """
         Rename a column in every document in the collection.
         Takes 'old_column_name' and 'new_column_name' as input.
+        Only the column registry changes; the values keep their stored field
+        until a compaction moves them.
         http://localhost:8000/api/rename-column/
         """
         try:
@@ -309,17 +718,26 @@ class RenameColumnView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            result = table_data.update_many(
-                {},
-                [
-                    {"$set": {new_column_name: "$" + old_column_name}},
-                    {"$unset": old_column_name},
+            if not rename_schema_column(old_column_name, new_column_name):
+                return Response(
+                    {"error": f"Column '{old_column_name}' not found"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            log_change(
+                "schema",
+                columns=[
+                    {
+                        "op": "rename",
+                        "column": old_column_name,
+                        "new_name": new_column_name,
+                    }
                 ],
             )
+            count = table_data.estimated_document_count()
 
             return Response(
                 {
-                    "message": f"Column '{old_column_name}' renamed to '{new_column_name}' in {result.modified_count} documents"
+                    "message": f"Column '{old_column_name}' renamed to '{new_column_name}' in {count} documents"
                 },
                 status=status.HTTP_200_OK,
             )
@@ -330,261 +748,215 @@ class RenameColumnView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-def generate_chart(df):
-    # 9. Create the bar chart using Matplotlib
-    plt.figure(figsize=(10, 5))
-    plt.bar(
-        df["EODBalance-14Aug"], df["Account ID"], color="Skyblue"
-    )  # Adjust the columns as per your data
-    plt.title("Monthly Profit")
-    plt.xlabel("Month")
-    plt.ylabel("Profit")
-
-    # 10. Save the plot to a BytesIO object
-    img_data = BytesIO()
-    plt.savefig(img_data, format="png")
-    img_data.seek(0)  # Rewind the data to the beginning
-
-    # 11. Close the plot to free up memory
-    plt.close()
-
-    return img_data
+class CompactColumnsView(APIView):
+    def post(self, request, *args, **kwargs):
+        """
+        Queue a background job that rewrites the records so added and renamed
+        columns are stored under their own names with defaults filled in.
+        http://localhost:8000/api/columns/compact/
+        """
+        try:
+            job_id = submit_compaction_job()
+        except Exception as e:
+            return Response(
+                {"error": f"Error queueing compaction job: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        return Response(job_accepted(job_id), status=status.HTTP_202_ACCEPTED)
 
 
 class ExcelExportView(View):
     def get(self, request, *args, **kwargs):
-        # Fetch data from the MongoDB collection
-        mongo_data = list(table_data.find({}, {'_id': 0}))  # Query without '_id' field
-
-        # Convert the data to a DataFrame
-        df = pd.DataFrame(mongo_data)
+        """
+        Export the live records (without soft-deleted rows and columns) as an .xlsx file.
+        With ?chart=bar a "Chart" sheet is added with a summary of the records and
+        a native Excel bar chart of it; the summary takes the /api/aggregate/
+        parameters (group_by, metrics, pivot, sort, limit, filter, search).
+        With ?background=true the export runs as a job and a job ID is returned instead.
+        http://localhost:8000/api/export/excel/
+        http://localhost:8000/api/export/excel/?chart=bar&group_by=City&metrics=sum:Amount
+        """
+        try:
+            chart = parse_chart_params(request.GET)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        if wants_background(request):
+            return queue_export("export_excel", chart)
 
-        # Save the DataFrame to a BytesIO object
-        buffer = BytesIO()
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Sheet1')
-        buffer.seek(0)
-        # plot_chart()
+        # Rows are streamed from the snapshot (or the cursor) into a write-only workbook spooled to disk
+        spool = tempfile.TemporaryFile()
+        try:
+            options = {}
+            if chart is not None:
+                options["chart"] = run_aggregate(aggregate_plan(**chart))
+            write_excel_export(spool, **options, **export_source())
+        except ValueError as e:
+            spool.close()
+            return JsonResponse({"error": str(e)}, status=500)
+        spool.seek(0)
+
+        # FileResponse sends the file in blocks and closes (and so deletes) it afterwards
+        return FileResponse(
+            spool,
+            as_attachment=True,
+            filename="data.xlsx",
+            content_type=XLSX_CONTENT_TYPE,
+        )
 
-        # Create the HTTP response with the appropriate content type and headers
-        response = HttpResponse(buffer.getvalue(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="data.xlsx"'
 
-        return response
+class PdfExportView(View):
+    def get(self, request, *args, **kwargs):
+        """
+        Export the live records (without soft-deleted rows and columns) as a paginated PDF.
+        With ?background=true the export runs as a job and a job ID is returned instead.
+        http://localhost:8000/api/export/pdf/
+        """
+        if wants_background(request):
+            return queue_export("export_pdf")
 
-    # def get(self, request, *args, **kwargs):
-    #     # 1. Fetch data from the MongoDB collection
-    #     mongo_data = list(table_data.find({}, {"_id": 0}))  # Query without '_id' field
+        # Pages are written to a temporary file one at a time as they are finished
+        spool = tempfile.TemporaryFile()
+        try:
+            write_pdf_export(spool, **export_source())
+        except ValueError as e:
+            spool.close()
+            return JsonResponse({"error": str(e)}, status=500)
+        spool.seek(0)
+
+        return FileResponse(
+            spool,
+            as_attachment=True,
+            filename="table_data.pdf",
+            content_type="application/pdf",
+        )
 
-    #     # 2. Convert the data to a DataFrame
-    #     df = pd.DataFrame(mongo_data)
-
-    #     # 3. Save the DataFrame to a BytesIO object (Excel file in memory)
-    #     buffer = BytesIO()
-    #     with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-    #         df.to_excel(writer, index=False, sheet_name="Sheet1")
-    #     buffer.seek(0)
-
-    #     # 4. Load the workbook to embed the chart
-    #     workbook = load_workbook(buffer)
-    #     worksheet = workbook.active
-
-    #     # 5. Generate the chart using Matplotlib
-    #     chart_img_data = generate_chart(df)
-
-    #     # 6. Embed the chart image into the Excel file
-    #     img = Image(chart_img_data)
-    #     img.anchor = "E5"  # Position the chart at cell E5 (adjust as needed)
-    #     worksheet.add_image(img)
-
-    #     # 7. Save the workbook to the buffer
-    #     buffer = BytesIO()
-    #     workbook.save(buffer)
-    #     buffer.seek(0)
-
-    #     # 8. Create the HTTP response with the appropriate content type and headers
-    #     response = HttpResponse(
-    #         buffer.getvalue(),
-    #         content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    #     )
-    #     response["Content-Disposition"] = 'attachment; filename="data_with_chart.xlsx"'
-
-    #     return response
-
-
-# def get(self, request, *args, **kwargs):
-#     # Fetch data from the MongoDB collection
-#     mongo_data = list(table_data.find({}, {'_id': 0}))  # Query without '_id' field
-
-#     # Convert the data to a DataFrame
-#     df = pd.DataFrame(mongo_data)
-
-#     # Save the DataFrame to a BytesIO object
-#     buffer = BytesIO()
-#     with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-#         df.to_excel(writer, index=False, sheet_name='Sheet1')
-
-#         # Access the openpyxl workbook and worksheet
-#         workbook = writer.book
-#         worksheet = writer.sheets['Sheet1']
-
-#         # Create a clustered column chart
-#         chart = BarChart()
-#         chart.type = "col"
-#         chart.style = 10
-#         chart.grouping = "clustered"
-#         chart.title = "Clustered Column Chart Example"
-#         chart.y_axis.title = 'Values'
-#         chart.x_axis.title = 'Categories'
-
-#         # Set x-axis categories (from the first column, usually categorical data)
-#         categories = Reference(worksheet, min_col=1, min_row=2, max_row=len(df) + 1)
-
-#         # Add each numeric column as a separate series in the chart
-#         for idx in range(2, len(df.columns) + 1):
-#             values = Reference(worksheet, min_col=idx, min_row=2, max_row=len(df) + 1)
-#             series = Series(values, title_from_data=True)
-#             chart.append(series)
-
-#         # Set categories (X-axis)
-#         chart.set_categories(categories)
-
-#         # Position the chart on the worksheet
-#         worksheet.add_chart(chart, "E5")
-
-#     buffer.seek(0)
-
-#     # Create the HTTP response with the appropriate content type and headers
-#     response = HttpResponse(buffer.getvalue(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-#     response['Content-Disposition'] = 'attachment; filename="data_with_clustered_chart.xlsx"'
-
-#     return response
-# def get(self, request, *args, **kwargs):
-#     # Example data; replace with your MongoDB query result
-#     data = list(table_data.find({}, {'_id': 0}))  # Query without '_id' field
-
-#     df = pd.DataFrame(data)
-
-#     # Create an Excel workbook and add a worksheet
-#     workbook = Workbook()
-#     worksheet = workbook.active
-#     worksheet.title = "Sheet1"
-
-#     # Write DataFrame data to Excel
-#     for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=True), 1):
-#         for c_idx, value in enumerate(row, 1):
-#             worksheet.cell(row=r_idx, column=c_idx, value=value)
-
-#     # Create a clustered column chart
-#     chart = BarChart()
-#     chart.type = "col"
-#     chart.grouping = "clustered"
-#     chart.title = "Custom Clustered Column Chart"
-#     chart.y_axis.title = 'Values'
-#     chart.x_axis.title = 'MDMID'
-
-#     # Manually define series for each column with specific formulas
-#     series_formulas = [
-#         f'=SERIES("Sum of EODBalance-14Aug",{{"MDMID18","MDMID14"}},{{149524.939708448,4738966.82449053}},1)',
-#         f'=SERIES("Sum of EODBalance-15Aug",{{"MDMID18","MDMID14"}},{{145729.058052051,4737172.30504085}},2)',
-#         f'=SERIES("Sum of EODBalance-17Aug",{{"MDMID18","MDMID14"}},{{143209.597556718,4741859.08356868}},3)',
-#         f'=SERIES("Sum of EODBalance-18Aug",{{"MDMID18","MDMID14"}},{{142582.036089139,4738420.27698655}},4)',
-#         f'=SERIES("Sum of EODBalance-16Aug",{{"MDMID18","MDMID14"}},{{145729.058052051,4737172.30504085}},5)',
-#         f'=SERIES("Sum of 5-Day average",{{"MDMID18","MDMID14"}},{{145354.937891681,4738718.15902549}},6)',
-#         f'=SERIES("Sum of Projected Balance",{{"MDMID18","MDMID14"}},{{116888,5727800}},7)',
-#     ]
-
-#     for formula in series_formulas:
-#         series = Series(values=Reference(worksheet, min_col=2, min_row=2, max_row=len(df) + 1))
-#         series.formula = formula
-#         chart.series.append(series)
-
-#     # Add the chart to the worksheet
-#     worksheet.add_chart(chart, "E5")
-
-#     # Save the workbook to a BytesIO object
-#     buffer = BytesIO()
-#     workbook.save(buffer)
-#     buffer.seek(0)
-
-#     # Create the HTTP response with the appropriate content type and headers
-#     response = HttpResponse(buffer.getvalue(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-#     response['Content-Disposition'] = 'attachment; filename="custom_data_with_chart.xlsx"'
-
-#     return response
+class DatasetListView(APIView):
+    def get(self, request, *args, **kwargs):
+        """
+        List the datasets with their data version, row count and sizes in bytes.
+        Every other endpoint takes ?dataset=<id> to work on one of them.
+        http://localhost:8000/api/datasets/
+        """
+        try:
+            catalog = list_datasets()
+        except ValueError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response({"datasets": catalog}, status=status.HTTP_200_OK)
 
 
-class PdfExportView(View):
+class HealthView(APIView):
     def get(self, request, *args, **kwargs):
-        # Fetch records from MongoDB
-        records = fetch_all_records()
-
-        # Convert records to DataFrame
-        df = pd.DataFrame(records)
+        """
+        Check MongoDB connectivity and report this process's connection pool usage.
+        http://localhost:8000/api/health/
+        """
+        try:
+            health = mongo_health()
+        except ValueError as e:
+            return Response(
+                {"status": "unavailable", "error": str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        return Response(health, status=status.HTTP_200_OK)
 
-        # Drop the '_id' column if it exists
-        if "_id" in df.columns:
-            df = df.drop(columns=["_id"])
 
-        # Convert DataFrame to a list of lists (rows)
-        table_data = [df.columns.tolist()] + df.values.tolist()
+def find_job(job_id):
+    try:
+        return jobs.find_one({"_id": ObjectId(job_id)})
+    except Exception:
+        return None
 
-        # Estimate the width of each column
-        col_widths = [
-            max([len(str(item)) for item in col]) * 0.1 * inch
-            for col in zip(*table_data)
-        ]
 
-        # Calculate the total width of the table
-        total_width = sum(col_widths)
-
-        # Set page size dynamically based on the table width
-        page_width = total_width + 2 * inch  # Add some padding
-        page_size = (
-            page_width,
-            11 * inch,
-        )  # Keep height standard (11 inches for A4 height)
-
-        # Create a BytesIO buffer for the PDF
-        pdf_buffer = BytesIO()
-
-        # Create the PDF document and canvas
-        doc = SimpleDocTemplate(pdf_buffer, pagesize=page_size)
-        elements = []
-
-        # Create a Table object from the data with calculated column widths
-        table = Table(table_data, colWidths=col_widths)
-
-        # Apply some table styling
-        style = TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("FONTSIZE", (0, 0), (-1, 0), 12),
-                ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-                ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
-                ("GRID", (0, 0), (-1, -1), 1, colors.black),
-            ]
-        )
-        table.setStyle(style)
+class JobStatusView(APIView):
+    def get(self, request, job_id, *args, **kwargs):
+        """
+        Report the status and progress (rows, bytes, ETA) of an upload or export job.
+        http://localhost:8000/api/jobs/66c1f0a2e4b0c2a1d3f4e5a6/
+        """
+        job = find_job(job_id)
+        if not job:
+            return Response(
+                {"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(describe_job(job), status=status.HTTP_200_OK)
 
-        # Add the table to the document elements
-        elements.append(table)
 
-        # Build the PDF document
-        doc.build(elements)
+class JobDownloadView(View):
+    def get(self, request, job_id, *args, **kwargs):
+        """
+        Download the file produced by a finished export job.
+        http://localhost:8000/api/jobs/66c1f0a2e4b0c2a1d3f4e5a6/download/
+        """
+        job = find_job(job_id)
+        if not job or not job.get("artifact_path"):
+            return JsonResponse({"error": "No export file for this job"}, status=404)
+        try:
+            artifact = open(job["artifact_path"], "rb")
+        except OSError:
+            return JsonResponse({"error": "Export file has expired"}, status=410)
+        return FileResponse(
+            artifact,
+            as_attachment=True,
+            filename=job["file_name"],
+            content_type=job["content_type"],
+        )
 
-        # Get PDF data from the buffer
-        pdf = pdf_buffer.getvalue()
-        pdf_buffer.close()
 
-        # Create an HTTP response with the PDF content
-        response = HttpResponse(pdf, content_type="application/pdf")
-        response["Content-Disposition"] = 'attachment; filename="table_data.pdf"'
+def bulk_update_columns(column_names, update):
+    """
+    Apply `update` to the deleted_columns entries of `column_names`, log the
+    change and return the totals with per-column matched/modified results.
+    """
+    totals, results = bulk_update_by_key(
+        deleted_columns, "column_name", column_names, update
+    )
+    return column_update_summary(totals, results)
+
+
+def column_update_summary(totals, results):
+    bump_schema_version()
+    log_change(
+        "schema",
+        columns=[
+            {"op": "flags", "column": name} for name, matched, _ in results if matched
+        ],
+    )
+    return {
+        "matched_count": totals["matched_count"],
+        "modified_count": totals["modified_count"],
+        "results": [
+            {"column_name": name, "matched": matched, "modified": modified}
+            for name, matched, modified in results
+        ],
+    }
+
+
+def bulk_update_records(record_ids, update):
+    """
+    Apply `update` to the records with `record_ids`, log the change and
+    return the totals with per-record matched/modified results.
+    """
+    object_ids = [ObjectId(record_id) for record_id in record_ids]
+    totals, results = bulk_update_by_key(table_data, "_id", object_ids, update)
+    return record_update_summary(totals, results)
+
+
+def record_update_summary(totals, results):
+    log_change(
+        "records",
+        record_ids=[object_id for object_id, matched, _ in results if matched],
+    )
+    return {
+        "matched_count": totals["matched_count"],
+        "modified_count": totals["modified_count"],
+        "results": [
+            {"record_id": str(object_id), "matched": matched, "modified": modified}
+            for object_id, matched, modified in results
+        ],
+    }
 
-        return response
 
 class ColDeletionApprovedView(APIView):
     def post(self, request, *args, **kwargs):
@@ -600,30 +972,21 @@ class ColDeletionApprovedView(APIView):
             )
 
         try:
-            update_results = []
-            for column_name in column_names:
-                # Update operation
-                filter_query = {"column_name": column_name}
-                update_operation = {"$set": {"deleted_by_admin": True}}
-                result = deleted_columns.update_one(filter_query, update_operation)
-
-                update_results.append({
-                    "column_name": column_name,
-                    "matched_count": result.matched_count,
-                    "modified_count": result.modified_count
-                })
-
-            matched_count = sum(res["matched_count"] for res in update_results)
-            modified_count = sum(res["modified_count"] for res in update_results)
-
-            if matched_count == 0:
+            summary = bulk_update_columns(
+                column_names, {"$set": {"deleted_by_admin": True}}
+            )
+
+            if summary["matched_count"] == 0:
                 return Response(
                     {"error": "No matching columns found"}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
 
             return Response(
-                {"message": f"{matched_count} column(s) marked as deleted successfully"},
+                {
+                    "message": f"{summary['matched_count']} column(s) marked as deleted successfully",
+                    **summary,
+                },
                 status=status.HTTP_200_OK,
             )
 
@@ -647,30 +1010,22 @@ class ColDeletionRejectedView(APIView):
             )
 
         try:
-            update_results = []
-            for column_name in column_names:
-                # Update operation
-                filter_query = {"column_name": column_name}
-                update_operation = {"$unset": {"is_deleted": ""},"$set": {"deleted_by_admin": False}}
-                result = deleted_columns.update_one(filter_query, update_operation)
-
-                update_results.append({
-                    "column_name": column_name,
-                    "matched_count": result.matched_count,
-                    "modified_count": result.modified_count
-                })
-
-            matched_count = sum(res["matched_count"] for res in update_results)
-            modified_count = sum(res["modified_count"] for res in update_results)
-
-            if matched_count == 0:
+            summary = bulk_update_columns(
+                column_names,
+                {"$unset": {"is_deleted": ""}, "$set": {"deleted_by_admin": False}},
+            )
+
+            if summary["matched_count"] == 0:
                 return Response(
                     {"error": "No matching columns found"}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
 
             return Response(
-                {"message": f"{matched_count} column(s) updated successfully"},
+                {
+                    "message": f"{summary['matched_count']} column(s) updated successfully",
+                    **summary,
+                },
                 status=status.HTTP_200_OK,
             )
 
@@ -693,23 +1048,21 @@ class RecordDeletionApproved(APIView):
             )
 
         try:
-            # Convert string IDs to ObjectId
-            object_ids = [ObjectId(record_id) for record_id in record_ids]
-            filter_query = {"_id": {"$in": object_ids}}
-            update_operation = {"$set": {"deleted_by_admin": True}}
-            result = table_data.update_many(
-               filter_query, update_operation
+            summary = bulk_update_records(
+                record_ids, {"$set": {"deleted_by_admin": True}}
             )
-            print(f"Matched {result.matched_count} documents and modified {result.modified_count} documents.")
 
-            if result.matched_count == 0:
+            if summary["matched_count"] == 0:
                 return Response(
                     {"error": "No matching records found"}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
 
             return Response(
-                {"message": f"{result.matched_count} record(s) marked as deleted by admin successfully"},
+                {
+                    "message": f"{summary['matched_count']} record(s) marked as deleted by admin successfully",
+                    **summary,
+                },
                 status=status.HTTP_200_OK,
             )
 
@@ -734,24 +1087,22 @@ class RecordDeletionDisapproved(APIView):
             )
 
         try:
-            # Convert string IDs to ObjectId
-            object_ids = [ObjectId(record_id) for record_id in record_ids]
-
-            # Update operation to unset 'is_deleted' field
-            filter_query = {"_id": {"$in": object_ids}}
-            update_operation = {"$unset": {"is_deleted": ""},"$set": {"deleted_by_admin": False}}
-            result = table_data.update_many(
-                filter_query, update_operation
+            summary = bulk_update_records(
+                record_ids,
+                {"$unset": {"is_deleted": ""}, "$set": {"deleted_by_admin": False}},
             )
 
-            if result.matched_count == 0:
+            if summary["matched_count"] == 0:
                 return Response(
                     {"error": "No matching records found"}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
 
             return Response(
-                {"message": f"{result.matched_count} record(s) updated successfully"},
+                {
+                    "message": f"{summary['matched_count']} record(s) updated successfully",
+                    **summary,
+                },
                 status=status.HTTP_200_OK,
             )
 